@@ -2,7 +2,7 @@ import sys
 
 try:
     import mpd
-except ImportError, e:
+except ImportError as e:
     print("")
     print("+-----------------------------------------------------------------+")
     print("| Unsatisfied Python requirement: %s." % e)
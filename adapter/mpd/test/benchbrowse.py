@@ -0,0 +1,115 @@
+# =============================================================================
+#
+#    Remuco - A remote control system for media players.
+#    Copyright (C) 2006-2010 by the Remuco team, see AUTHORS.
+#
+#    This file is part of Remuco.
+#
+#    Remuco is free software: you can redistribute it and/or modify
+#    it under the terms of the GNU General Public License as published by
+#    the Free Software Foundation, either version 3 of the License, or
+#    (at your option) any later version.
+#
+#    Remuco is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#    GNU General Public License for more details.
+#
+#    You should have received a copy of the GNU General Public License
+#    along with Remuco.  If not, see <http://www.gnu.org/licenses/>.
+#
+# =============================================================================
+
+"""Benchmark listing a directory of MPD's music database.
+
+Compares the way the MPD adapter used to list a directory ('lsinfo' followed
+by a command list with a 'listallinfo' per file to get the files' tags) with
+using the tags contained in the 'lsinfo' response directly. The directory
+should contain many files (e.g. 5000) to get meaningful numbers.
+
+Usage: python benchbrowse.py [HOST [PORT [DIRECTORY [ROUNDS]]]]
+
+Without a host, the benchmark runs against a fake MPD server (see fakempd.py)
+with a directory of 5000 files.
+
+"""
+
+from __future__ import print_function
+
+import sys
+import time
+
+import mpd
+
+from fakempd import FakeMPD, Library
+
+def _name(song):
+
+    return "%s - %s" % (song.get("artist", "??"), song.get("title", "??"))
+
+def browse_batched(client, path):
+    """List a directory the old way (lsinfo plus listallinfo per file)."""
+
+    files = [e["file"] for e in client.lsinfo(path) if "file" in e]
+
+    client.command_list_ok_begin()
+    for file in files:
+        client.listallinfo(file)
+    songs = client.command_list_end()
+
+    return files, [_name(song[0]) for song in songs]
+
+def browse_lsinfo(client, path):
+    """List a directory using the tags in the lsinfo response."""
+
+    files, names = [], []
+    for entry in client.lsinfo(path):
+        if "file" in entry:
+            files.append(entry["file"])
+            names.append(_name(entry))
+
+    return files, names
+
+def run(host, port, path, rounds):
+    """Run the benchmark and return the average seconds per listing for
+    both variants."""
+
+    client = mpd.MPDClient()
+    client.connect(host, port)
+
+    results = []
+    try:
+        for fn in (browse_batched, browse_lsinfo):
+            fn(client, path) # warm up
+            t0 = time.time()
+            for i in range(rounds):
+                files, names = fn(client, path)
+            results.append(((time.time() - t0) / rounds, len(files)))
+    finally:
+        client.disconnect()
+
+    return results
+
+if __name__ == '__main__':
+
+    server = None
+
+    if len(sys.argv) > 1:
+        host = sys.argv[1]
+        port = len(sys.argv) > 2 and int(sys.argv[2]) or 6600
+        path = len(sys.argv) > 3 and sys.argv[3] or ""
+        rounds = len(sys.argv) > 4 and int(sys.argv[4]) or 5
+    else:
+        server = FakeMPD(Library(5000, album_size=5000)).start()
+        host, port = "127.0.0.1", server.port
+        path, rounds = "Artist 0/Album 0", 5
+
+    try:
+        (batched, num), (lsinfo, num) = run(host, port, path, rounds)
+    finally:
+        if server is not None:
+            server.stop()
+
+    print("directory '%s' with %d files (%d rounds):" % (path, num, rounds))
+    print("  lsinfo + listallinfo: %8.1f ms" % (batched * 1000))
+    print("  lsinfo only:          %8.1f ms" % (lsinfo * 1000))
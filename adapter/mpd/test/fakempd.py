@@ -0,0 +1,806 @@
+# =============================================================================
+#
+#    Remuco - A remote control system for media players.
+#    Copyright (C) 2006-2010 by the Remuco team, see AUTHORS.
+#
+#    This file is part of Remuco.
+#
+#    Remuco is free software: you can redistribute it and/or modify
+#    it under the terms of the GNU General Public License as published by
+#    the Free Software Foundation, either version 3 of the License, or
+#    (at your option) any later version.
+#
+#    Remuco is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#    GNU General Public License for more details.
+#
+#    You should have received a copy of the GNU General Public License
+#    along with Remuco.  If not, see <http://www.gnu.org/licenses/>.
+#
+# =============================================================================
+
+"""Fake MPD server to test and benchmark the MPD adapter without a real MPD.
+
+The server speaks enough of MPD's text protocol for the MPD adapter: player
+status and control, the queue (including 'plchanges' and 'plchangesposid'),
+stored playlists, browsing and searching the database, 'idle', command lists
+and binary responses ('albumart', 'readpicture').
+
+The database is a synthetic library of configurable size. Songs are grouped
+in albums (one directory per album) and albums in artists (one directory per
+artist). Latency may be injected per command (or per command list).
+
+The server runs in background threads of the calling process and works with
+Python 2 and 3:
+
+    server = FakeMPD(Library(5000)).start()
+    # connect to 127.0.0.1:server.port
+    server.stop()
+
+Run this module to serve a library at a fixed port:
+
+    python fakempd.py [PORT [SONGS [LATENCY_MS]]]
+
+"""
+
+from __future__ import print_function
+
+import re
+import select
+import socket
+import sys
+import threading
+import time
+
+PROTOCOL_VERSION = "0.23.0"
+
+ACK_ARG = 2
+ACK_PASSWORD = 3
+ACK_UNKNOWN = 5
+ACK_NO_EXIST = 50
+
+_GENRES = ("Rock", "Jazz", "Classical", "Electronic", "Folk")
+
+_POLL_IVAL = 0.05 # seconds between checks for changes while idle
+
+_TOKEN = re.compile(r'"((?:[^"\\]|\\.)*)"|(\S+)')
+
+# =============================================================================
+# library
+# =============================================================================
+
+class Library(object):
+    """Synthetic music database.
+
+    Songs are at 'Artist A/Album B/NNN Title I.mp3'. Stored playlists may
+    be added to 'playlists' (name -> list of song indices).
+
+    """
+    def __init__(self, size=1000, album_size=10, albums_per_artist=5,
+                 art_size=0):
+        """Create a library.
+
+        @param size: number of songs
+        @param album_size: number of songs per album (directory)
+        @param albums_per_artist: number of albums per artist
+        @param art_size: size of each album's cover in bytes (0 means there
+            are no covers), covers are arbitrary data, not images
+
+        """
+        self.songs = [] # list of (file, tags as list of (key, value))
+        self.index = {} # file -> song index
+        self.dirs = {"": ([], [])} # path -> (sub directories, song indices)
+        self.playlists = {}
+        self.art_size = art_size
+
+        for i in range(size):
+
+            album = i // album_size
+            artist = album // albums_per_artist
+            track = i % album_size + 1
+
+            artist_dir = "Artist %d" % artist
+            album_dir = "%s/Album %d" % (artist_dir, album)
+            file = "%s/%03d Title %d.mp3" % (album_dir, track, i)
+
+            tags = [("Time", str(120 + i % 240)),
+                    ("Artist", "Artist %d" % artist),
+                    ("Album", "Album %d" % album),
+                    ("Title", "Title %d" % i),
+                    ("Track", str(track)),
+                    ("Disc", "1"),
+                    ("Genre", _GENRES[artist % len(_GENRES)]),
+                    ("Date", str(1960 + album % 60))]
+
+            self.index[file] = i
+            self.songs.append((file, tags))
+
+            if artist_dir not in self.dirs:
+                self.dirs[artist_dir] = ([], [])
+                self.dirs[""][0].append(artist_dir)
+            if album_dir not in self.dirs:
+                self.dirs[album_dir] = ([], [])
+                self.dirs[artist_dir][0].append(album_dir)
+            self.dirs[album_dir][1].append(i)
+
+    def tag(self, i, key):
+        """Get a tag of a song (key is case insensitive)."""
+
+        file, tags = self.songs[i]
+        key = key.lower()
+        if key == "file":
+            return file
+        for k, v in tags:
+            if k.lower() == key:
+                return v
+        return None
+
+    def walk(self, path):
+        """Get the indices of all songs in and below a directory."""
+
+        dirs, songs = self.dirs[path]
+        result = list(songs)
+        for sub in dirs:
+            result.extend(self.walk(sub))
+        return result
+
+    def art(self, file):
+        """Get the cover of a song's album (None if there is none)."""
+
+        if not self.art_size:
+            return None
+
+        album = file.rsplit("/", 1)[0]
+        seed = bytearray(album.encode("utf-8"))
+        data = (seed * (self.art_size // len(seed) + 1))[:self.art_size]
+        return bytes(data)
+
+# =============================================================================
+# protocol helpers
+# =============================================================================
+
+class Ack(Exception):
+    """An MPD error response."""
+
+    def __init__(self, code, msg):
+
+        Exception.__init__(self, msg)
+        self.code = code
+        self.msg = msg
+
+    def response(self, index, cmd):
+
+        return ("ACK [%d@%d] {%s} %s\n" %
+                (self.code, index, cmd, self.msg)).encode("utf-8")
+
+def _split(line):
+    """Split a command line into the command and its (unquoted) arguments."""
+
+    args = []
+    for quoted, plain in _TOKEN.findall(line):
+        if plain:
+            args.append(plain)
+        else:
+            args.append(re.sub(r'\\(.)', r'\1', quoted))
+    return args[0], args[1:]
+
+def _encode(pairs):
+
+    lines = ["%s: %s\n" % (k, v) for k, v in pairs]
+    return "".join(lines).encode("utf-8")
+
+def _int(value):
+
+    try:
+        return int(value)
+    except ValueError:
+        raise Ack(ACK_ARG, "Integer expected: %s" % value)
+
+def _binary(data, offset, limit, extra=()):
+    """Build a binary response for a chunk of data starting at offset."""
+
+    chunk = data[offset:offset + limit]
+    head = _encode([("size", len(data))] + list(extra) +
+                   [("binary", len(chunk))])
+    return head + chunk + b"\n"
+
+# =============================================================================
+# connection
+# =============================================================================
+
+class _Connection(object):
+    """A client connection, handled in its own thread."""
+
+    def __init__(self, server, sock):
+
+        self.server = server
+        self.sock = sock
+        self.buf = b""
+        self.changes = set() # subsystems changed since the last idle
+        self.binary_limit = 8192
+
+    def run(self):
+
+        try:
+            self.send(("OK MPD %s\n" % PROTOCOL_VERSION).encode("utf-8"))
+            while self.serve():
+                pass
+        except (socket.error, IOError):
+            pass
+        finally:
+            self.server.remove_connection(self)
+            try:
+                self.sock.close()
+            except socket.error:
+                pass
+
+    def send(self, data):
+
+        self.sock.sendall(data)
+
+    def readline(self):
+        """Read a line (None if the connection is closed)."""
+
+        while b"\n" not in self.buf:
+            data = self.sock.recv(4096)
+            if not data:
+                return None
+            self.buf += data
+        line, self.buf = self.buf.split(b"\n", 1)
+        return line.decode("utf-8")
+
+    def serve(self):
+        """Handle the next command (or command list).
+
+        @return: False if the connection should be closed
+
+        """
+        line = self.readline()
+        if line is None or line == "close":
+            return False
+
+        if line in ("command_list_begin", "command_list_ok_begin"):
+            list_ok = line == "command_list_ok_begin"
+            lines = []
+            while True:
+                line = self.readline()
+                if line is None:
+                    return False
+                if line == "command_list_end":
+                    break
+                lines.append(line)
+            self.server.delay()
+            out = []
+            for i, line in enumerate(lines):
+                try:
+                    out.append(self.server.execute(self, line))
+                except Ack as e:
+                    out.append(e.response(i, _split(line)[0]))
+                    break
+                if list_ok:
+                    out.append(b"list_OK\n")
+            else:
+                out.append(b"OK\n")
+            self.send(b"".join(out))
+            return True
+
+        if not line.strip():
+            self.send(Ack(ACK_UNKNOWN, "No command given").response(0, ""))
+            return True
+
+        cmd, args = _split(line)
+
+        if cmd == "idle":
+            return self.idle(args)
+
+        self.server.delay()
+        try:
+            self.send(self.server.execute(self, line) + b"OK\n")
+        except Ack as e:
+            self.send(e.response(0, cmd))
+
+        return True
+
+    def idle(self, subsystems):
+        """Wait for changes of subsystems or a 'noidle'."""
+
+        while True:
+
+            if self.__changes(subsystems, False):
+                return True
+
+            if b"\n" in self.buf or \
+                    select.select([self.sock], [], [], _POLL_IVAL)[0]:
+                line = self.readline()
+                if line is None:
+                    return False
+                if line != "noidle":
+                    self.send(Ack(ACK_ARG, "Only 'noidle' allowed while "
+                                  "idle").response(0, line))
+                    return False
+                self.__changes(subsystems, True)
+                return True
+
+    def __changes(self, subsystems, always):
+        """Send changes of subsystems if there are some (or always).
+
+        @return: True if a response has been sent
+
+        """
+        with self.server.lock:
+            changed = [s for s in sorted(self.changes)
+                       if not subsystems or s in subsystems]
+            if not changed and not always:
+                return False
+            self.changes.difference_update(changed)
+            self.send(_encode([("changed", s) for s in changed]) + b"OK\n")
+            return True
+
+# =============================================================================
+# server
+# =============================================================================
+
+class FakeMPD(object):
+    """Fake MPD server."""
+
+    def __init__(self, library=None, latency=0.0, port=0, password=None):
+        """Create a server.
+
+        @param library: the database to serve (default: Library())
+        @param latency: seconds to wait before answering a command or
+            command list (may be changed any time)
+        @param port: port to listen on (0 means any free port, see 'port'
+            once started)
+        @param password: password clients must send (None means none)
+
+        """
+        self.library = library or Library()
+        self.latency = latency
+        self.port = port
+        self.password = password
+
+        self.lock = threading.RLock()
+        self.commands = 0 # number of executed commands
+
+        self.queue = [] # list of [song index, song ID, version]
+        self.version = 1
+        self.next_id = 1
+        self.state = "stop"
+        self.current = -1
+        self.elapsed = 0
+        self.volume = 50
+        self.repeat = 0
+        self.random = 0
+
+        self.__sock = None
+        self.__conns = []
+
+    # === setup ===
+
+    def start(self):
+        """Start listening on the loopback interface.
+
+        @return: the server itself
+
+        """
+        self.__sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        self.__sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        self.__sock.bind(("127.0.0.1", self.port))
+        self.__sock.listen(16)
+        self.port = self.__sock.getsockname()[1]
+
+        thread = threading.Thread(target=self.__accept, name="fake MPD")
+        thread.daemon = True
+        thread.start()
+
+        return self
+
+    def stop(self):
+        """Stop listening and close all connections."""
+
+        sock, self.__sock = self.__sock, None
+        if sock is not None:
+            try:
+                sock.shutdown(socket.SHUT_RDWR)
+            except socket.error:
+                pass
+            sock.close()
+
+        self.drop_connections()
+
+    def drop_connections(self):
+        """Close all client connections (e.g. to test reconnecting)."""
+
+        with self.lock:
+            conns = list(self.__conns)
+        for conn in conns:
+            try:
+                conn.sock.shutdown(socket.SHUT_RDWR)
+            except socket.error:
+                pass
+
+    def __accept(self):
+
+        while self.__sock is not None:
+            try:
+                sock, addr = self.__sock.accept()
+            except (socket.error, AttributeError):
+                break
+            conn = _Connection(self, sock)
+            with self.lock:
+                self.__conns.append(conn)
+            thread = threading.Thread(target=conn.run,
+                                      name="fake MPD connection")
+            thread.daemon = True
+            thread.start()
+
+    def remove_connection(self, conn):
+
+        with self.lock:
+            if conn in self.__conns:
+                self.__conns.remove(conn)
+
+    # === state changes ===
+
+    def changed(self, *subsystems):
+        """Notify idle clients about changes of subsystems."""
+
+        with self.lock:
+            for conn in self.__conns:
+                conn.changes.update(subsystems)
+
+    def update_database(self):
+        """Simulate a database update."""
+
+        self.changed("update", "database")
+
+    def queue_changed(self, start):
+        """Bump the queue version for all positions from start on."""
+
+        with self.lock:
+            self.version += 1
+            for entry in self.queue[start:]:
+                entry[2] = self.version
+            if self.current >= len(self.queue):
+                self.current = -1
+                self.state = "stop"
+            self.changed("playlist")
+
+    def enqueue(self, songs, pos=None):
+        """Add songs (indices) to the queue."""
+
+        with self.lock:
+            if pos is None:
+                pos = len(self.queue)
+            entries = []
+            for i in songs:
+                entries.append([i, self.next_id, 0])
+                self.next_id += 1
+            self.queue[pos:pos] = entries
+            self.queue_changed(pos)
+
+    # === command execution ===
+
+    def delay(self):
+
+        if self.latency > 0:
+            time.sleep(self.latency)
+
+    def execute(self, conn, line):
+        """Execute a command and return its response (without the final
+        'OK')."""
+
+        cmd, args = _split(line)
+
+        fn = getattr(self, "_cmd_%s" % cmd, None)
+        if fn is None:
+            raise Ack(ACK_UNKNOWN, "unknown command \"%s\"" % cmd)
+
+        with self.lock:
+            self.commands += 1
+            result = fn(conn, *args)
+
+        if result is None:
+            return b""
+        if isinstance(result, bytes):
+            return result
+        return _encode(result)
+
+    def __song(self, i):
+
+        file, tags = self.library.songs[i]
+        return [("file", file)] + tags
+
+    def __entry(self, pos):
+
+        i, songid, version = self.queue[pos]
+        return self.__song(i) + [("Pos", pos), ("Id", songid)]
+
+    def __pos(self, value):
+
+        pos = _int(value)
+        if pos < 0 or pos >= len(self.queue):
+            raise Ack(ACK_ARG, "Bad song index")
+        return pos
+
+    def __resolve(self, uri):
+        """Get the songs (indices) of a file or directory."""
+
+        uri = uri.strip("/")
+        if uri in self.library.dirs:
+            return self.library.walk(uri)
+        if uri in self.library.index:
+            return [self.library.index[uri]]
+        raise Ack(ACK_NO_EXIST, "No such directory")
+
+    def __filter(self, args, exact):
+
+        if not args or len(args) % 2:
+            raise Ack(ACK_ARG, "incorrect arguments")
+
+        pairs = [(args[j].lower(), args[j + 1].lower())
+                 for j in range(0, len(args), 2)]
+
+        def match(i):
+            for key, value in pairs:
+                if key == "any":
+                    file, tags = self.library.songs[i]
+                    candidates = [file] + [v for k, v in tags]
+                else:
+                    candidates = [self.library.tag(i, key) or ""]
+                candidates = [c.lower() for c in candidates]
+                if exact and value not in candidates:
+                    return False
+                if not exact and not [c for c in candidates if value in c]:
+                    return False
+            return True
+
+        result = []
+        for i in range(len(self.library.songs)):
+            if match(i):
+                result.extend(self.__song(i))
+        return result
+
+    # === connection ===
+
+    def _cmd_ping(self, conn):
+        pass
+
+    def _cmd_password(self, conn, password):
+        if self.password is not None and password != self.password:
+            raise Ack(ACK_PASSWORD, "incorrect password")
+
+    def _cmd_binarylimit(self, conn, limit):
+        conn.binary_limit = max(64, _int(limit))
+
+    def _cmd_noidle(self, conn):
+        pass # outside of idle
+
+    # === status ===
+
+    def _cmd_status(self, conn):
+        status = [("volume", self.volume), ("repeat", self.repeat),
+                  ("random", self.random), ("single", 0), ("consume", 0),
+                  ("playlist", self.version),
+                  ("playlistlength", len(self.queue)),
+                  ("state", self.state)]
+        if self.current >= 0:
+            i, songid, version = self.queue[self.current]
+            duration = int(self.library.tag(i, "Time"))
+            status += [("song", self.current), ("songid", songid),
+                       ("time", "%d:%d" % (self.elapsed, duration)),
+                       ("elapsed", "%.3f" % self.elapsed),
+                       ("duration", "%.3f" % duration)]
+        return status
+
+    def _cmd_currentsong(self, conn):
+        if self.current >= 0:
+            return self.__entry(self.current)
+
+    # === playback ===
+
+    def _cmd_play(self, conn, pos=None):
+        if pos is not None:
+            self.current = self.__pos(pos)
+            self.elapsed = 0
+        elif self.current < 0 and self.queue:
+            self.current = 0
+        if self.current >= 0:
+            self.state = "play"
+        self.changed("player")
+
+    def _cmd_pause(self, conn, pause=None):
+        if self.state == "stop":
+            return
+        if pause is None:
+            pause = self.state == "play" and "1" or "0"
+        self.state = _int(pause) and "pause" or "play"
+        self.changed("player")
+
+    def _cmd_stop(self, conn):
+        self.state = "stop"
+        self.elapsed = 0
+        self.changed("player")
+
+    def _cmd_next(self, conn):
+        if self.current >= 0:
+            self.current += 1
+            self.elapsed = 0
+            if self.current >= len(self.queue):
+                self.current = -1
+                self.state = "stop"
+            self.changed("player")
+
+    def _cmd_previous(self, conn):
+        if self.current > 0:
+            self.current -= 1
+            self.elapsed = 0
+            self.changed("player")
+
+    def _cmd_seek(self, conn, pos, elapsed):
+        self.current = self.__pos(pos)
+        self.elapsed = int(float(elapsed))
+        self.changed("player")
+
+    def _cmd_setvol(self, conn, volume):
+        self.volume = min(max(_int(volume), 0), 100)
+        self.changed("mixer")
+
+    def _cmd_repeat(self, conn, value):
+        self.repeat = _int(value) and 1 or 0
+        self.changed("options")
+
+    def _cmd_random(self, conn, value):
+        self.random = _int(value) and 1 or 0
+        self.changed("options")
+
+    # === queue ===
+
+    def _cmd_playlistinfo(self, conn, pos=None):
+        if pos is not None:
+            return self.__entry(self.__pos(pos))
+        result = []
+        for pos in range(len(self.queue)):
+            result.extend(self.__entry(pos))
+        return result
+
+    def _cmd_playlistid(self, conn, songid=None):
+        result = []
+        for pos, entry in enumerate(self.queue):
+            if songid is None or entry[1] == _int(songid):
+                result.extend(self.__entry(pos))
+        if songid is not None and not result:
+            raise Ack(ACK_NO_EXIST, "No such song")
+        return result
+
+    def _cmd_plchanges(self, conn, version):
+        version = _int(version)
+        result = []
+        for pos, entry in enumerate(self.queue):
+            if entry[2] > version:
+                result.extend(self.__entry(pos))
+        return result
+
+    def _cmd_plchangesposid(self, conn, version):
+        version = _int(version)
+        result = []
+        for pos, entry in enumerate(self.queue):
+            if entry[2] > version:
+                result.extend([("cpos", pos), ("Id", entry[1])])
+        return result
+
+    def _cmd_add(self, conn, uri):
+        self.enqueue(self.__resolve(uri))
+
+    def _cmd_delete(self, conn, pos):
+        pos = self.__pos(pos)
+        del self.queue[pos]
+        if self.current > pos:
+            self.current -= 1
+        elif self.current == pos:
+            self.current = -1
+            self.state = "stop"
+            self.changed("player")
+        self.queue_changed(pos)
+
+    def _cmd_clear(self, conn):
+        self.queue = []
+        self.current = -1
+        self.state = "stop"
+        self.queue_changed(0)
+        self.changed("player")
+
+    def _cmd_load(self, conn, name):
+        if name not in self.library.playlists:
+            raise Ack(ACK_NO_EXIST, "No such playlist")
+        self.enqueue(self.library.playlists[name])
+
+    # === stored playlists ===
+
+    def _cmd_listplaylists(self, conn):
+        return [("playlist", name) for name in sorted(self.library.playlists)]
+
+    def _cmd_listplaylistinfo(self, conn, name):
+        if name not in self.library.playlists:
+            raise Ack(ACK_NO_EXIST, "No such playlist")
+        result = []
+        for i in self.library.playlists[name]:
+            result.extend(self.__song(i))
+        return result
+
+    # === database ===
+
+    def _cmd_lsinfo(self, conn, uri=""):
+        uri = uri.strip("/")
+        if uri in self.library.index:
+            return self.__song(self.library.index[uri])
+        if uri not in self.library.dirs:
+            raise Ack(ACK_NO_EXIST, "No such directory")
+        dirs, songs = self.library.dirs[uri]
+        result = [("directory", d) for d in dirs]
+        for i in songs:
+            result.extend(self.__song(i))
+        if not uri:
+            result += [("playlist", name)
+                       for name in sorted(self.library.playlists)]
+        return result
+
+    def _cmd_listallinfo(self, conn, uri=""):
+        uri = uri.strip("/")
+        if uri in self.library.index:
+            return self.__song(self.library.index[uri])
+        if uri not in self.library.dirs:
+            raise Ack(ACK_NO_EXIST, "No such directory")
+        result = []
+        dirs, songs = self.library.dirs[uri]
+        for i in songs:
+            result.extend(self.__song(i))
+        for d in dirs:
+            result.append(("directory", d))
+            result.extend(self._cmd_listallinfo(conn, d))
+        return result
+
+    def _cmd_search(self, conn, *args):
+        return self.__filter(args, False)
+
+    def _cmd_find(self, conn, *args):
+        return self.__filter(args, True)
+
+    def _cmd_update(self, conn, uri=None):
+        self.update_database()
+        return [("updating_db", 1)]
+
+    # === cover art ===
+
+    def _cmd_albumart(self, conn, uri, offset):
+        data = self.library.art(uri)
+        if uri.strip("/") not in self.library.index or data is None:
+            raise Ack(ACK_NO_EXIST, "No file exists")
+        return _binary(data, _int(offset), conn.binary_limit)
+
+    def _cmd_readpicture(self, conn, uri, offset):
+        if uri.strip("/") not in self.library.index:
+            raise Ack(ACK_NO_EXIST, "No file exists")
+        return None # songs have no embedded pictures
+
+# =============================================================================
+# main
+# =============================================================================
+
+if __name__ == '__main__':
+
+    port = len(sys.argv) > 1 and int(sys.argv[1]) or 6600
+    size = len(sys.argv) > 2 and int(sys.argv[2]) or 1000
+    latency = len(sys.argv) > 3 and float(sys.argv[3]) / 1000 or 0.0
+
+    server = FakeMPD(Library(size), latency=latency, port=port).start()
+    server.enqueue(range(min(size, 100)))
+
+    print("fake MPD with %d songs at 127.0.0.1:%d" % (size, server.port))
+
+    try:
+        while True:
+            time.sleep(1)
+    except KeyboardInterrupt:
+        server.stop()
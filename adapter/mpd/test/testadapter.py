@@ -0,0 +1,202 @@
+# =============================================================================
+#
+#    Remuco - A remote control system for media players.
+#    Copyright (C) 2006-2010 by the Remuco team, see AUTHORS.
+#
+#    This file is part of Remuco.
+#
+#    Remuco is free software: you can redistribute it and/or modify
+#    it under the terms of the GNU General Public License as published by
+#    the Free Software Foundation, either version 3 of the License, or
+#    (at your option) any later version.
+#
+#    Remuco is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#    GNU General Public License for more details.
+#
+#    You should have received a copy of the GNU General Public License
+#    along with Remuco.  If not, see <http://www.gnu.org/licenses/>.
+#
+# =============================================================================
+
+"""Tests of the MPD adapter's building blocks against the fake MPD server.
+
+Requires the modules needed by the adapter (python-mpd2, PyGObject, remuco),
+otherwise all tests get skipped.
+
+"""
+
+import importlib.machinery
+import importlib.util
+import os.path
+import shutil
+import tempfile
+import threading
+import unittest
+
+from fakempd import FakeMPD, Library
+
+_SCRIPT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..",
+                       "remuco-mpd")
+
+def _load_adapter():
+    """Load the adapter script as a module (it has no .py suffix)."""
+
+    loader = importlib.machinery.SourceFileLoader("remuco_mpd", _SCRIPT)
+    spec = importlib.util.spec_from_loader(loader.name, loader)
+    module = importlib.util.module_from_spec(spec)
+    loader.exec_module(module)
+    return module
+
+try:
+    rmpd = _load_adapter()
+except ImportError as e: # missing dependencies, other errors fail loudly
+    rmpd = None
+    _REASON = "cannot load MPD adapter (%s)" % e
+
+def _files(client):
+
+    return [song["file"] for song in client.playlistinfo()]
+
+@unittest.skipIf(rmpd is None, rmpd is None and _REASON or "")
+class AdapterTest(unittest.TestCase):
+
+    def setUp(self):
+
+        library = Library(200, album_size=20, art_size=3000)
+        self.server = FakeMPD(library).start()
+        self.pool = rmpd.ConnectionPool("127.0.0.1", self.server.port, "", 2)
+
+    def tearDown(self):
+
+        self.pool.close()
+        self.server.stop()
+
+    def test_pool_reconnect(self):
+
+        self.assertEqual("stop", self.pool.run(lambda c: c.status())["state"])
+
+        self.server.drop_connections()
+
+        # broken connection gets replaced transparently
+        self.assertEqual("stop", self.pool.run(lambda c: c.status())["state"])
+
+    def test_pool_discard(self):
+
+        def discard(c):
+            self.pool.discard(c)
+            return c
+
+        first = self.pool.run(discard)
+        second = self.pool.run(lambda c: c)
+        self.assertTrue(first is not second)
+        self.assertTrue(second is self.pool.run(lambda c: c))
+
+    def test_workers_failing_job(self):
+
+        results = threading.Event()
+        calls = []
+
+        def idle_add(fn, *args):
+            calls.append((fn, args))
+            results.set()
+
+        def fail():
+            raise ValueError("failing job")
+
+        def done(result):
+            pass
+
+        idle_add_orig = rmpd.GObject.idle_add
+        rmpd.GObject.idle_add = idle_add
+        workers = rmpd.Workers(1)
+        try:
+            workers.submit(fail, done)
+            self.assertTrue(results.wait(5))
+        finally:
+            workers.stop()
+            rmpd.GObject.idle_add = idle_add_orig
+
+        # done still gets called (with None), so that replies get sent
+        self.assertEqual([(done, (None,))], calls)
+
+    def test_playlist_mirror(self):
+
+        mirror = rmpd.PlaylistMirror()
+        run = self.pool.run
+
+        self.assertFalse(mirror.synced)
+
+        run(lambda c: c.add("Artist 0"))
+        files, names = run(mirror.sync)
+        self.assertTrue(mirror.synced)
+        self.assertEqual(run(_files), files)
+        self.assertEqual("Artist 0 - Title 0", names[0])
+
+        # reading the mirror does not talk to MPD
+        commands = self.server.commands
+        self.assertEqual((files, names), mirror.get())
+        self.assertEqual(commands, self.server.commands)
+
+        # removals only need positions and IDs of changed songs
+        run(lambda c: c.delete(3))
+        self.assertFalse(mirror.dirty)
+        mirror.invalidate() # 'playlist' event
+        self.assertTrue(mirror.dirty)
+        commands = self.server.commands
+        files, names = run(mirror.sync)
+        self.assertFalse(mirror.dirty)
+        self.assertEqual(2, self.server.commands - commands)
+        self.assertEqual(run(_files), files)
+
+        run(lambda c: c.add("Artist 1/Album 5/001 Title 100.mp3"))
+        self.server.enqueue([150, 151], pos=10)
+        self.assertEqual(run(_files), run(mirror.sync)[0])
+
+        run(lambda c: c.clear())
+        run(lambda c: c.add("Artist 0/Album 1"))
+        self.assertEqual(run(_files), run(mirror.sync)[0])
+
+    def test_search_stream(self):
+
+        adapter = rmpd.MPDAdapter()
+        adapter._MPDAdapter__pool = self.pool
+        to_items = adapter._MPDAdapter__songs_to_item_list
+        stream = adapter._MPDAdapter__stream
+
+        filters = ("artist", "artist 1")
+        songs = self.pool.run(lambda c: c.search(*filters))
+        ids, names = self.pool.run(lambda c: stream(c,
+                                   lambda: to_items(c.search(*filters), True)))
+
+        self.assertTrue(len(songs) > 1)
+        self.assertEqual(len(songs), len(ids))
+        self.assertEqual(sorted(s["file"] for s in songs), sorted(ids))
+        self.assertEqual(ids, [s["file"] for s in
+                               sorted(songs, key=lambda s: (s["album"],
+                                      int(s["track"].split("/")[0])))])
+
+        # connection is usable (and not in iterate mode) afterwards
+        self.assertEqual(list, type(self.pool.run(
+                                        lambda c: c.search(*filters))))
+
+    def test_album_art(self):
+
+        cache = tempfile.mkdtemp()
+        try:
+            art = rmpd.AlbumArt(cache)
+            file = "Artist 0/Album 0/001 Title 0.mp3"
+            client_has_art = self.pool.run(lambda c: hasattr(c, "albumart"))
+            path = self.pool.run(lambda c: art.fetch(c, file))
+            if not client_has_art: # python-mpd too old
+                self.assertEqual(None, path)
+                return
+            self.assertEqual(path, art.cached("Artist 0/Album 0/x.mp3"))
+            with open(path, "rb") as fp:
+                self.assertEqual(self.server.library.art(file), fp.read())
+        finally:
+            shutil.rmtree(cache)
+
+if __name__ == '__main__':
+    unittest.main()
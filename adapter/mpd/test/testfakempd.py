@@ -0,0 +1,199 @@
+# =============================================================================
+#
+#    Remuco - A remote control system for media players.
+#    Copyright (C) 2006-2010 by the Remuco team, see AUTHORS.
+#
+#    This file is part of Remuco.
+#
+#    Remuco is free software: you can redistribute it and/or modify
+#    it under the terms of the GNU General Public License as published by
+#    the Free Software Foundation, either version 3 of the License, or
+#    (at your option) any later version.
+#
+#    Remuco is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#    GNU General Public License for more details.
+#
+#    You should have received a copy of the GNU General Public License
+#    along with Remuco.  If not, see <http://www.gnu.org/licenses/>.
+#
+# =============================================================================
+
+import socket
+import time
+import unittest
+
+from fakempd import FakeMPD, Library
+
+class _Client(object):
+    """Minimal MPD client speaking the raw protocol."""
+
+    def __init__(self, port):
+
+        self.sock = socket.create_connection(("127.0.0.1", port), 5)
+        self.buf = b""
+        self.greeting = self.line()
+
+    def line(self):
+
+        while b"\n" not in self.buf:
+            data = self.sock.recv(4096)
+            if not data:
+                raise IOError("connection closed")
+            self.buf += data
+        line, self.buf = self.buf.split(b"\n", 1)
+        return line.decode("utf-8")
+
+    def read(self, num):
+
+        while len(self.buf) < num:
+            self.buf += self.sock.recv(4096)
+        data, self.buf = self.buf[:num], self.buf[num:]
+        return data
+
+    def send(self, *lines):
+
+        self.sock.sendall(("\n".join(lines) + "\n").encode("utf-8"))
+
+    def response(self):
+        """Read a response as a list of (key, value) pairs."""
+
+        pairs = []
+        while True:
+            line = self.line()
+            if line == "OK":
+                return pairs
+            if line == "list_OK":
+                continue
+            if line.startswith("ACK"):
+                raise IOError(line)
+            key, value = line.split(": ", 1)
+            pairs.append((key, value))
+
+    def cmd(self, *lines):
+
+        self.send(*lines)
+        return self.response()
+
+    def close(self):
+
+        self.sock.close()
+
+class FakeMPDTest(unittest.TestCase):
+
+    def setUp(self):
+
+        library = Library(100, album_size=10, albums_per_artist=2,
+                          art_size=1000)
+        library.playlists["fav"] = [3, 1, 4]
+        self.server = FakeMPD(library).start()
+        self.client = _Client(self.server.port)
+
+    def tearDown(self):
+
+        self.client.close()
+        self.server.stop()
+
+    def test_greeting(self):
+
+        self.assertTrue(self.client.greeting.startswith("OK MPD "))
+
+    def test_lsinfo(self):
+
+        root = self.client.cmd("lsinfo")
+        self.assertEqual(("directory", "Artist 0"), root[0])
+        self.assertTrue(("playlist", "fav") in root)
+
+        album = self.client.cmd('lsinfo "Artist 0/Album 1"')
+        files = [v for k, v in album if k == "file"]
+        self.assertEqual(10, len(files))
+        self.assertEqual("Artist 0/Album 1/001 Title 10.mp3", files[0])
+        self.assertTrue(("Title", "Title 10") in album)
+
+        self.assertRaises(IOError, self.client.cmd, 'lsinfo "nope"')
+
+    def test_search(self):
+
+        result = self.client.cmd('search artist "artist 1" album "ALBUM 3"')
+        files = [v for k, v in result if k == "file"]
+        self.assertEqual(10, len(files))
+        self.assertTrue(files[0].startswith("Artist 1/Album 3/"))
+
+    def test_queue(self):
+
+        self.client.cmd('add "Artist 0/Album 0"')
+        status = dict(self.client.cmd("status"))
+        self.assertEqual("10", status["playlistlength"])
+        version = int(status["playlist"])
+
+        self.client.cmd("delete 8")
+        changes = self.client.cmd("plchangesposid %d" % version)
+        self.assertEqual([("cpos", "8"), ("Id", "10")], changes)
+
+        info = self.client.cmd("plchanges %d" % version)
+        self.assertTrue(("Pos", "8") in info)
+
+        self.client.cmd("clear")
+        self.client.cmd("load fav")
+        self.client.cmd("play 1")
+        song = dict(self.client.cmd("currentsong"))
+        self.assertEqual("Title 1", song["Title"])
+        self.assertEqual("play", dict(self.client.cmd("status"))["state"])
+
+    def test_command_list(self):
+
+        self.client.send("command_list_ok_begin", "status", "ping",
+                         "command_list_end")
+        self.assertTrue(("state", "stop") in self.client.response())
+
+        self.client.send("command_list_begin", "ping", "bogus", "ping",
+                         "command_list_end")
+        self.assertTrue(self.client.line().startswith("ACK [5@1] {bogus}"))
+
+    def test_binary(self):
+
+        self.client.cmd("binarylimit 300")
+
+        data = b""
+        while True:
+            self.client.send('albumart "Artist 0/Album 0/001 Title 0.mp3" %d'
+                             % len(data))
+            size = int(self.client.line().split(": ")[1])
+            num = int(self.client.line().split(": ")[1])
+            data += self.client.read(num)
+            self.assertEqual(b"\n", self.client.read(1))
+            self.assertEqual("OK", self.client.line())
+            if len(data) >= size:
+                break
+
+        self.assertEqual(1000, len(data))
+        self.assertEqual(self.server.library.art("Artist 0/Album 0/x"), data)
+
+    def test_idle(self):
+
+        other = _Client(self.server.port)
+        try:
+            self.client.send("idle player playlist")
+            time.sleep(0.1)
+            other.cmd("setvol 20") # mixer is not of interest
+            other.cmd("add \"Artist 1/Album 2/001 Title 20.mp3\"")
+            self.assertEqual([("changed", "playlist")],
+                             self.client.response())
+            self.client.send("idle") # mixer change is still pending
+            self.assertEqual([("changed", "mixer")], self.client.response())
+            self.client.send("idle")
+            self.client.send("noidle")
+            self.assertEqual([], self.client.response())
+        finally:
+            other.close()
+
+    def test_latency(self):
+
+        self.server.latency = 0.05
+        t0 = time.time()
+        self.client.cmd("ping")
+        self.assertTrue(time.time() - t0 >= 0.05)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -32,6 +32,12 @@ Class PlayerAdapter:
 Class MPRISAdapter:
     Base class for player adapters for MPRIS players.
 
+Class MPRIS2Adapter:
+    Base class for player adapters for MPRIS 2 players.
+
+Class DBusProxy:
+    Used by player adapters to call DBus methods of a player asynchronously.
+
 Classes ItemAction and ListAction:
     Classes to define actions clients may execute in their media browser. 
 
@@ -74,16 +80,18 @@ Logging:
 from remuco.adapter import PlayerAdapter, ItemAction, ListAction, ListReply
 from remuco.adapter import MIMETYPES_AUDIO, MIMETYPES_VIDEO, MIMETYPES_AV
 from remuco.config import Config
+from remuco.dbusproxy import DBusProxy
 from remuco.defs import *
 from remuco.manager import Manager
 from remuco.mpris import MPRISAdapter
+from remuco.mpris2 import MPRIS2Adapter
 
 #==============================================================================
 # exports
 #==============================================================================
 
-__all__ = ["PlayerAdapter", "ListReply", "MPRISAdapter",
-           "ItemAction", "ListAction", "Manager", "Config",
+__all__ = ["PlayerAdapter", "ListReply", "MPRISAdapter", "MPRIS2Adapter",
+           "ItemAction", "ListAction", "Manager", "Config", "DBusProxy",
            
            "INFO_ALBUM", "INFO_ARTIST", "INFO_GENRE", "INFO_LENGTH",
            "INFO_RATING", "INFO_TAGS", "INFO_TITLE", "INFO_YEAR",
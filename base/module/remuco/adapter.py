@@ -20,12 +20,15 @@
 #
 # =============================================================================
 
+import contextlib
 import inspect
 import math # for ceiling
 import os
 import os.path
 import subprocess
+import time
 import urllib
+import weakref
 from urllib import parse
 
 from gi.repository import GConf, GObject
@@ -33,15 +36,21 @@ from gi.repository import GConf, GObject
 from remuco import art
 from remuco import config
 from remuco import files
+from remuco import latency
 from remuco import log
+from remuco import manager
 from remuco import message
+from remuco import metrics
 from remuco import net
 from remuco import serial
+from remuco import volume
 
 from remuco.defs import *
 from remuco.features import *
 
-from remuco.data import PlayerInfo, PlayerState, Progress, ItemList, Item
+from remuco.data import PlayerInfo, PlayerState, PlayerStateDelta
+from remuco.data import Progress, ProgressExt
+from remuco.data import ItemList, Item
 from remuco.data import Control, Action, Tagging, Request
 
 from remuco.manager import NoManager
@@ -61,8 +70,15 @@ class ListReply(object):
     reply data (using properties 'ids', 'names', 'item_actions' and
     'nested', 'list_actions') and to send the reply to clients (using send()).
     
+    A reply may get cancelled before it has been sent, either because the
+    same client already requested another list of the same kind or because
+    the player adapter did not send the reply in time. Player adapters doing
+    expensive or iterative work to set up a reply should check the property
+    'cancelled' from time to time and abort if it is True.
+    
     """
-    def __init__(self, client, request_id, reply_msg_id, page, path=None):
+    def __init__(self, client, request_id, reply_msg_id, page, path=None,
+                 done_fn=None):
         """Create a new list reply.
         
         Used internally, not needed within player adapters.
@@ -73,6 +89,8 @@ class ListReply(object):
         @param page: page of the requested list
         
         @keyword path: path of the requested list, if there is one
+        @keyword done_fn: function to call (with the reply as parameter) once
+            the reply has been sent or cancelled
         
         """
         self.__client = client
@@ -80,6 +98,8 @@ class ListReply(object):
         self.__reply_msg_id = reply_msg_id
         self.__page = page
         self.__path = path
+        self.__done_fn = done_fn
+        self.__cancelled = False
         
         self.__nested = []
         self.__ids = []
@@ -88,7 +108,48 @@ class ListReply(object):
         self.__item_actions = []
         
     def send(self):
-        """Send the requested item list to the requesting client."""
+        """Send the requested item list to the requesting client.
+        
+        Does nothing if the reply has been cancelled already.
+        
+        """
+        if self.__cancelled:
+            log.debug("reply %d has been cancelled, send nothing",
+                      self.__request_id)
+            return
+        
+        self.__send()
+        
+        self.__done()
+        
+    def cancel(self, send_empty=False):
+        """Cancel the reply.
+        
+        Used internally, not needed within player adapters.
+        
+        @keyword send_empty: if True, send an empty list to the client (so
+            that it does not wait forever for a reply), otherwise send
+            nothing at all
+        
+        """
+        if self.__cancelled:
+            return
+        
+        if send_empty:
+            self.__nested, self.__ids, self.__names = [], [], []
+            self.__send()
+            
+        self.__cancelled = True
+        
+        self.__done()
+        
+    def __done(self):
+        
+        if self.__done_fn is not None:
+            self.__done_fn(self)
+            self.__done_fn = None
+        
+    def __send(self):
         
         ### paging ###
         
@@ -135,6 +196,20 @@ class ListReply(object):
         GObject.idle_add(self.__client.send, msg)
         
 
+    # === property: cancelled ===
+    
+    def __pget_cancelled(self):
+        """Whether the reply has been cancelled (read only).
+        
+        Player adapters doing expensive work to set up a reply may check this
+        to abort work which is obsolete anyway.
+        
+        """
+        return self.__cancelled
+    
+    cancelled = property(__pget_cancelled, None, None,
+                         __pget_cancelled.__doc__)
+
     # === property: ids ===
     
     def __pget_ids(self):
@@ -313,6 +388,144 @@ class ItemAction(object):
     
     id = property(__pget_id, None, None, __pget_id.__doc__)
     
+# =============================================================================
+# constants
+# =============================================================================
+
+# maximum deviation (in milliseconds) between the real progress and the
+# progress interpolated by clients before extended progress gets synced again
+_PROGRESS_DRIFT_MAX = 2000
+
+# =============================================================================
+# poll scheduler
+# =============================================================================
+
+class _PollScheduler(object):
+    """Adaptive timer for periodically calling a poll function.
+    
+    While the player is active, the poll function gets called with a minimum
+    interval. While it is inactive, the interval grows exponentially up to a
+    maximum interval. If there is nothing to poll for at all, polling pauses
+    until the scheduler gets kicked.
+    
+    """
+    def __init__(self, poll_fn, activity_fn, ival_min, ival_max):
+        """Create a new poll scheduler.
+        
+        @param poll_fn:
+            the function to call periodically - if it returns False, polling
+            stops for good
+        @param activity_fn:
+            function returning True if the player is active, False if it is
+            inactive and None if polling should pause
+        @param ival_min:
+            minimum poll interval in milliseconds
+        @param ival_max:
+            maximum poll interval in milliseconds
+            
+        """
+        self.__poll_fn = poll_fn
+        self.__activity_fn = activity_fn
+        self.__ival_min = ival_min
+        self.__ival_max = max(ival_min, ival_max)
+        self.__ival = ival_min
+        self.__sid = 0
+        self.__running = False
+        self.__ticking = False
+        self.__wakeups = 0
+        self.__since = 0
+        
+    def start(self):
+        
+        self.__running = True
+        self.__ival = self.__ival_min
+        self.__wakeups = 0
+        self.__since = time.time()
+        self.__schedule()
+        
+    def stop(self):
+        
+        self.__running = False
+        self.__unschedule()
+        
+    def kick(self, now=False):
+        """Switch back to the minimum poll interval.
+        
+        @keyword now: if True, poll immediately
+        
+        """
+        if not self.__running:
+            return
+        
+        self.__ival = self.__ival_min
+        
+        if self.__ticking:
+            return # next poll gets scheduled when the current one is done
+        
+        self.__unschedule()
+        if now:
+            self.__tick()
+        else:
+            self.__schedule()
+    
+    def set_ival_max(self, ival_max):
+        """Change the maximum poll interval (in milliseconds)."""
+        
+        self.__ival_max = max(self.__ival_min, ival_max)
+        self.__ival = min(self.__ival, self.__ival_max)
+        
+    def stats(self):
+        """Get a summary of poll statistics as a string."""
+        
+        minutes = max(time.time() - self.__since, 1) / 60.0
+        fixed = 60000.0 / self.__ival_min
+        return ("%.1f wakeups/min (fixed interval: %.1f wakeups/min)" %
+                (self.__wakeups / minutes, fixed))
+        
+    def __schedule(self):
+        
+        self.__sid = GObject.timeout_add(self.__ival, self.__tick)
+        
+    def __unschedule(self):
+        
+        if self.__sid > 0:
+            GObject.source_remove(self.__sid)
+            self.__sid = 0
+        
+    def __tick(self):
+        
+        self.__sid = 0
+        self.__wakeups += 1
+        
+        self.__ticking = True
+        try:
+            keep = self.__poll_fn()
+        finally:
+            self.__ticking = False
+        
+        if not keep:
+            log.debug("stop polling")
+            self.__running = False
+            return False
+        
+        if not self.__running: # stopped within poll function
+            return False
+        
+        active = self.__activity_fn()
+        
+        if active is None:
+            log.debug("pause polling")
+            return False
+        
+        if active:
+            self.__ival = self.__ival_min
+        else:
+            self.__ival = min(self.__ival * 2, self.__ival_max)
+            
+        self.__schedule()
+        
+        return False
+    
 # =============================================================================
 # player adapter
 # =============================================================================
@@ -401,6 +614,9 @@ class PlayerAdapter(object):
         if there actually is no change, internally a change check is done
         before sending any data to clients).
         
+        When updating several state values at once, e.g. when polling a
+        player's state, wrap the update calls in a batch() block.
+        
         Subclasses of PlayerAdapter may override the method poll() to
         periodically check a player's state.
         
@@ -446,7 +662,9 @@ class PlayerAdapter(object):
         @keyword max_rating:
             maximum possible rating value for items
         @keyword poll:
-            interval in seconds to call poll()
+            interval in seconds to call poll() while the player is playing
+            (while it is paused or stopped the interval grows, while no
+            client is connected polling pauses)
         @keyword file_actions:
             list of ItemAction which can be applied to files from the local
             file system (actions like play a file or append files to the
@@ -481,7 +699,10 @@ class PlayerAdapter(object):
         self.__clients = []
         
         self.__state = PlayerState()
+        self.__state_bases = weakref.WeakKeyDictionary() # client -> state
         self.__progress = Progress()
+        self.__progress_ext = ProgressExt()
+        self.__progress_ext_stale = False # new item, re-anchor on next update
         self.__item_id = None
         self.__item_info = None
         self.__item_img = None
@@ -493,21 +714,31 @@ class PlayerAdapter(object):
                                  search_mask)
         
         self.__sync_triggers = {}
+        self.__sync_origins = {} # for latency instrumentation
+        
+        self.__batch_depth = 0
+        self.__batch_records = None
+        
+        self.__replies = {} # outstanding list replies
+        self.__reply_timeout = max(0, self.config.request_timeout * 1000)
         
-        self.__poll_ival = max(500, int(poll * 1000))
-        self.__poll_sid = 0
+        poll_ival = max(500, int(poll * 1000))
+        self.__poller = _PollScheduler(self.__poll, self.__poll_activity,
+                                       poll_ival,
+                                       self.config.poll_backoff_max * 1000)
         
         self.stopped = True
         
         self.__server_bluetooth = None
         self.__server_wifi = None
         
-        if self.config.fb_root_dirs:
-            self.__filelib = files.FileSystemLibrary(
-                self.config.fb_root_dirs, mime_types,
-                self.config.fb_show_extensions, False)
-        else:
-            log.info("file browser is disabled")
+        self.__mvol = None # master volume backend
+        
+        self.__mime_types = mime_types
+        self.__filelib = None
+        self.__init_filelib()
+        
+        self.config.subscribe(self.__on_config_changed)
             
         if "REMUCO_TESTSHELL" in os.environ:
             from remuco import testshell
@@ -528,6 +759,15 @@ class PlayerAdapter(object):
         
         self.stopped = False
         
+        # set up instrumentation
+        
+        if self.config.latency_stats > 0:
+            latency.enable(os.path.join(self.config.cache, "%s.latency" %
+                                        self.config.player),
+                           self.config.latency_stats)
+        
+        net.trace_setup(self.config.trace_size, self.config.trace_payload)
+        
         # set up server
         
         if self.config.bluetooth_enabled:
@@ -542,12 +782,23 @@ class PlayerAdapter(object):
         else:
             self.__server_wifi = None
             
+        if self.config.metrics_port > 0:
+            metrics.start(self.config.metrics_port)
+            metrics.gauge(metrics.CLIENTS, lambda: len(self.__clients))
+            
+        # set up master volume
+        
+        if self.config.master_volume_enabled:
+            self.__mvol = volume.create(self.config,
+                                        self.__update_volume_master)
+        
         # set up polling
         
-        if self.__poll_ival > 0:
-            log.debug("poll every %d milli seconds" % self.__poll_ival)
-            self.__poll_sid = GObject.timeout_add(self.__poll_ival, self.__poll)
-            
+        self.__poller.start()
+        
+        # watch config changes
+        
+        self.config.watch()
         
         log.debug("start done")
     
@@ -586,9 +837,26 @@ class PlayerAdapter(object):
                 GObject.source_remove(sid)
                 
         self.__sync_triggers = {}
+        self.__sync_origins = {}
+        
+        latency.disable()
+        metrics.stop()
+        
+        for reply, sid in list(self.__replies.values()):
+            reply.cancel() # also removes the reply's timeout source
+            
+        self.__replies = {}
 
-        if self.__poll_sid > 0:
-            GObject.source_remove(self.__poll_sid)
+        self.__poller.stop()
+        
+        self.config.unwatch()
+        self.config.flush()
+        
+        if self.__mvol is not None:
+            self.__mvol.close()
+            self.__mvol = None
+        
+        log.info("poll stats: %s" % self.__poller.stats())
             
         log.debug("stop done")
     
@@ -596,7 +864,11 @@ class PlayerAdapter(object):
         """Does nothing by default.
         
         If player adapters override this method, it gets called periodically
-        in the interval specified by the keyword 'poll' in __init__().
+        in the interval specified by the keyword 'poll' in __init__(). To save
+        resources, the interval grows while the player is not playing and
+        polling pauses completely while no client is connected. On client
+        activity (e.g. a new connection or a control message) polling
+        immediately switches back to the original interval.
         
         A typical use case of this method is to detect the playback progress of
         the current item and then call update_progress(). It can also be used
@@ -608,17 +880,40 @@ class PlayerAdapter(object):
     
     def __poll(self):
         
-        if self.config.master_volume_enabled:
-            self.__update_volume_master()
+        mvol = self.__mvol
+        
+        if mvol is not None:
+            mvol.refresh()
+        
+        if metrics.enabled:
+            t_start = time.time()
+        
+        if manager.lag_monitoring:
+            token = manager.activity_begin("%s.poll()" %
+                                           self.__class__.__name__)
         
         try:
             self.poll()
         except NotImplementedError:
-            # poll again if master volume is used, otherwise not
-            return self.config.master_volume_enabled
+            # poll again if master volume needs refreshes, otherwise not
+            return mvol is not None and not mvol.event_driven
+        finally:
+            if manager.lag_monitoring:
+                manager.activity_end(token)
+        
+        if metrics.enabled:
+            metrics.observe(metrics.POLL_DURATION, None, time.time() - t_start)
         
         return True
     
+    def __poll_activity(self):
+        """Activity indicator for the poll scheduler."""
+        
+        if not self.__clients:
+            return None
+        
+        return self.__state.playback == PLAYBACK_PLAY
+    
     # =========================================================================
     # utility methods which may be useful for player adapters
     # =========================================================================
@@ -642,7 +937,7 @@ class PlayerAdapter(object):
         """
         
         file = art.get_art(resource)
-        log.debug("image for '%s': %s" % (resource, file))
+        log.debug("image for '%s': %s", resource, file)
         return file
     
     # =========================================================================
@@ -772,20 +1067,10 @@ class PlayerAdapter(object):
         log.error("** BUG ** in feature handling")
         
     def __ctrl_volume_master(self, direction):
-        """Adjust volume using custom volume command (instead of player)."""
-        
-        if direction < 0:
-            cmd = self.config.master_volume_down_cmd
-        elif direction > 0:
-            cmd = self.config.master_volume_up_cmd
-        else:
-            cmd = self.config.master_volume_mute_cmd
+        """Adjust volume using the master volume (instead of player)."""
         
-        ret, out = subprocess.getstatusoutput("sh -c '%s'" % cmd)
-        if ret != os.EX_OK:
-            log.error("master-volume-... failed: %s" % out)
-        else:
-            GObject.idle_add(self.__update_volume_master)
+        if self.__mvol is not None:
+            self.__mvol.adjust(direction)
         
     def __ctrl_shutdown_system(self):
         
@@ -1042,8 +1327,12 @@ class PlayerAdapter(object):
         change = self.__state.playback != playback
         
         if change:
+            pe = self.__progress_ext
+            progress = pe.at(self.__util_now())
             self.__state.playback = playback
             self.__sync_trigger(self.__sync_state)
+            self.__update_progress_ext(progress, pe.length)
+            self.__poller.kick()
     
     def update_repeat(self, repeat):
         """Set the current repeat mode. 
@@ -1103,21 +1392,8 @@ class PlayerAdapter(object):
             self.__state.volume = volume
             self.__sync_trigger(self.__sync_state)
     
-    def __update_volume_master(self):
-        """Set the current volume (use custom command instead of player)."""
-
-        cmd = "sh -c '%s'" % self.config.master_volume_get_cmd
-        ret, out = subprocess.getstatusoutput(cmd)
-        if ret != os.EX_OK:
-            log.error("master-volume-get failed: '%s'" % out)
-            return
-        try:
-            volume = int(out)
-            if volume < 0 or volume > 100:
-                raise ValueError
-        except ValueError:
-            log.error("output of master-volume-get malformed: '%s'" % out)
-            return
+    def __update_volume_master(self, volume):
+        """Set the current volume (use master volume instead of player)."""
         
         change = self.__state.volume != volume
         
@@ -1129,13 +1405,17 @@ class PlayerAdapter(object):
         """Set the current playback progress.
         
         @param progress:
-            number of currently elapsed seconds
+            number of currently elapsed seconds (may be a float)
         @keyword length:
             item length in seconds (maximum possible progress value)
         
         @note: Call to synchronize player state with remote clients.
         
         """
+        # extended progress for clients interpolating progress on their own
+        self.__update_progress_ext(max(0, int(progress * 1000)),
+                                   max(0, int(length * 1000)))
+        
         # sanitize progress (to a multiple of 5)
         length = max(0, int(length))
         progress = max(0, int(progress))
@@ -1155,6 +1435,35 @@ class PlayerAdapter(object):
             self.__progress.length = length
             self.__sync_trigger(self.__sync_progress)
     
+    def __update_progress_ext(self, progress, length):
+        """Set the current extended playback progress (in milliseconds).
+        
+        Synchronizes with clients only on discontinuities, i.e. if the length
+        or rate changed, if the progress deviates too much from the
+        progress clients have interpolated or if the item changed.
+        
+        """
+        now = self.__util_now()
+        pe = self.__progress_ext
+        
+        if self.__state.playback == PLAYBACK_PLAY:
+            rate = 1000
+        else:
+            rate = 0
+        
+        change = pe.length != length
+        change |= pe.rate != rate
+        change |= abs(pe.at(now) - progress) > _PROGRESS_DRIFT_MAX
+        change |= self.__progress_ext_stale
+        
+        if change:
+            self.__progress_ext_stale = False
+            pe.progress = progress
+            pe.length = length
+            pe.rate = rate
+            pe.timestamp = now
+            self.__sync_trigger(self.__sync_progress_ext)
+    
     def update_item(self, id, info, img):
         """Set currently played item.
         
@@ -1174,7 +1483,7 @@ class PlayerAdapter(object):
                
         """
         
-        log.debug("new item: (%s, %s %s)" % (id, info, img))
+        log.debug("new item: (%s, %s %s)", id, info, img)
         
         change = self.__item_id != id
         change |= self.__item_info != info
@@ -1185,7 +1494,58 @@ class PlayerAdapter(object):
             self.__item_info = info
             self.__item_img = img
             self.__sync_trigger(self.__sync_item)
-            
+            # clients re-anchor their progress interpolation on a new item,
+            # even if it has the same length and a similar position - until
+            # the player reports the new item's progress, it starts at 0
+            # (not at the previous item's position)
+            pe = self.__progress_ext
+            pe.progress, pe.timestamp = 0, self.__util_now()
+            self.__progress_ext_stale = True
+            self.__sync_trigger(self.__sync_progress_ext)
+            
+    @contextlib.contextmanager
+    def batch(self):
+        """Context manager to apply many player state changes at once.
+        
+        Within a batch, calls to update_playback(), update_volume(),
+        update_repeat(), update_shuffle(), update_position() and
+        update_progress() only change the state kept internally. When the
+        batch ends, the state gets compared once with the state before the
+        batch and at most one state and one progress synchronization with
+        clients is done.
+        
+        Example:
+        
+            with self.batch():
+                self.update_volume(volume)
+                self.update_playback(playback)
+                self.update_progress(progress, length)
+        
+        Batches may be nested, changes get synchronized when the outermost
+        batch ends.
+        
+        """
+        if self.__batch_depth == 0:
+            self.__batch_records = self.__util_records()
+        self.__batch_depth += 1
+        try:
+            yield
+        finally:
+            self.__batch_depth -= 1
+            if self.__batch_depth == 0:
+                self.__batch_commit()
+    
+    def __batch_commit(self):
+        """Synchronize changes made within a batch."""
+        
+        before, self.__batch_records = self.__batch_records, None
+        after = self.__util_records()
+        
+        for sync_fn, rec_before, rec_after in zip(self.__util_record_syncs(),
+                                                   before, after):
+            if rec_before != rec_after:
+                self.__sync_trigger(sync_fn)
+    
     # =========================================================================
     # synchronization (outbound communication)
     # =========================================================================
@@ -1195,25 +1555,74 @@ class PlayerAdapter(object):
         if self.stopped:
             return
         
+        if self.__batch_depth > 0 and sync_fn in self.__util_record_syncs():
+            return # synced when batch ends
+        
         if sync_fn in self.__sync_triggers:
-            log.debug("trigger for %s already active" % sync_fn.__name__)
+            log.debug("trigger for %s already active",
+                      sync_fn.__name__)
+            if metrics.enabled:
+                metrics.inc(metrics.SYNC_COALESCED,
+                            sync_fn.__name__.replace("__sync_", ""))
             return
         
         self.__sync_triggers[sync_fn] = \
             GObject.idle_add(sync_fn, priority=GObject.PRIORITY_LOW)
         
+        if latency.enabled:
+            self.__sync_origins[sync_fn] = latency.now()
+        
+    def __sync_origin(self, sync_fn, msg_id):
+        """Get the time when a sync has been triggered.
+        
+        Used for latency instrumentation only. Also records the time it took
+        to dispatch the sync.
+        
+        """
+        origin = self.__sync_origins.pop(sync_fn, None)
+        if origin is not None:
+            latency.record(msg_id, latency.DISPATCH, origin)
+        return origin
+        
     def __sync_state(self):
         
         del self.__sync_triggers[self.__sync_state]
+        
+        origin = None
+        if latency.enabled:
+            origin = self.__sync_origin(self.__sync_state, message.SYNC_STATE)
 
-        log.debug("broadcast new state to clients: %s" % self.__state)
+        log.debug("broadcast new state to clients: %s", self.__state)
         
-        msg = net.build_message(message.SYNC_STATE, self.__state)
+        if metrics.enabled:
+            metrics.inc(metrics.SYNC_BROADCASTS, "state")
         
-        if msg is None:
-            return
+        record = self.__state.get_data()
         
-        for c in self.__clients: c.send(msg)
+        msg_full = None
+        msgs_delta = {} # base state -> delta message
+        
+        for c in self.__clients:
+            
+            base = self.__state_bases.get(c)
+            
+            if base is None: # client does not support deltas
+                if msg_full is None:
+                    msg_full = net.build_message(message.SYNC_STATE,
+                                                 self.__state)
+                msg = msg_full
+            elif base == record: # client is up to date
+                msg = None
+            else:
+                if base not in msgs_delta:
+                    delta = PlayerStateDelta(self.__state, base)
+                    msgs_delta[base] = net.build_message(
+                                            message.SYNC_STATE_DELTA, delta)
+                msg = msgs_delta[base]
+                self.__state_bases[c] = record
+            
+            if msg is not None:
+                c.send(msg, origin)
         
         return False
     
@@ -1221,14 +1630,51 @@ class PlayerAdapter(object):
         
         del self.__sync_triggers[self.__sync_progress]
         
-        log.debug("broadcast new progress to clients: %s" % self.__progress)
+        origin = None
+        if latency.enabled:
+            origin = self.__sync_origin(self.__sync_progress,
+                                        message.SYNC_PROGRESS)
+        
+        if metrics.enabled:
+            metrics.inc(metrics.SYNC_BROADCASTS, "progress")
+        
+        log.debug("broadcast new progress to clients: %s",
+                  self.__progress)
         
         msg = net.build_message(message.SYNC_PROGRESS, self.__progress)
         
         if msg is None:
             return
         
-        for c in self.__clients: c.send(msg)
+        for c in self.__clients:
+            if not c.info.features & CF_PROGRESS_EXT:
+                c.send(msg, origin)
+        
+        return False
+    
+    def __sync_progress_ext(self):
+        
+        del self.__sync_triggers[self.__sync_progress_ext]
+        
+        origin = None
+        if latency.enabled:
+            origin = self.__sync_origin(self.__sync_progress_ext,
+                                        message.SYNC_PROGRESS_EXT)
+        
+        if metrics.enabled:
+            metrics.inc(metrics.SYNC_BROADCASTS, "progress_ext")
+        
+        log.debug("broadcast new extended progress to clients: %s",
+                  self.__progress_ext)
+        
+        msg = net.build_message(message.SYNC_PROGRESS_EXT, self.__progress_ext)
+        
+        if msg is None:
+            return
+        
+        for c in self.__clients:
+            if c.info.features & CF_PROGRESS_EXT:
+                c.send(msg, origin)
         
         return False
     
@@ -1236,14 +1682,21 @@ class PlayerAdapter(object):
 
         del self.__sync_triggers[self.__sync_item]
         
-        log.debug("broadcast new item to clients: %s" % self.__item_id)
+        origin = None
+        if latency.enabled:
+            origin = self.__sync_origin(self.__sync_item, message.SYNC_ITEM)
+        
+        if metrics.enabled:
+            metrics.inc(metrics.SYNC_BROADCASTS, "item")
+        
+        log.debug("broadcast new item to clients: %s", self.__item_id)
         
         for c in self.__clients:
             
             msg = net.build_message(message.SYNC_ITEM, self.__item(c))
             
             if msg is not None:
-                c.send(msg)
+                c.send(msg, origin)
         
         return False
     
@@ -1253,37 +1706,72 @@ class PlayerAdapter(object):
     
     def __handle_message(self, client, id, bindata):
         
-        if message.is_control(id):
+        if metrics.enabled:
+            t_start = time.time()
+        
+        if manager.lag_monitoring:
+            token = manager.activity_begin("%s handling %s" %
+                (self.__class__.__name__, message.name(id)))
+        
+        try:
+            if message.is_control(id):
 
-            log.debug("control from client %s" % client)
+                log.debug("control from client %s", client)
 
-            self.__handle_message_control(id, bindata)
-            
-        elif message.is_action(id):
+                self.__poller.kick()
+                
+                self.__handle_message_control(id, bindata)
+                
+            elif message.is_action(id):
 
-            log.debug("action from client %s" % client)
+                log.debug("action from client %s", client)
 
-            self.__handle_message_action(id, bindata)
-            
-        elif message.is_request(id):
-            
-            log.debug("request from client %s" % client)
+                self.__poller.kick()
+                
+                self.__handle_message_action(id, bindata)
+                
+            elif message.is_request(id):
+                
+                log.debug("request from client %s", client)
 
-            self.__handle_message_request(client, id, bindata)
-            
-        elif id == message.PRIV_INITIAL_SYNC:
-            
-            msg = net.build_message(message.SYNC_STATE, self.__state)
-            client.send(msg)
-            
-            msg = net.build_message(message.SYNC_PROGRESS, self.__progress)
-            client.send(msg)
-            
-            msg = net.build_message(message.SYNC_ITEM, self.__item(client))
-            client.send(msg)
-            
-        else:
-            log.error("** BUG ** unexpected message: %d" % id)
+                self.__handle_message_request(client, id, bindata)
+                
+            elif id == message.PRIV_INITIAL_SYNC:
+                
+                # new or woken up client, get fresh player state first
+                self.__poller.kick(now=True)
+                
+                msg = net.build_message(message.SYNC_STATE, self.__state)
+                client.send(msg)
+                
+                if client.info.features & CF_STATE_DELTA:
+                    # base for following state deltas
+                    self.__state_bases[client] = self.__state.get_data()
+                
+                if client.info.features & CF_PROGRESS_EXT:
+                    msg = net.build_message(message.SYNC_PROGRESS_EXT,
+                                            self.__progress_ext)
+                else:
+                    msg = net.build_message(message.SYNC_PROGRESS,
+                                            self.__progress)
+                client.send(msg)
+                
+                msg = net.build_message(message.SYNC_ITEM, self.__item(client))
+                client.send(msg)
+                
+            elif id == message.PRIV_DISCONNECT:
+                
+                self.__reply_cancel_all(client)
+                
+            else:
+                log.error("** BUG ** unexpected message: %d" % id)
+        finally:
+            if manager.lag_monitoring:
+                manager.activity_end(token)
+        
+        if metrics.enabled:
+            metrics.observe(metrics.HANDLER_DURATION, message.name(id),
+                            time.time() - t_start)
     
     def __handle_message_control(self, id, bindata):
     
@@ -1401,8 +1889,12 @@ class PlayerAdapter(object):
         if request is None:
             return
         
+        key = (client, id)
         reply = ListReply(client, request.request_id, id, request.page,
-                          path=request.path)
+                          path=request.path,
+                          done_fn=lambda r: self.__reply_untrack(key, r))
+        
+        self.__reply_track(key, reply)
         
         if id == message.REQ_PLAYLIST:
             
@@ -1418,8 +1910,9 @@ class PlayerAdapter(object):
             
         elif id == message.REQ_FILES:
             
-            reply.nested, reply.ids, reply.names = \
-                self.__filelib.get_level(request.path)
+            if self.__filelib is not None:
+                reply.nested, reply.ids, reply.names = \
+                    self.__filelib.get_level(request.path)
             
             reply.send()
             
@@ -1430,16 +1923,125 @@ class PlayerAdapter(object):
         else:
             log.error("** BUG ** unexpected request message: %d" % id)
             
+    def __reply_track(self, key, reply):
+        """Track an outstanding reply.
+        
+        An older outstanding reply of the same kind and for the same client
+        gets superseded, i.e. cancelled, by the new one.
+        
+        """
+        old = self.__replies.pop(key, None)
+        if old is not None:
+            old_reply, sid = old
+            if sid > 0:
+                GObject.source_remove(sid)
+            log.debug("request superseded by a newer one from client %s",
+                      key[0])
+            old_reply.cancel()
+        
+        if self.__reply_timeout > 0:
+            sid = GObject.timeout_add(self.__reply_timeout,
+                                      self.__reply_expire, key, reply)
+        else:
+            sid = 0
+            
+        self.__replies[key] = (reply, sid)
+        
+    def __reply_untrack(self, key, reply):
+        """Forget a reply which has been sent or cancelled."""
+        
+        entry = self.__replies.get(key)
+        if entry is None or entry[0] is not reply:
+            return # already superseded
+        
+        del self.__replies[key]
+        
+        if entry[1] > 0:
+            GObject.source_remove(entry[1])
+        
+    def __reply_cancel_all(self, client):
+        """Cancel all outstanding replies for a client (e.g. on disconnect)."""
+        
+        for key, (reply, sid) in list(self.__replies.items()):
+            if key[0] is client:
+                log.debug("cancel request from disconnected client %s", client)
+                reply.cancel() # also removes the reply's timeout source
+        
+    def __reply_expire(self, key, reply):
+        """Timeout callback for replies not sent in time."""
+        
+        entry = self.__replies.get(key)
+        if entry is not None and entry[0] is reply:
+            # prevent removal of this (currently running) timeout source
+            self.__replies[key] = (reply, 0)
+        
+        log.warning("request from client %s not replied in time, send an "
+                    "empty list" % key[0])
+        
+        reply.cancel(send_empty=True)
+        
+        return False
+    
     # =========================================================================
     # miscellaneous 
     # =========================================================================
     
+    def __init_filelib(self):
+        
+        if self.config.fb_root_dirs:
+            self.__filelib = files.FileSystemLibrary(
+                self.config.fb_root_dirs, self.__mime_types,
+                self.config.fb_show_extensions, False)
+        else:
+            self.__filelib = None
+            log.info("file browser is disabled")
+    
+    def __on_config_changed(self, changed):
+        """Apply changed options which do not require a restart."""
+        
+        if "request-timeout" in changed:
+            self.__reply_timeout = max(0, self.config.request_timeout * 1000)
+        
+        if "poll-backoff-max" in changed:
+            self.__poller.set_ival_max(self.config.poll_backoff_max * 1000)
+        
+        if changed & set(("fb-root-dirs", "fb-show-extensions")):
+            self.__init_filelib()
+        
+        mvol_changed = [key for key in changed
+                        if key.startswith("master-volume-")]
+        if mvol_changed and not self.stopped:
+            if self.__mvol is not None:
+                self.__mvol.close()
+                self.__mvol = None
+            if self.config.master_volume_enabled:
+                self.__mvol = volume.create(self.config,
+                                            self.__update_volume_master)
+            self.__poller.kick(now=True)
+    
     def __item(self, client):
         """Creates a client specific item object."""
         
         return Item(self.__item_id, self.__item_info, self.__item_img,
                     client.info.img_size, client.info.img_type)
         
+    def __util_records(self):
+        """Compact records of the state synchronized by batches."""
+        
+        return (self.__state.get_data(), self.__progress.get_data(),
+                self.__progress_ext.get_data())
+    
+    def __util_record_syncs(self):
+        """Sync functions corresponding to the records of __util_records()."""
+        
+        return (self.__sync_state, self.__sync_progress,
+                self.__sync_progress_ext)
+    
+    def __util_now(self):
+        """Current time in milliseconds since epoch."""
+        
+        return int(time.time() * 1000)
+        
     def __util_files_to_uris(self, files):
         
         def file_to_uri(file):
@@ -1515,6 +2117,6 @@ class PlayerAdapter(object):
         for feature in features:
             flags |= feature
              
-        log.debug("flags: %X" % flags)
+        log.debug("flags: %X", flags)
         
         return flags
@@ -20,6 +20,7 @@
 #
 # =============================================================================
 
+import collections
 import glob
 import hashlib
 import os.path
@@ -28,6 +29,7 @@ import urllib
 from urllib import parse
 
 from remuco import log
+from remuco import metrics
 from remuco.remos import user_home
 
 _RE_IND = r'(?:front|album|cover|folder|art)' # words indicating art files
@@ -94,11 +96,24 @@ def _try_folder(resource):
 
 # =============================================================================
 
+_CACHE_SIZE = 64
+
+_cache = collections.OrderedDict() # resource -> art image file
+
 def get_art(resource, prefer_thumbnail=False):
     
     if resource is None:
         return None
     
+    fname = _cache.get(resource)
+    if fname is not None and os.path.isfile(fname):
+        _cache.move_to_end(resource)
+        if metrics.enabled:
+            metrics.inc(metrics.CACHE_HITS, "art")
+        return fname
+    if metrics.enabled:
+        metrics.inc(metrics.CACHE_MISSES, "art")
+    
     fname = None
     methods = (_try_thumbnail, _try_folder)
     for meth in methods:
@@ -106,4 +121,9 @@ def get_art(resource, prefer_thumbnail=False):
         if fname:
             break
     
+    if fname:
+        _cache[resource] = fname
+        if len(_cache) > _CACHE_SIZE:
+            _cache.popitem(last=False)
+    
     return fname
@@ -22,16 +22,22 @@
 
 from __future__ import with_statement
 
+import atexit
+import collections
 import configparser
 from datetime import datetime
 from glob import glob
+import io
 import os
-from os.path import join, isdir, exists, pathsep, basename
+from os.path import join, isdir, exists, pathsep, basename, getmtime
 import re
 import shutil
 import sys
+import tempfile
 import textwrap
 
+from gi.repository import GConf, GLib, GObject, Gio
+
 from remuco import log
 from remuco import defs
 from remuco.remos import user_config_dir
@@ -100,11 +106,41 @@ _OPTIONS = {
         "browser. `auto` expands to all directories which typically contain "
         "files of the mime types a player supports (e.g. `~/Music` for audio "
         "players)." % pathsep),
+    "lag-threshold": ("0", int,
+        "Log a warning with a stack sample if the main loop is blocked for "
+        "more than this number of milliseconds (for troubleshooting). 0 "
+        "disables these warnings. Main loop lag is also measured if metrics "
+        "are enabled. Only effective for stand-alone adapters."),
+    "latency-stats": ("0", int,
+        "Collect statistics about the latency of messages sent to clients "
+        "(for troubleshooting). 0 disables statistics, any other value is the "
+        "interval in seconds to write them to `PLAYER.latency` in the cache "
+        "directory. The statistics are also written on signal SIGUSR1."),
+    "metrics-port": ("0", int,
+        "Port of an HTTP server (bound to the loopback interface) which "
+        "exposes metrics of the adapter in the Prometheus text format at "
+        "`/metrics`. 0 disables metrics."),
+    "trace-size": ("128", int,
+        "Number of recently sent and received messages to keep in memory for "
+        "troubleshooting. The trace gets logged on signal SIGUSR1. 0 disables "
+        "the trace."),
+    "trace-payload": ("0", int,
+        "Number of bytes of each message's content to keep in the message "
+        "trace (see `trace-size`)."),
     "master-volume-enabled": ("0", int,
         "Enable or disable master volume. By default a player's volume level "
         "is controlled by and displayed on clients. By setting this to `1` "
         "the system's master volume is used instead - in that case the "
         "following options *may* need to get adusted."),
+    "master-volume-backend": ("auto", None,
+        "How to get and adjust the master volume: `alsa` uses the ALSA "
+        "mixer control given below (requires python-alsaaudio, gets notified "
+        "about volume changes), `helper` runs the commands given below in a "
+        "single long-lived shell, `command` runs each command in a new shell. "
+        "`auto` uses `alsa` if possible and if the commands have not been "
+        "changed, otherwise `helper`."),
+    "master-volume-alsa-control": ("Master", None,
+        "ALSA mixer control to use for the master volume."),
     "master-volume-get-cmd": (r'amixer get Master | grep -E "\[[0-9]+%\]" | '
         'sed -re "s/^.*\[([0-9]+)%\].*$/\\1/"', None,
         "Command to get the master volume level in percent."),
@@ -114,6 +150,14 @@ _OPTIONS = {
         "Command to decrease the master volume."),
     "master-volume-mute-cmd": ("amixer set Master 0%", None,
         "Command to mute the master volume."),
+    "poll-backoff-max": ("20", int,
+        "Maximum interval in seconds to check the player's state while it is "
+        "paused or stopped (only relevant for players which need to be "
+        "polled)."),
+    "request-timeout": ("30", int,
+        "Seconds to wait for a player to provide a list requested by a "
+        "client (e.g. the playlist). If the player does not answer in time, "
+        "the client gets an empty list. 0 means wait forever."),
     "system-shutdown-enabled": ("0", int,
         "Enable or disable system shutdown by clients. If enabled, the "
         "following option *may* need to get adjusted."),
@@ -129,9 +173,32 @@ _DEFAULTS = _odict()
 for k, v in _OPTIONS.items():
     _DEFAULTS[k] = v[0]
 
+# typed and immutable values of all standard options at a specific time
+# (field names are option names with dashes replaced by underscores)
+_Snapshot = collections.namedtuple("_Snapshot",
+    [k.replace("-", "_") for k in _DEFAULTS.keys()])
+
+# milliseconds to wait for further changes before saving the config
+_SAVE_DELAY = 200
+
 # timestamp (used for backups of old config data)
 _TS = datetime.now().strftime("%Y%m%d-%H%M%S")
 
+# configs with a deferred save pending (saved at the latest on exit)
+_unsaved = set()
+
+def _flush_all():
+    
+    for config in list(_unsaved):
+        config.flush()
+
+atexit.register(_flush_all)
+
+def _loop_running():
+    """Check if a main loop is running, i.e. if a deferred save happens."""
+    
+    return GLib.main_depth() > 0
+
 # =============================================================================
 # Config class
 # =============================================================================
@@ -146,6 +213,12 @@ class Config(object):
     use the 'config' attribute of a PlayerAdapter instance to access the
     currently used Config instance.
     
+    Standard options are parsed once into a snapshot, so reading them as
+    attributes is cheap. When watching the configuration (see watch()), the
+    snapshot gets replaced when the config file changes. Stand-alone adapters
+    additionally reload on SIGHUP (see Manager).
+    Functions interested in changed options may subscribe().
+    
     """
     def __init__(self, player_name):
         """Create a new instance for the given player (adapter)."""
@@ -177,6 +250,7 @@ class Config(object):
         cp = configparser.RawConfigParser(_DEFAULTS, _odict)
         if not cp.has_section(self.player):
             cp.add_section(self.player)
+        self.__mtime = self.__util_mtime()
         if exists(self.file):
             try:
                 cp.read(self.file)
@@ -209,6 +283,10 @@ class Config(object):
         cp.set(configparser.DEFAULTSECT, "config-version", _CONFIG_VERSION)
 
         self.__cp = cp
+        self.__snapshot = self.__parse(cp)
+        self.__subscribers = []
+        self.__monitor = None
+        self.__save_sid = 0
         
         # save to always have a clean file
         self.__save()
@@ -217,24 +295,141 @@ class Config(object):
         
         log.info("remuco version: %s" % defs.REMUCO_VERSION)
         
-    def __getattribute__(self, attr):
+    def __getattr__(self, attr):
         """Attribute-style access to standard options."""
         
+        # only called if there is no regular attribute named 'attr'
+        snapshot = self.__dict__.get("_Config__snapshot")
+        try:
+            return getattr(snapshot, attr.replace("-", "_"))
+        except AttributeError:
+            raise AttributeError(attr)
+    
+    def __pget_snapshot(self):
+        """Current values of all standard options (a named tuple).
+        
+        Use this to get a consistent view on multiple options.
+        
+        """
+        return self.__snapshot
+    
+    snapshot = property(__pget_snapshot, None, None, __pget_snapshot.__doc__)
+    
+    def subscribe(self, fn):
+        """Get notified about changed options.
+        
+        @param fn:
+            function to call with a set of changed option names (standard
+            options and player specific options, the latter are prefixed with
+            'x-') whenever the configuration gets reloaded
+        
+        """
+        if fn not in self.__subscribers:
+            self.__subscribers.append(fn)
+    
+    def unsubscribe(self, fn):
+        """Stop notifying a function previously passed to subscribe()."""
+        
+        if fn in self.__subscribers:
+            self.__subscribers.remove(fn)
+    
+    def watch(self):
+        """Reload the configuration when its file changes."""
+        
+        if self.__monitor is not None:
+            return
+        
+        self.__mtime = self.__util_mtime()
+        
+        try:
+            self.__monitor = Gio.File.new_for_path(self.file).monitor_file(
+                                            Gio.FileMonitorFlags.NONE, None)
+            self.__monitor.connect("changed", self.__on_file_changed)
+        except GObject.GError as e:
+            log.warning("failed to watch config file (%s)" % e)
+            self.__monitor = None
+    
+    def unwatch(self):
+        """Stop watching the configuration."""
+        
+        if self.__monitor is not None:
+            self.__monitor.cancel()
+            self.__monitor = None
+    
+    def flush(self):
+        """Save pending changes now."""
+        
+        if self.__save_sid > 0:
+            GObject.source_remove(self.__save_sid)
+            self.__save_now()
+    
+    def reload(self):
+        """Reload the configuration from its file.
+        
+        Subscribers get notified about changed options.
+        
+        @return: False (usable as a GObject callback)
+        
+        """
+        if self.__save_sid > 0:
+            if self.__util_mtime() == self.__mtime:
+                self.flush() # file unchanged, keep pending changes
+            else: # changes in the file win over pending changes
+                GObject.source_remove(self.__save_sid)
+                self.__save_sid = 0
+                _unsaved.discard(self)
+        
+        cp = configparser.RawConfigParser(_DEFAULTS, _odict)
         try:
-            return super(Config, self).__getattribute__(attr)
-        except AttributeError as e:
-            _attr = attr.replace("_", "-")
-            if _attr in _OPTIONS:
-                attr = _attr
-            elif attr not in _OPTIONS:
-                raise e
-            value = self.__cp.get(self.player, attr)
-            converter = _OPTIONS[attr][1] or (lambda v: v)
+            cp.read(self.file)
+        except configparser.Error as e:
+            log.warning("failed to reload config %s (%s)" % (self.file, e))
+            return False
+        if not cp.has_section(self.player):
+            cp.add_section(self.player)
+        
+        self.__mtime = self.__util_mtime()
+        
+        snapshot = self.__parse(cp)
+        
+        changed = set()
+        for key, old, new in zip(_DEFAULTS.keys(), self.__snapshot, snapshot):
+            if old != new:
+                changed.add(key)
+        xold = dict(i for i in self.__cp.items(self.player)
+                    if i[0].startswith("x-"))
+        xnew = dict(i for i in cp.items(self.player) if i[0].startswith("x-"))
+        for key in set(xold) | set(xnew):
+            if xold.get(key) != xnew.get(key):
+                changed.add(key)
+        
+        self.__cp, self.__snapshot = cp, snapshot
+        
+        if not changed:
+            return False
+        
+        log.info("config reloaded, changed options: %s" %
+                 ", ".join(sorted(changed)))
+        
+        if "log-level" in changed:
+            log.set_level(self.log_level)
+        
+        for fn in list(self.__subscribers):
             try:
-                return converter(value)
+                fn(changed)
             except Exception as e:
-                log.error("malformed option '%s: %s' (%s)" % (attr, e))
-                return converter(_DEFAULTS[attr])
+                log.exception("** BUG ** %s", e)
+        
+        return False
+    
+    def is_default(self, key):
+        """Check if a standard option has its default value.
+        
+        @param key:
+            config option name (e.g. 'wifi-port')
+        
+        """
+        return self.__cp.get(self.player, key) == _DEFAULTS[key]
     
     def getx(self, key, default, converter=None, save=True):
         """Get the value of a non-standard, player specific option.
@@ -266,8 +461,51 @@ class Config(object):
             log.error("malformed option '%s: %s' (%s)" % (key, value, e))
             return converter(default) # if this fails then, it's a bug
 
+    def __parse(self, cp):
+        """Parse all standard options into a snapshot."""
+        
+        values = []
+        for key in _DEFAULTS.keys():
+            value = cp.get(self.player, key)
+            converter = _OPTIONS[key][1] or (lambda v: v)
+            try:
+                values.append(converter(value))
+            except Exception as e:
+                log.error("malformed option '%s: %s' (%s)" % (key, value, e))
+                values.append(converter(_DEFAULTS[key]))
+        return _Snapshot(*values)
+    
+    def __on_file_changed(self, monitor, file, other, event):
+        
+        if self.__util_mtime() != self.__mtime:
+            self.reload()
+    
+    def __util_mtime(self):
+        
+        try:
+            return getmtime(self.file)
+        except OSError:
+            return None
+    
     def __save(self):
-        """Save config to it's file."""
+        """Save config to it's file.
+        
+        Saving is deferred a bit, so that a burst of changes results in one
+        write. Without a running main loop, the config is saved immediately.
+        
+        """
+        if not _loop_running():
+            if self.__save_sid > 0:
+                GObject.source_remove(self.__save_sid)
+            self.__save_now()
+        elif self.__save_sid == 0:
+            self.__save_sid = GObject.timeout_add(_SAVE_DELAY, self.__save_now)
+            _unsaved.add(self)
+        
+    def __save_now(self):
+        
+        self.__save_sid = 0
+        _unsaved.discard(self)
         
         doc = [_DOC_HEADER]
         for key in _DEFAULTS.keys():
@@ -277,13 +515,42 @@ class Config(object):
             doc.append(idoc)
         doc = "\n".join(doc)
         
+        buff = io.StringIO()
+        buff.write(doc)
+        buff.write("\n\n")
+        self.__cp.write(buff)
+        content = buff.getvalue()
+        
         try:
-            with open(self.file, 'w') as fp:
-                fp.write(doc)
-                fp.write("\n\n")
-                self.__cp.write(fp)
-        except IOError as e:
+            with open(self.file, 'r') as fp:
+                if fp.read() == content:
+                    return False # nothing changed
+        except IOError:
+            pass
+        
+        # write to a temporary file first, so that the config file is always
+        # complete (even if writing fails)
+        tmp = None
+        try:
+            fd, tmp = tempfile.mkstemp(prefix=".%s." % basename(self.file),
+                                       dir=self.dir)
+            with os.fdopen(fd, 'w') as fp:
+                fp.write(content)
+                fp.flush()
+                os.fsync(fp.fileno())
+            if exists(self.file):
+                shutil.copymode(self.file, tmp)
+            else:
+                os.chmod(tmp, 0o644)
+            os.rename(tmp, self.file)
+        except (IOError, OSError) as e:
             log.warning("failed to save config to %s (%s)" % (self.file, e))
+            if tmp is not None and exists(tmp):
+                os.remove(tmp)
+        
+        self.__mtime = self.__util_mtime() # do not reload own changes
+        
+        return False
 
     def __cleanup(self):
         """Trash obsolete config and cache data from older versions."""
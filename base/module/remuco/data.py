@@ -22,14 +22,22 @@
 
 """Data containers to send to and receive from clients."""
 
+import collections
+import os.path
 import tempfile
 import PIL
 from PIL import Image
 import urllib
 
 from remuco import log
+from remuco import metrics
 from remuco import serial
 
+_THUMB_CACHE_SIZE = 8
+
+# (image file, modification time, size, type) -> thumbnail data
+_thumb_cache = collections.OrderedDict()
+
 # =============================================================================
 # outgoing data (to clients)
 # =============================================================================
@@ -93,6 +101,51 @@ class PlayerState(serial.Serializable):
         return (self.playback, self.volume, self.position,
                 self.repeat, self.shuffle, self.queue)
 
+class PlayerStateDelta(serial.Serializable):
+    """ Parameter of the state delta sync message sent to clients.
+    
+    The first value is a bit mask of the PlayerState fields which changed
+    (bit 0: playback, 1: volume, 2: position, 3: repeat, 4: shuffle,
+    5: queue). It is followed by the new values of only these fields, in the
+    same order and with the same types as in a PlayerState.
+    
+    """
+    
+    def __init__(self, state, old):
+        """Create a new state delta.
+        
+        @param state:
+            the current PlayerState
+        @param old:
+            data of the PlayerState to compute the delta against (as returned
+            by PlayerState.get_data())
+        
+        """
+        self.mask = 0
+        self.__fmt = [serial.TYPE_Y]
+        self.__data = [0]
+        
+        for i, (type, vold, vnew) in enumerate(zip(state.get_fmt(), old,
+                                                   state.get_data())):
+            if vold != vnew:
+                self.mask |= 1 << i
+                self.__fmt.append(type)
+                self.__data.append(vnew)
+                
+        self.__data[0] = self.mask
+        
+    def __str__(self):
+        
+        return "(%X, %s)" % (self.mask, self.__data[1:])
+        
+    # === serial interface ===
+        
+    def get_fmt(self):
+        return tuple(self.__fmt)
+        
+    def get_data(self):
+        return tuple(self.__data)
+
 class Progress(serial.Serializable):
     """ Parameter of the progress sync message sent to clients."""
     
@@ -112,6 +165,43 @@ class Progress(serial.Serializable):
     def get_data(self):
         return (self.progress, self.length)
 
+class ProgressExt(serial.Serializable):
+    """ Parameter of the extended progress sync message sent to clients.
+    
+    In contrast to Progress, this is only sent on discontinuities (seek,
+    pause, item change, ...). Clients are supposed to interpolate the
+    progress on their own, based on the playback rate.
+    
+    """
+    
+    def __init__(self):
+        
+        self.progress = 0 # milliseconds
+        self.length = 0 # milliseconds
+        self.rate = 0 # progress per mille of real time, 0 if not advancing
+        self.timestamp = 0 # server time (milliseconds since epoch)
+        
+    def __str__(self):
+        return "(%d/%d, %d, %d)" % (self.progress, self.length, self.rate,
+                                    self.timestamp)
+        
+    def at(self, timestamp):
+        """Get the interpolated progress at the given time."""
+        
+        progress = self.progress
+        progress += (timestamp - self.timestamp) * self.rate // 1000
+        if self.length > 0:
+            progress = min(progress, self.length)
+        return progress
+        
+    # === serial interface ===
+        
+    def get_fmt(self):
+        return (serial.TYPE_I, serial.TYPE_I, serial.TYPE_I, serial.TYPE_L)
+        
+    def get_data(self):
+        return (self.progress, self.length, self.rate, self.timestamp)
+
 class Item(serial.Serializable):
     """ Parameter of the item sync message sent to clients."""
     
@@ -163,6 +253,21 @@ class Item(serial.Serializable):
             
         if not img:
             return []
+        
+        # clients with equal image preferences get the same thumbnail
+        key = None
+        if isinstance(img, str):
+            try:
+                key = (img, os.path.getmtime(img), img_size, img_type)
+            except OSError:
+                pass
+        if key in _thumb_cache:
+            _thumb_cache.move_to_end(key)
+            if metrics.enabled:
+                metrics.inc(metrics.CACHE_HITS, "thumbnail")
+            return _thumb_cache[key]
+        if metrics.enabled:
+            metrics.inc(metrics.CACHE_MISSES, "thumbnail")
     
         try:
             if not isinstance(img, Image.Image):
@@ -175,6 +280,10 @@ class Item(serial.Serializable):
             file_tmp.seek(0)
             thumb = file_tmp.read()
             file_tmp.close()
+            if key is not None:
+                _thumb_cache[key] = thumb
+                if len(_thumb_cache) > _THUMB_CACHE_SIZE:
+                    _thumb_cache.popitem(last=False)
             return thumb
         except IOError as e:
             log.warning("failed to thumbnail %s (%s)" % (img, e))
@@ -248,6 +357,7 @@ class ClientInfo(serial.Serializable):
         self.img_type = None
         self.page_size = 0
         self.device = {}
+        self.features = 0 # client features (see features.CF_...)
 
     # === serial interface ===
         
@@ -259,6 +369,12 @@ class ClientInfo(serial.Serializable):
         self.img_size, self.img_type, self.page_size, dev_keys, dev_vals = data
         for key, value in zip(dev_keys, dev_vals):
             self.device[key] = value
+        try:
+            self.features = int(self.device.get("features", "0"))
+        except ValueError:
+            log.warning("malformed client features: %s" %
+                        self.device.get("features"))
+            self.features = 0
 
 class Control(serial.Serializable):
     """ Parameter of control messages from clients with integer arguments."""
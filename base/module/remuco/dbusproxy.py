@@ -0,0 +1,410 @@
+# =============================================================================
+#
+#    Remuco - A remote control system for media players.
+#    Copyright (C) 2006-2010 by the Remuco team, see AUTHORS.
+#
+#    This file is part of Remuco.
+#
+#    Remuco is free software: you can redistribute it and/or modify
+#    it under the terms of the GNU General Public License as published by
+#    the Free Software Foundation, either version 3 of the License, or
+#    (at your option) any later version.
+#
+#    Remuco is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#    GNU General Public License for more details.
+#
+#    You should have received a copy of the GNU General Public License
+#    along with Remuco.  If not, see <http://www.gnu.org/licenses/>.
+#
+# =============================================================================
+
+
+"""Asynchronous calls of DBus methods for player adapters.
+
+A DBusProxy wraps a DBus object of a media player. Compared to using a plain
+dbus.Interface, it provides these features:
+
+* Method calls never block: results get passed to reply handlers, errors to
+  error handlers (or get logged if there is no error handler).
+* Method calls time out after a few seconds (instead of DBus' default of
+  25 seconds), so that hanging players get noticed quickly.
+* Independent calls (e.g. getting position, playback state and volume when
+  polling a player) may be issued as a batch, i.e. as parallel pending calls
+  with one reply handler for all results.
+* Calls go to the player's well known bus name, so they reach a new owner
+  of that name (e.g. when the player has been restarted) without
+  reconnecting. Calls which failed because the owner disappeared get
+  retried once as soon as the name has a new owner.
+* The latency of calls gets recorded per method. Statistics are written to
+  the log on diagnostic dumps (see manager.add_dump_fn()) and exported as
+  metrics (if enabled).
+
+"""
+
+import time
+
+from gi.repository import GObject
+
+from remuco import log
+from remuco import manager
+from remuco import metrics
+
+try:
+    import dbus
+    from dbus.exceptions import DBusException
+except ImportError:
+    log.warning("dbus not available - dbus using player adapters will crash")
+
+# =============================================================================
+# constants
+# =============================================================================
+
+DEFAULT_TIMEOUT = 5.0 # seconds
+
+# errors indicating that a bus name's owner disappeared or has been replaced
+RETRY_ERRORS = ("org.freedesktop.DBus.Error.ServiceUnknown",
+                "org.freedesktop.DBus.Error.NameHasNoOwner",
+                "org.freedesktop.DBus.Error.Disconnected")
+
+_RETRIES = 1
+
+# =============================================================================
+# call statistics
+# =============================================================================
+
+class _Stats(object):
+    """Latency statistics of a DBus method."""
+    
+    def __init__(self):
+        
+        self.num = 0
+        self.errors = 0
+        self.sum = 0.0
+        self.max = 0.0
+        
+    def add(self, seconds, failed):
+        
+        self.num += 1
+        self.errors += failed and 1 or 0
+        self.sum += seconds
+        self.max = max(self.max, seconds)
+        
+    def __str__(self):
+        
+        return ("n=%d errors=%d avg=%.1fms max=%.1fms" %
+                (self.num, self.errors, self.sum * 1000 / max(self.num, 1),
+                 self.max * 1000))
+
+_stats = {} # method label -> _Stats
+
+def _record(label, start, failed):
+    
+    seconds = time.time() - start
+    
+    stats = _stats.get(label)
+    if stats is None:
+        stats = _stats[label] = _Stats()
+    stats.add(seconds, failed)
+    
+    if metrics.enabled:
+        metrics.observe(metrics.DBUS_CALL_DURATION, label, seconds)
+        if failed:
+            metrics.inc(metrics.DBUS_CALL_ERRORS, label)
+
+def report():
+    """Get call statistics of all methods as a multi line string."""
+    
+    return "\n".join(["%-40s %s" % (label, _stats[label])
+                      for label in sorted(_stats)])
+
+def _dump():
+    
+    log.info("dbus call statistics:\n%s" % (report() or "none"))
+
+# =============================================================================
+# proxy
+# =============================================================================
+
+def _ignore(*args):
+    """Reply handler for calls whose result is not of interest."""
+    
+    pass
+
+def _log_error(error):
+    """Error handler for calls without an explicit error handler."""
+    
+    log.warning("dbus error: %s" % error)
+
+class _Batch(object):
+    """State of a batch of calls."""
+    
+    def __init__(self, num, reply_handler, error_handler):
+        
+        self.results = [None] * num
+        self.pending = num
+        self.failed = False
+        self.reply_handler = reply_handler
+        self.error_handler = error_handler
+        
+    def reply_handler_for(self, i):
+        """Get a reply handler for the i-th call."""
+        
+        def reply(*result):
+            
+            if self.failed:
+                return
+            
+            if len(result) == 1:
+                result = result[0]
+            elif not result:
+                result = None
+            self.results[i] = result
+            
+            self.pending -= 1
+            if self.pending == 0:
+                self.reply_handler(self.results)
+        
+        return reply
+    
+    def error(self, error):
+        
+        if self.failed:
+            return
+        
+        self.failed = True
+        self.error_handler(error)
+
+class DBusProxy(object):
+    """Proxy for calling methods of a DBus object asynchronously.
+    
+    Methods of the proxied DBus interface may be called like methods of a
+    dbus.Interface, e.g.:
+    
+        proxy = DBusProxy("org.mpris.foo", "/Player",
+                          "org.freedesktop.MediaPlayer")
+        proxy.VolumeSet(50)
+        proxy.VolumeGet(reply_handler=on_volume, error_handler=on_error)
+    
+    Unlike with dbus.Interface, calls are always asynchronous: without a
+    reply handler a call's result gets ignored, without an error handler
+    errors get logged. Additionally a call may set a specific timeout (in
+    seconds) with the keyword 'timeout'.
+    
+    Replies for calls still pending when the proxy gets closed are dropped.
+    
+    """
+    def __init__(self, bus_name, path, iface, timeout=DEFAULT_TIMEOUT,
+                 bus=None):
+        """Create a new proxy.
+        
+        @param bus_name:
+            the player's well known bus name
+        @param path:
+            the object path
+        @param iface:
+            the interface to use for method calls and signals
+        @keyword timeout:
+            default timeout for method calls (seconds)
+        @keyword bus:
+            the bus to use (default is the session bus)
+        
+        @raise DBusException: if connecting to the bus fails
+        
+        """
+        self.__bus_name = bus_name
+        self.__path = path
+        self.__iface = iface
+        self.__timeout = timeout
+        self.__closed = False
+        self.__new_owners = 0 # number of times the name got a new owner
+        self.__parked = [] # calls waiting for a new owner, see __park()
+        
+        self.__bus = bus or dbus.SessionBus()
+        
+        # no blocking owner lookup or introspection, calls go to the name
+        self.__obj = self.__bus.get_object(bus_name, path,
+                                           introspect=False,
+                                           follow_name_owner_changes=True)
+        
+        self.__owner_watch = self.__bus.add_signal_receiver(
+            self.__on_owner_change, "NameOwnerChanged",
+            dbus.BUS_DAEMON_IFACE, dbus.BUS_DAEMON_NAME, dbus.BUS_DAEMON_PATH,
+            arg0=bus_name)
+        
+        manager.add_dump_fn(_dump)
+        
+    def __getattr__(self, name):
+        
+        if name.startswith("_"):
+            raise AttributeError(name)
+        
+        def method(*args, **kwargs):
+            self.call(name, *args, **kwargs)
+        
+        return method
+    
+    def call(self, method, *args, **kwargs):
+        """Call a method asynchronously.
+        
+        @param method:
+            name of the method to call
+        @param args:
+            the method's arguments
+        @keyword reply_handler:
+            function to call with the method's return values
+        @keyword error_handler:
+            function to call with a DBusException if the call fails
+        @keyword timeout:
+            timeout in seconds (default is the proxy's timeout)
+        
+        """
+        reply_handler = kwargs.pop("reply_handler", None) or _ignore
+        error_handler = kwargs.pop("error_handler", None) or _log_error
+        timeout = kwargs.pop("timeout", None) or self.__timeout
+        if kwargs:
+            raise TypeError("unexpected keywords: %s" % ", ".join(kwargs))
+        
+        self.__call(method, args, reply_handler, error_handler, timeout,
+                    _RETRIES)
+    
+    def batch(self, calls, reply_handler, error_handler=None, timeout=None):
+        """Call several independent methods in parallel.
+        
+        All calls get issued at once, i.e. the total duration is about the
+        duration of the slowest call (instead of the sum of all calls'
+        durations when issuing them one after another).
+        
+        @param calls:
+            list of calls, each given as a tuple of the method name and a
+            tuple of arguments
+        @param reply_handler:
+            function to call with a list of all calls' results (in the order
+            of 'calls') once all calls succeeded - a call's result is None
+            if a method has no return value and a tuple if it has multiple
+            return values
+        @keyword error_handler:
+            function to call with the first error if any of the calls fails
+        @keyword timeout:
+            timeout in seconds for each call (default is the proxy's timeout)
+        
+        """
+        if not calls:
+            reply_handler([])
+            return
+        
+        batch = _Batch(len(calls), reply_handler, error_handler or _log_error)
+        
+        for i, (method, args) in enumerate(calls):
+            self.__call(method, args, batch.reply_handler_for(i),
+                        batch.error, timeout or self.__timeout, _RETRIES)
+    
+    def connect_to_signal(self, signal, handler, **kwargs):
+        """Connect to a signal of the proxied DBus object.
+        
+        Signal subscriptions stay valid if the bus name's owner changes.
+        
+        @return: a match object whose method remove() disconnects the
+            handler
+        
+        """
+        return self.__bus.add_signal_receiver(handler, signal, self.__iface,
+                                              self.__bus_name, self.__path,
+                                              **kwargs)
+    
+    def close(self):
+        """Close the proxy.
+        
+        Replies for pending calls get dropped, new calls get ignored.
+        
+        """
+        if self.__closed:
+            return
+        
+        self.__closed = True
+        self.__obj = None
+        self.__owner_watch.remove()
+        
+        for retry, error_handler, error, sid in self.__parked:
+            GObject.source_remove(sid)
+        self.__parked = []
+    
+    def __call(self, method, args, reply_handler, error_handler, timeout,
+               retries):
+        
+        if self.__closed:
+            log.debug("proxy closed, ignore call of %s" % method)
+            return
+        
+        label = "%s.%s" % (self.__iface.split(".")[-1], method)
+        t_start = time.time()
+        new_owners = self.__new_owners
+        
+        def on_reply(*result):
+            
+            _record(label, t_start, False)
+            if not self.__closed:
+                reply_handler(*result)
+        
+        def on_error(error):
+            
+            _record(label, t_start, True)
+            if self.__closed:
+                return
+            name = getattr(error, "get_dbus_name", lambda: None)()
+            if retries > 0 and name in RETRY_ERRORS:
+                retry = lambda: self.__call(method, args, reply_handler,
+                                            error_handler, timeout,
+                                            retries - 1)
+                if new_owners != self.__new_owners:
+                    # name got a new owner while the call was pending
+                    log.debug("call of %s failed (%s), retry" % (label, name))
+                    retry()
+                else:
+                    log.debug("call of %s failed (%s), retry when the name "
+                              "has a new owner" % (label, name))
+                    self.__park(retry, error_handler, error, timeout)
+            else:
+                error_handler(error)
+        
+        try:
+            fn = self.__obj.get_dbus_method(method, self.__iface)
+            fn(*args, reply_handler=on_reply, error_handler=on_error,
+               timeout=timeout)
+        except DBusException as e:
+            on_error(e)
+    
+    def __on_owner_change(self, name, old, new):
+        
+        log.debug("owner of %s changed: '%s' -> '%s'" % (name, old, new))
+        
+        if not new: # owner is gone, calls wait for a new one
+            return
+        
+        self.__new_owners += 1
+        
+        parked, self.__parked = self.__parked, []
+        for retry, error_handler, error, sid in parked:
+            GObject.source_remove(sid)
+            retry()
+    
+    def __park(self, retry, error_handler, error, timeout):
+        """Keep a failed call until the bus name gets a new owner.
+        
+        If there is no new owner within 'timeout' seconds, the error handler
+        gets called with the call's original error.
+        
+        """
+        entry = [retry, error_handler, error, 0]
+        entry[3] = GObject.timeout_add(int(timeout * 1000), self.__expire,
+                                       entry)
+        self.__parked.append(entry)
+    
+    def __expire(self, entry):
+        
+        if entry in self.__parked:
+            self.__parked.remove(entry)
+            entry[1](entry[2])
+        
+        return False
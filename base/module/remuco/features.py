@@ -55,3 +55,8 @@ FT_REQ_MLIB = 1 << 28
 
 FT_SHUTDOWN = 1 << 30
 
+# --- client features (announced by clients in the device info) ---
+
+CF_PROGRESS_EXT = 1 << 0
+CF_STATE_DELTA = 1 << 1
+
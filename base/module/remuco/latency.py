@@ -0,0 +1,212 @@
+# =============================================================================
+#
+#    Remuco - A remote control system for media players.
+#    Copyright (C) 2006-2010 by the Remuco team, see AUTHORS.
+#
+#    This file is part of Remuco.
+#
+#    Remuco is free software: you can redistribute it and/or modify
+#    it under the terms of the GNU General Public License as published by
+#    the Free Software Foundation, either version 3 of the License, or
+#    (at your option) any later version.
+#
+#    Remuco is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#    GNU General Public License for more details.
+#
+#    You should have received a copy of the GNU General Public License
+#    along with Remuco.  If not, see <http://www.gnu.org/licenses/>.
+#
+# =============================================================================
+
+"""Optional latency instrumentation for outgoing messages.
+
+When enabled, the time spent in the following stages is recorded per message
+type in histograms:
+
+    dispatch:  from an update_*() call to the corresponding sync callback
+    serialize: serialization of a message (net.build_message())
+    wire:      from queueing a message for a client to its last byte being
+               written to the client's socket
+    total:     from an update_*() call to the last byte of the resulting
+               message being written to a client's socket
+
+Histograms are kept in memory and get written into a file periodically and
+on diagnostic dumps (see manager.add_dump_fn()).
+
+Instrumented code should check 'enabled' before calling any function of this
+module, so that there are no costs if instrumentation is disabled.
+
+"""
+
+import time
+
+from gi.repository import GObject
+
+from remuco import log
+from remuco import manager
+from remuco import message
+
+# =============================================================================
+# constants
+# =============================================================================
+
+DISPATCH = "dispatch"
+SERIALIZE = "serialize"
+WIRE = "wire"
+TOTAL = "total"
+
+_STAGES = (DISPATCH, SERIALIZE, WIRE, TOTAL)
+
+_BUCKETS = 16 # bucket i counts durations below 2^i ms, last one the rest
+
+# =============================================================================
+# state
+# =============================================================================
+
+enabled = False
+
+_hists = {} # (message ID, stage) -> _Histogram
+_file = None
+_sid = 0
+
+# =============================================================================
+# histogram
+# =============================================================================
+
+class _Histogram(object):
+    """Histogram of durations in milliseconds with exponential buckets."""
+
+    def __init__(self):
+
+        self.counts = [0] * _BUCKETS
+        self.num = 0
+        self.sum = 0.0
+        self.max = 0.0
+
+    def add(self, ms):
+
+        self.num += 1
+        self.sum += ms
+        self.max = max(self.max, ms)
+
+        bucket, limit = 0, 1
+        while ms >= limit and bucket < _BUCKETS - 1:
+            bucket += 1
+            limit <<= 1
+        self.counts[bucket] += 1
+
+    def percentile(self, p):
+        """Get the upper limit (in ms) of the bucket containing a percentile."""
+
+        threshold = self.num * p / 100.0
+        acc = 0
+        for bucket, count in enumerate(self.counts):
+            acc += count
+            if acc >= threshold:
+                return 1 << bucket
+        return 1 << _BUCKETS
+
+    def __str__(self):
+
+        return ("n=%d avg=%.1fms max=%.1fms p50<%dms p90<%dms p99<%dms" %
+                (self.num, self.sum / max(self.num, 1), self.max,
+                 self.percentile(50), self.percentile(90),
+                 self.percentile(99)))
+
+# =============================================================================
+# recording
+# =============================================================================
+
+def now():
+    """Get a timestamp to pass to record() later."""
+
+    return time.time()
+
+def record(msg_id, stage, start):
+    """Record the duration of a stage which began at 'start' and ends now."""
+
+    key = (msg_id, stage)
+    hist = _hists.get(key)
+    if hist is None:
+        hist = _hists[key] = _Histogram()
+    hist.add((time.time() - start) * 1000)
+
+# =============================================================================
+# reporting
+# =============================================================================
+
+def report():
+    """Get all histograms as a multi line string."""
+
+    lines = []
+    for msg_id, stage in sorted(_hists.keys(),
+                                key=lambda k: (k[0], _STAGES.index(k[1]))):
+        lines.append("%-18s %-9s %s" % (message.name(msg_id), stage,
+                                        _hists[(msg_id, stage)]))
+    return "\n".join(lines)
+
+def dump():
+    """Write all histograms into the log and into the latency file."""
+
+    rep = report() or "no messages sent yet"
+
+    log.info("latency stats:\n%s" % rep)
+
+    if _file is not None:
+        try:
+            with open(_file, "w") as fp:
+                fp.write(rep)
+                fp.write("\n")
+        except IOError as e:
+            log.warning("failed to write latency stats (%s)" % e)
+
+    return True # keep periodic dumps going
+
+# =============================================================================
+# setup
+# =============================================================================
+
+def enable(file, ival):
+    """Enable instrumentation.
+
+    @param file:
+        file to write histograms to
+    @param ival:
+        interval in seconds to write histograms to the file (0 means only on
+        diagnostic dumps)
+
+    """
+    global enabled, _file, _sid
+
+    disable()
+
+    enabled = True
+    _file = file
+    _hists.clear()
+
+    if ival > 0:
+        _sid = GObject.timeout_add_seconds(ival, dump)
+
+    manager.add_dump_fn(dump)
+
+    log.info("latency instrumentation enabled (stats go to %s)" % file)
+
+def disable():
+    """Disable instrumentation (writes histograms a last time)."""
+
+    global enabled, _sid
+
+    if not enabled:
+        return
+
+    dump()
+
+    enabled = False
+
+    if _sid > 0:
+        GObject.source_remove(_sid)
+        _sid = 0
+
+    manager.remove_dump_fn(dump)
@@ -20,7 +20,12 @@
 #
 # =============================================================================
 
+import atexit
+import copy
 import logging
+import logging.handlers
+import os.path
+import queue
 
 DEBUG = logging.DEBUG
 INFO = logging.INFO
@@ -39,9 +44,14 @@ class _config:
     FMTX = logging.Formatter("%(levelname)s: %(message)s (check the log for "
                              "details)")
     
+    FILE_MAX_SIZE = 2 * 1024 * 1024 # rotate log file when exceeding this size
+    FILE_BACKUPS = 2 # number of rotated log files to keep
+    QUEUE_SIZE = 10000 # max. number of log records waiting to get written
+    
     handler_stdout = logging.StreamHandler()
     handler_stdout.setFormatter(FMT)
     handler = handler_stdout
+    listener = None # writes queued log records to a log file
     
     logga = logging.getLogger("remuco")
     logga.addHandler(handler)
@@ -51,38 +61,126 @@ class _config:
 # log functions
 #===============================================================================
 
+# On frequently executed code paths, pass format arguments separately (e.g.
+# log.debug("sent %d bytes", n) instead of log.debug("sent %d bytes" % n)) so
+# that messages only get formatted if they actually get logged. If computing
+# an argument is expensive by itself, check is_enabled() first.
+
 debug = _config.logga.debug
 info = _config.logga.info
 warning = _config.logga.warning
 error = _config.logga.error
 exception = _config.logga.exception
 
+def is_enabled(level):
+    """Check if messages of the given level get logged."""
+    
+    return _config.logga.isEnabledFor(level)
+
 #===============================================================================
 # configuration functions
 #===============================================================================
 
+class _QueueHandler(logging.handlers.QueueHandler):
+    """Queue handler which drops (and counts) records if the queue is full.
+    
+    Records get written to the log file by a QueueListener in a background
+    thread, so logging never blocks on file I/O.
+    
+    """
+    def __init__(self, q):
+        
+        super(_QueueHandler, self).__init__(q)
+        
+        self.dropped = 0
+        self.__dropped_reported = 0
+    
+    def prepare(self, record):
+        
+        # Only merge arguments into the message here (they may change after
+        # this call), everything else is formatted by the listener thread.
+        record = copy.copy(record)
+        record.msg = record.getMessage()
+        record.args = None
+        if record.exc_info:
+            record.exc_text = _config.FMT.formatException(record.exc_info)
+            record.exc_info = None
+        return record
+    
+    def enqueue(self, record):
+        
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+            return
+        
+        if self.dropped > self.__dropped_reported:
+            notice = logging.makeLogRecord({
+                "name": record.name, "levelno": WARNING,
+                "levelname": "WARNING", "filename": "log.py",
+                "lineno": 0, "msg": "dropped %d log messages (queue full)" %
+                                    (self.dropped - self.__dropped_reported)})
+            try:
+                self.queue.put_nowait(notice)
+                self.__dropped_reported = self.dropped
+            except queue.Full:
+                pass
+
+class _QueueListener(logging.handlers.QueueListener):
+    """Queue listener which can be stopped even if the queue is full."""
+    
+    def enqueue_sentinel(self):
+        
+        self.queue.put(self._sentinel) # wait for room instead of failing
+
+def _stop_listener():
+    """Write pending log records and stop the file writer thread."""
+    
+    if _config.listener is not None:
+        _config.listener.stop()
+        _config.listener.handlers[0].close()
+        _config.listener = None
+
+atexit.register(_stop_listener)
+
 def set_file(file):
-    """Set log file (pass None to log to stdout)."""
- 
+    """Set log file (pass None to log to stdout).
+    
+    Log records get written to the file by a background thread. The file gets
+    rotated if it grows too big. A non-empty log file of a previous run gets
+    rotated when setting the file (i.e. it is kept as FILE.1 instead of being
+    overwritten).
+    
+    """
     new_handler = None
     if file is not None:
         try:
-            new_handler = logging.FileHandler(file, 'w')
-        except IOError as e:
+            file_handler = logging.handlers.RotatingFileHandler(file,
+                maxBytes=_config.FILE_MAX_SIZE,
+                backupCount=_config.FILE_BACKUPS)
+            if os.path.getsize(file) > 0: # keep log of previous run
+                file_handler.doRollover()
+        except (IOError, OSError) as e:
             print("failed to set up log handler (%s)" % e)
             return
-        new_handler.setFormatter(_config.FMT)
+        file_handler.setFormatter(_config.FMT)
+        new_handler = _QueueHandler(queue.Queue(_config.QUEUE_SIZE))
+        new_handler.setLevel(_config.logga.level)
         print("Log output will be stored in %s" % file)
         print("Contribute to Remuco: Please run 'remuco-report' once a client "
               "has connected, thanks!")
     
     if _config.handler != _config.handler_stdout:
         _config.logga.removeHandler(_config.handler)
+    _stop_listener()
     if new_handler:
         _config.handler_stdout.setLevel(ERROR)
         _config.handler_stdout.setFormatter(_config.FMTX)
         _config.logga.addHandler(new_handler)
         _config.handler = new_handler
+        _config.listener = _QueueListener(new_handler.queue, file_handler)
+        _config.listener.start()
     else:
         _config.handler_stdout.setLevel(_config.logga.level)
         _config.handler_stdout.setFormatter(_config.FMT)
@@ -22,11 +22,17 @@
 
 """Manage life cycle of stand-alone (not plugin based) player adapters."""
 
+import os
 import signal
+import sys
+import threading
+import time
+import traceback
 
 from gi.repository import GConf, GObject
 
 from remuco import log
+from remuco import metrics
 
 try:
     import dbus
@@ -47,6 +53,195 @@ def _sighandler(signum, frame):
     if _ml is not None:
         _ml.quit()
 
+# =============================================================================
+# diagnostic dumps
+# =============================================================================
+
+_dump_fns = []
+
+def add_dump_fn(fn):
+    """Add a function to call for dumping diagnostic information.
+    
+    Dump functions get called in the main loop when receiving SIGUSR1 (for
+    stand-alone adapters only).
+    
+    """
+    if fn not in _dump_fns:
+        _dump_fns.append(fn)
+
+def remove_dump_fn(fn):
+    """Remove a function previously added with add_dump_fn()."""
+    
+    if fn in _dump_fns:
+        _dump_fns.remove(fn)
+
+def _sigdump(signum, frame):
+    
+    GObject.idle_add(_dump)
+
+def _dump():
+    
+    for fn in list(_dump_fns):
+        try:
+            fn()
+        except Exception as e:
+            log.exception("** BUG ** %s", e)
+    
+    return False
+
+# =============================================================================
+# main loop lag monitor
+# =============================================================================
+
+_LAG_TICK = 50 # ms
+
+lag_monitoring = False
+
+_lagmon = None
+
+def activity_begin(label):
+    """Tell the lag monitor what the main loop is going to do now.
+    
+    Call this only if 'lag_monitoring' is True.
+    
+    @param label:
+        description of the activity (e.g. a message or method name)
+    
+    @return: a token to pass to activity_end() when the activity is done
+    
+    """
+    return _lagmon.begin(label)
+
+def activity_end(token):
+    """Tell the lag monitor that an activity is done.
+    
+    @param token:
+        the token returned by the corresponding activity_begin()
+    
+    """
+    _lagmon.end(token)
+
+class _LagMonitor(object):
+    """Watchdog for the main loop.
+    
+    A high frequency timer measures how late the main loop dispatches it and
+    reports that delay to the metrics (this is the only source of the main
+    loop lag metric). A watchdog thread logs a stack sample of the main
+    loop's thread if the timer has not been dispatched within the threshold.
+    Code which may block the main loop labels its activities (see
+    activity_begin()), so that overruns can be attributed to them.
+    
+    """
+    def __init__(self, threshold):
+        """Create and start a new lag monitor.
+        
+        @param threshold:
+            main loop blocking time in milliseconds which is considered as a
+            stall, 0 disables the watchdog (only lag metrics get reported)
+        
+        """
+        self.__threshold = threshold / 1000.0
+        self.__activity = None # (label, start time)
+        self.__main = threading.current_thread().ident
+        
+        self.__beat = time.time()
+        self.__due = self.__beat + _LAG_TICK / 1000.0
+        self.__sampled = False
+        
+        self.__sid = GObject.timeout_add(_LAG_TICK, self.__tick,
+                                         priority=GObject.PRIORITY_HIGH)
+        
+        self.__stop = threading.Event()
+        
+        if threshold > 0:
+            self.__thread = threading.Thread(target=self.__watch,
+                                             name="lag monitor")
+            self.__thread.daemon = True
+            self.__thread.start()
+        else:
+            self.__thread = None
+        
+    def begin(self, label):
+        
+        token = self.__activity
+        self.__activity = (label, time.time())
+        return token
+    
+    def end(self, token):
+        
+        label, start = self.__activity
+        self.__activity = token
+        
+        duration = time.time() - start
+        if self.__thread is not None and duration > self.__threshold:
+            log.warning("slow callback: %s took %d ms" %
+                        (label, duration * 1000))
+    
+    def stop(self):
+        
+        self.__stop.set()
+        if self.__thread is not None:
+            self.__thread.join(1)
+        
+        GObject.source_remove(self.__sid)
+        
+    def __tick(self):
+        
+        now = time.time()
+        
+        lag = max(0, now - self.__due)
+        
+        self.__beat = now
+        self.__due = now + _LAG_TICK / 1000.0
+        self.__sampled = False
+        
+        if metrics.enabled:
+            metrics.lag(lag)
+        
+        return True
+    
+    def __watch(self):
+        """Watchdog thread."""
+        
+        while not self.__stop.wait(self.__threshold / 2):
+            
+            stalled = time.time() - self.__beat
+            if stalled < self.__threshold or self.__sampled:
+                continue
+            
+            self.__sampled = True # one sample per stall
+            
+            activity = self.__activity
+            frame = sys._current_frames().get(self.__main)
+            stack = frame and "".join(traceback.format_stack(frame)) or "n/a"
+            
+            log.warning("main loop blocked for %d ms in %s, stack sample:\n%s"
+                        % (stalled * 1000, activity and activity[0] or
+                           "unlabeled activity", stack))
+
+def _lagmon_start(threshold):
+    
+    global _lagmon, lag_monitoring
+    
+    _lagmon = _LagMonitor(threshold)
+    lag_monitoring = True
+    
+    if threshold > 0:
+        log.info("lag monitor started (threshold: %d ms)" % threshold)
+    else:
+        log.info("lag monitor started (for metrics only)")
+    
+def _lagmon_stop():
+    
+    global _lagmon, lag_monitoring
+    
+    if _lagmon is None:
+        return
+    
+    lag_monitoring = False
+    _lagmon.stop()
+    _lagmon = None
+
 # =============================================================================
 # start stop functions
 # =============================================================================
@@ -57,7 +252,7 @@ def _start_pa(pa):
     log.info("start player adapter")
     try:
         pa.start()
-    except StandardError as e:
+    except RuntimeError as e:
         log.error("failed to start player adapter (%s)" % e)
         return False
     except Exception as e:
@@ -245,6 +440,7 @@ class Manager(object):
             _ml = GObject.MainLoop()
             signal.signal(signal.SIGINT, _sighandler)
             signal.signal(signal.SIGTERM, _sighandler)
+            signal.signal(signal.SIGUSR1, _sigdump)
         self.__ml = _ml
 
         if dbus_name:
@@ -272,13 +468,21 @@ class Manager(object):
         may get started and stopped multiple times while this method is
         running.
         
+        On SIGHUP the player adapter's configuration gets reloaded.
+        
         """
         if self.__observer is None: # start pa directly
             ready = _start_pa(self.__pa)
         else: # observer will start pa
             ready = True
             
+        if "REMUCO_TESTSHELL" not in os.environ: # testshell uses SIGHUP
+            signal.signal(signal.SIGHUP, self.__sighup)
+        
         if ready and not self.__stopped: # not stopped since creation 
+            config = self.__pa.config
+            if config.lag_threshold > 0 or config.metrics_port > 0:
+                _lagmon_start(config.lag_threshold)
             log.info("start main loop")
             try:
                 self.__ml.run()
@@ -286,6 +490,7 @@ class Manager(object):
                 log.exception("** BUG ** %s", e)
             else:
                 log.info("main loop stopped")
+            _lagmon_stop()
             
         if self.__observer: # stop observer
             self.__observer.stop()
@@ -294,6 +499,11 @@ class Manager(object):
         # stop pa
         _stop_pa(self.__pa)
         
+    def __sighup(self, signum, frame):
+        
+        log.info("received SIGHUP, reload config")
+        GObject.idle_add(self.__pa.config.reload)
+        
     def stop(self):
         """Shut down the manager.
         
@@ -42,6 +42,8 @@ _SYNC = 200
 SYNC_STATE = _SYNC
 SYNC_PROGRESS = _SYNC  + 1
 SYNC_ITEM = _SYNC  + 2
+SYNC_PROGRESS_EXT = _SYNC + 3
+SYNC_STATE_DELTA = _SYNC + 4
 
 # =============================================================================
 # control messages
@@ -93,6 +95,7 @@ REQ_SEARCH = _REQ + 5
 _PRIV = 0x10000000
 
 PRIV_INITIAL_SYNC = _PRIV # used internally in server
+PRIV_DISCONNECT = _PRIV + 1 # used internally in server
 
 # =============================================================================
 
@@ -111,3 +114,10 @@ def is_request(id):
 def is_private(id):
     return _is_in_range(_PRIV, id)
 
+
+_NAMES = dict((v, k) for k, v in list(globals().items())
+              if k.isupper() and not k.startswith("_"))
+
+def name(id):
+    """Get the name of a message ID (for logging and statistics)."""
+    return _NAMES.get(id, str(id))
@@ -0,0 +1,362 @@
+# =============================================================================
+#
+#    Remuco - A remote control system for media players.
+#    Copyright (C) 2006-2010 by the Remuco team, see AUTHORS.
+#
+#    This file is part of Remuco.
+#
+#    Remuco is free software: you can redistribute it and/or modify
+#    it under the terms of the GNU General Public License as published by
+#    the Free Software Foundation, either version 3 of the License, or
+#    (at your option) any later version.
+#
+#    Remuco is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#    GNU General Public License for more details.
+#
+#    You should have received a copy of the GNU General Public License
+#    along with Remuco.  If not, see <http://www.gnu.org/licenses/>.
+#
+# =============================================================================
+
+"""Optional metrics of an adapter process in the Prometheus text format.
+
+If enabled (option 'metrics-port'), metrics are served by a small HTTP server
+bound to the loopback interface at 'http://127.0.0.1:PORT/metrics'.
+
+Instrumented code should check 'enabled' before calling any function of this
+module, so that there are no costs if metrics are disabled.
+
+"""
+
+import errno
+import socket
+
+from gi.repository import GObject
+
+from remuco import log
+
+# =============================================================================
+# metrics
+# =============================================================================
+
+CLIENTS = "remuco_clients"
+MSGS_IN = "remuco_messages_received_total"
+BYTES_IN = "remuco_bytes_received_total"
+MSGS_OUT = "remuco_messages_sent_total"
+BYTES_OUT = "remuco_bytes_sent_total"
+SYNC_BROADCASTS = "remuco_sync_broadcasts_total"
+SYNC_COALESCED = "remuco_sync_coalesced_total"
+HANDLER_DURATION = "remuco_handler_duration_seconds"
+POLL_DURATION = "remuco_poll_duration_seconds"
+CACHE_HITS = "remuco_cache_hits_total"
+CACHE_MISSES = "remuco_cache_misses_total"
+MAINLOOP_LAG = "remuco_mainloop_lag_seconds"
+DBUS_CALL_DURATION = "remuco_dbus_call_duration_seconds"
+DBUS_CALL_ERRORS = "remuco_dbus_call_errors_total"
+
+# name -> (type, label name, help)
+_METRICS = {
+    CLIENTS: ("gauge", None, "Number of connected clients."),
+    MSGS_IN: ("counter", "msg", "Messages received from clients."),
+    BYTES_IN: ("counter", "msg", "Bytes received from clients."),
+    MSGS_OUT: ("counter", "msg", "Messages sent to clients."),
+    BYTES_OUT: ("counter", "msg", "Bytes sent to clients."),
+    SYNC_BROADCASTS: ("counter", "sync", "Player changes broadcast to "
+                      "clients."),
+    SYNC_COALESCED: ("counter", "sync", "Player changes merged into an "
+                     "already pending broadcast."),
+    HANDLER_DURATION: ("summary", "msg", "Time spent handling messages from "
+                       "clients."),
+    POLL_DURATION: ("summary", None, "Time spent polling the player."),
+    CACHE_HITS: ("counter", "cache", "Cache hits."),
+    CACHE_MISSES: ("counter", "cache", "Cache misses."),
+    MAINLOOP_LAG: ("gauge", None, "Maximum delay of main loop callbacks "
+                   "since the last scrape (reported by the lag monitor)."),
+    DBUS_CALL_DURATION: ("summary", "call", "Time from calling a player's "
+                         "DBus method to its reply."),
+    DBUS_CALL_ERRORS: ("counter", "call", "Failed DBus method calls."),
+}
+
+_CONN_TIMEOUT = 10 # seconds, max duration of a scrape
+_REQUEST_MAX_SIZE = 8192
+
+# =============================================================================
+# state
+# =============================================================================
+
+enabled = False
+
+_values = {} # (name, label value) -> counter value or [count, sum]
+_gauges = {} # name -> function returning the current value
+_lag_max = None # None as long as the lag monitor reports nothing
+_server = None
+
+# =============================================================================
+# recording
+# =============================================================================
+
+def inc(name, label=None, value=1):
+    """Increase a counter."""
+
+    key = (name, label)
+    _values[key] = _values.get(key, 0) + value
+
+def observe(name, label, seconds):
+    """Add an observation to a summary."""
+
+    key = (name, label)
+    summary = _values.get(key)
+    if summary is None:
+        summary = _values[key] = [0, 0.0]
+    summary[0] += 1
+    summary[1] += seconds
+
+def gauge(name, fn):
+    """Set the function which gets called to get a gauge's current value."""
+
+    _gauges[name] = fn
+
+def lag(seconds):
+    """Report a delay of the main loop (called by the manager's lag
+    monitor)."""
+
+    global _lag_max
+
+    _lag_max = max(_lag_max or 0.0, seconds)
+
+# =============================================================================
+# export
+# =============================================================================
+
+def _escape(value):
+
+    return str(value).replace("\\", "\\\\").replace('"', '\\"')
+
+def render():
+    """Get all metrics in the Prometheus text exposition format."""
+
+    global _lag_max
+
+    lines = []
+
+    for name in sorted(_METRICS):
+
+        mtype, lname, help = _METRICS[name]
+
+        samples = []
+        if name in _gauges:
+            try:
+                samples.append(("", _gauges[name]()))
+            except Exception as e:
+                log.warning("failed to get gauge %s (%s)" % (name, e))
+        elif name == MAINLOOP_LAG and _lag_max is not None:
+            samples.append(("", _lag_max))
+            _lag_max = 0.0
+        for (vname, label), value in sorted(_values.items(),
+                                            key=lambda kv: str(kv[0])):
+            if vname != name:
+                continue
+            labels = ""
+            if lname is not None and label is not None:
+                labels = '{%s="%s"}' % (lname, _escape(label))
+            if mtype == "summary":
+                samples.append(("_count%s" % labels, value[0]))
+                samples.append(("_sum%s" % labels, value[1]))
+            else:
+                samples.append((labels, value))
+
+        lines.append("# HELP %s %s" % (name, help))
+        lines.append("# TYPE %s %s" % (name, mtype))
+        for suffix, value in samples:
+            lines.append("%s%s %s" % (name, suffix, value))
+
+    lines.append("")
+
+    return "\n".join(lines)
+
+# =============================================================================
+# HTTP server
+# =============================================================================
+
+class _Connection(object):
+    """State of a connection to a metrics scraper."""
+
+    def __init__(self):
+
+        self.sid = 0 # I/O watch
+        self.timeout_sid = 0
+        self.data = b'' # received request or response still to send
+
+class _Server(object):
+    """Minimal HTTP server which answers requests for the metrics.
+
+    Sockets are non-blocking and get served by I/O watches in the main loop,
+    so a slow scraper cannot stall the player adapter.
+
+    """
+
+    def __init__(self, port):
+
+        self.__sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        self.__sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        self.__sock.bind(("127.0.0.1", port))
+        self.__sock.listen(5)
+        self.__sock.setblocking(False)
+
+        self.__conns = {} # socket -> _Connection
+
+        self.__sid = GObject.io_add_watch(self.__sock, GObject.IO_IN,
+                                          self.__io_accept)
+
+    def down(self):
+
+        GObject.source_remove(self.__sid)
+
+        for sock in list(self.__conns.keys()):
+            self.__close(sock)
+
+        self.__sock.close()
+
+    def __io_accept(self, fd, cond):
+
+        try:
+            sock, addr = self.__sock.accept()
+        except socket.error as e:
+            log.warning("failed to accept metrics request (%s)" % e)
+            return True
+
+        sock.setblocking(False)
+
+        conn = _Connection()
+        conn.sid = GObject.io_add_watch(sock, GObject.IO_IN | GObject.IO_ERR |
+                                        GObject.IO_HUP, self.__io_recv)
+        conn.timeout_sid = GObject.timeout_add_seconds(_CONN_TIMEOUT,
+                                                       self.__timeout, sock)
+        self.__conns[sock] = conn
+
+        return True
+
+    def __io_recv(self, sock, cond):
+
+        conn = self.__conns[sock]
+
+        chunk = b''
+        if cond & GObject.IO_IN:
+            try:
+                chunk = sock.recv(4096)
+            except socket.error as e:
+                if e.errno in (errno.EAGAIN, errno.EWOULDBLOCK):
+                    return True
+                log.debug("failed to receive metrics request (%s)" % e)
+
+        if not chunk:
+            conn.sid = 0
+            self.__close(sock)
+            return False
+
+        conn.data += chunk
+
+        if b'\r\n\r\n' not in conn.data and len(conn.data) < _REQUEST_MAX_SIZE:
+            return True # wait for rest of request
+
+        request = conn.data.split(b'\r\n', 1)[0].split()
+        if len(request) >= 2 and request[0] == b'GET' and \
+                request[1].split(b'?')[0] in (b'/', b'/metrics'):
+            status = "200 OK"
+            body = render().encode("utf-8")
+        else:
+            status = "404 Not Found"
+            body = b''
+
+        header = ("HTTP/1.0 %s\r\n"
+                  "Content-Type: text/plain; version=0.0.4; charset=utf-8\r\n"
+                  "Content-Length: %d\r\n"
+                  "Connection: close\r\n\r\n" % (status, len(body)))
+
+        # send when the socket is writable
+        conn.data = header.encode("ascii") + body
+        conn.sid = GObject.io_add_watch(sock, GObject.IO_OUT, self.__io_send)
+
+        return False
+
+    def __io_send(self, sock, cond):
+
+        conn = self.__conns[sock]
+
+        try:
+            sent = sock.send(conn.data)
+        except socket.error as e:
+            if e.errno in (errno.EAGAIN, errno.EWOULDBLOCK):
+                return True
+            log.debug("failed to send metrics (%s)" % e)
+            sent = len(conn.data)
+
+        conn.data = conn.data[sent:]
+
+        if conn.data:
+            return True # wait until socket is writable again
+
+        conn.sid = 0
+        self.__close(sock)
+
+        return False
+
+    def __timeout(self, sock):
+
+        log.debug("metrics scrape timed out")
+        self.__conns[sock].timeout_sid = 0
+        self.__close(sock)
+
+        return False
+
+    def __close(self, sock):
+
+        conn = self.__conns.pop(sock)
+        for sid in (conn.sid, conn.timeout_sid):
+            if sid > 0:
+                GObject.source_remove(sid)
+        try:
+            sock.close()
+        except socket.error:
+            pass
+
+# =============================================================================
+# setup
+# =============================================================================
+
+def start(port):
+    """Enable metrics and serve them at the given port on the loopback
+    interface."""
+
+    global enabled, _server
+
+    stop()
+
+    try:
+        _server = _Server(port)
+    except socket.error as e:
+        log.error("failed to set up metrics server (%s)" % e)
+        return
+
+    enabled = True
+
+    log.info("serving metrics at http://127.0.0.1:%d/metrics" % port)
+
+def stop():
+    """Disable metrics."""
+
+    global enabled, _server, _lag_max
+
+    if not enabled:
+        return
+
+    enabled = False
+
+    _server.down()
+    _server = None
+
+    _values.clear()
+    _gauges.clear()
+    _lag_max = None
@@ -25,6 +25,7 @@ import os.path
 from gi.repository import GConf, GObject
 
 from remuco.adapter import PlayerAdapter, ItemAction
+from remuco.dbusproxy import DBusProxy
 from remuco.defs import *
 from remuco import log
 
@@ -52,6 +53,8 @@ STATUS_STOPPED = 2
 
 MINFO_KEY_RATING = "rating"
 
+TRACKLIST_PIPELINE = 32 # max number of GetMetadata() calls pending at once
+
 # =============================================================================
 # actions
 # =============================================================================
@@ -64,6 +67,19 @@ IA_JUMP = ItemAction("Jump to") # __jump_to() is ambiguous on dynamic playlists
 IA_REMOVE = ItemAction("Remove", multiple=True)
 PLAYLIST_ACTIONS = [IA_REMOVE]
 
+# =============================================================================
+# tracklist retrieval
+# =============================================================================
+
+class _TracklistFetch(object):
+    """State of an asynchronous tracklist retrieval."""
+    
+    def __init__(self):
+        
+        self.tracks = None # list of track dicts, None until length is known
+        self.next = 0 # index of next track to request
+        self.done = 0 # number of received tracks
+
 # =============================================================================
 # player adapter
 # =============================================================================
@@ -118,6 +134,10 @@ class MPRISAdapter(PlayerAdapter):
         self.__can_prev = False
         self.__can_tracklist = False
         
+        self.__tracklist = None # cached list of track dicts
+        self.__tracklist_fetch = None # _TracklistFetch in progress
+        self.__tracklist_waiters = [] # (callback, cancelled function)
+        
         log.debug("init done")
 
     def start(self):
@@ -125,13 +145,12 @@ class MPRISAdapter(PlayerAdapter):
         PlayerAdapter.start(self)
         
         try:
-            bus = dbus.SessionBus()
-            proxy = bus.get_object("org.mpris.%s" % self.__name, "/Player")
-            self._mp_p = dbus.Interface(proxy, "org.freedesktop.MediaPlayer")
-            proxy = bus.get_object("org.mpris.%s" % self.__name, "/TrackList")
-            self._mp_t = dbus.Interface(proxy, "org.freedesktop.MediaPlayer")
+            self._mp_p = DBusProxy("org.mpris.%s" % self.__name, "/Player",
+                                   "org.freedesktop.MediaPlayer")
+            self._mp_t = DBusProxy("org.mpris.%s" % self.__name, "/TrackList",
+                                   "org.freedesktop.MediaPlayer")
         except DBusException as e:
-            raise StandardError("dbus error: %s" % e)
+            raise RuntimeError("dbus error: %s" % e)
 
         try:
             self.__dbus_signal_handler = (
@@ -145,7 +164,7 @@ class MPRISAdapter(PlayerAdapter):
                                              self._notify_tracklist_change),
             )
         except DBusException as e:
-            raise StandardError("dbus error: %s" % e)
+            raise RuntimeError("dbus error: %s" % e)
 
         try:
             self._mp_p.GetStatus(reply_handler=self._notify_status,
@@ -169,9 +188,17 @@ class MPRISAdapter(PlayerAdapter):
             
         self.__dbus_signal_handler = ()
         
+        for proxy in (self._mp_p, self._mp_t):
+            if proxy is not None:
+                proxy.close()
+        
         self._mp_p = None
         self._mp_t = None
         
+        self.__tracklist = None
+        self.__tracklist_fetch = None
+        self.__tracklist_waiters = []
+        
     def poll(self):
         
         self._poll_volume()
@@ -322,20 +349,18 @@ class MPRISAdapter(PlayerAdapter):
             reply.send()
             return
         
-        # TODO: very slow for SongBird, should be async
-        tracks = self.__get_tracklist()
-
-        for track in tracks:
-            id, info = self.__track2info(track)
-            artist = info.get(INFO_ARTIST, "???")
-            title = info.get(INFO_TITLE, "???")
-            name = "%s - %s" % (artist, title)
-            reply.ids.append(id)
-            reply.names.append(name)
-        
-        reply.item_actions = self.__playlist_actions
+        def reply_tracks(tracks):
+            for track in tracks:
+                id, info = self.__track2info(track)
+                artist = info.get(INFO_ARTIST, "???")
+                title = info.get(INFO_TITLE, "???")
+                name = "%s - %s" % (artist, title)
+                reply.ids.append(id)
+                reply.names.append(name)
+            reply.item_actions = self.__playlist_actions
+            reply.send()
         
-        reply.send()
+        self.__get_tracklist(reply_tracks, lambda: reply.cancelled)
 
     # =========================================================================
     # internal methods (may be overridden by subclasses to fix MPRIS issues) 
@@ -415,6 +440,9 @@ class MPRISAdapter(PlayerAdapter):
     def _notify_tracklist_change(self, new_len):
         
         log.debug("tracklist change")
+        
+        self.__tracklist_invalidate()
+        
         try:
             self._mp_t.GetCurrentTrack(reply_handler=self._notify_position,
                                        error_handler=self._dbus_error)
@@ -450,27 +478,123 @@ class MPRISAdapter(PlayerAdapter):
     # internal methods (private) 
     # =========================================================================
     
-    def __get_tracklist(self):
-        """Get a list of track dicts of all tracks in the tracklist."""
+    def __get_tracklist(self, callback, cancelled=None):
+        """Get a list of track dicts of all tracks in the tracklist.
+        
+        The tracklist is cached until the player signals a tracklist change.
+        If it is not cached, it gets fetched asynchronously with several
+        GetMetadata() calls pending at once.
+        
+        @param callback:
+            function to call with the list of track dicts
+        @keyword cancelled:
+            function which returns True if the tracklist is not needed
+            anymore (callback does not get called then)
+        
+        """
+        if self.__tracklist is not None:
+            callback(self.__tracklist)
+            return
+        
+        self.__tracklist_waiters.append((callback,
+                                         cancelled or (lambda: False)))
+        
+        if self.__tracklist_fetch is None:
+            self.__tracklist_start()
+    
+    def __tracklist_start(self):
+        
+        fetch = self.__tracklist_fetch = _TracklistFetch()
         
         try:
-            length = self._mp_t.GetLength()
+            self._mp_t.GetLength(
+                reply_handler=lambda length:
+                    self.__tracklist_length(fetch, length),
+                error_handler=lambda error:
+                    self.__tracklist_error(fetch, error))
         except DBusException as e:
-            log.warning("dbus error: %s" % e)
-            length = 0
+            self.__tracklist_error(fetch, e)
+    
+    def __tracklist_length(self, fetch, length):
+        
+        if fetch is not self.__tracklist_fetch:
+            return # obsolete
+        
+        fetch.tracks = [None] * length
         
         if length == 0:
-            return []
+            self.__tracklist_done(fetch)
+        else:
+            self.__tracklist_request(fetch)
+    
+    def __tracklist_request(self, fetch):
+        """Request more tracks, up to TRACKLIST_PIPELINE at once."""
+        
+        self.__tracklist_waiters = [w for w in self.__tracklist_waiters
+                                    if not w[1]()]
+        if not self.__tracklist_waiters:
+            log.debug("tracklist not needed anymore")
+            self.__tracklist_fetch = None
+            return
         
-        tracks = []
-        for i in range(0, length):
+        while fetch.next < len(fetch.tracks) and \
+              fetch.next - fetch.done < TRACKLIST_PIPELINE:
+            i = fetch.next
+            fetch.next += 1
             try:
-                tracks.append(self._mp_t.GetMetadata(i))
+                self._mp_t.GetMetadata(i,
+                    reply_handler=lambda track, i=i:
+                        self.__tracklist_track(fetch, i, track),
+                    error_handler=lambda error:
+                        self.__tracklist_error(fetch, error))
             except DBusException as e:
-                log.warning("dbus error: %s" % e)
-                return []
-            
-        return tracks
+                self.__tracklist_error(fetch, e)
+                return
+    
+    def __tracklist_track(self, fetch, i, track):
+        
+        if fetch is not self.__tracklist_fetch:
+            return # obsolete
+        
+        fetch.tracks[i] = track
+        fetch.done += 1
+        
+        if fetch.done == len(fetch.tracks):
+            self.__tracklist_done(fetch)
+        else:
+            self.__tracklist_request(fetch)
+    
+    def __tracklist_done(self, fetch):
+        
+        self.__tracklist_fetch = None
+        self.__tracklist = fetch.tracks
+        
+        waiters, self.__tracklist_waiters = self.__tracklist_waiters, []
+        for callback, cancelled in waiters:
+            if not cancelled():
+                callback(fetch.tracks)
+    
+    def __tracklist_error(self, fetch, error):
+        
+        if fetch is not self.__tracklist_fetch:
+            return # obsolete or failed already
+        
+        self._dbus_error(error)
+        
+        self.__tracklist_fetch = None
+        
+        waiters, self.__tracklist_waiters = self.__tracklist_waiters, []
+        for callback, cancelled in waiters:
+            if not cancelled():
+                callback([])
+    
+    def __tracklist_invalidate(self):
+        """Drop the cached tracklist (restarts a fetch in progress)."""
+        
+        self.__tracklist = None
+        
+        if self.__tracklist_fetch is not None:
+            self.__tracklist_start()
 
     def __track2info(self, track):
         """Convert an MPRIS meta data dict to a Remuco info dict."""
@@ -497,20 +621,22 @@ class MPRISAdapter(PlayerAdapter):
         behaves not as expected on dynamic playlists.
         
         """
-        tracks = self.__get_tracklist()
-        
-        if position >= len(tracks):
-            return
-        
-        uris = []
-        for track in tracks[position:]:
-            uris.append(track.get("location", "there must be a location"))
-        
-        positions = range(position, len(tracks))
-        
-        self.action_playlist_item(IA_REMOVE.id, positions, uris)
+        def jump(tracks):
+            
+            if position >= len(tracks):
+                return
+            
+            uris = []
+            for track in tracks[position:]:
+                uris.append(track.get("location", "there must be a location"))
+            
+            positions = list(range(position, len(tracks)))
+            
+            self.action_playlist_item(IA_REMOVE.id, positions, uris)
+            
+            self.action_files(IA_APPEND_PLAY.id, [], uris)
         
-        self.action_files(IA_APPEND_PLAY.id, [], uris)
+        self.__get_tracklist(jump)
     
     # =========================================================================
     # dbus reply handler (may be reused by subclasses) 
@@ -0,0 +1,593 @@
+# =============================================================================
+#
+#    Remuco - A remote control system for media players.
+#    Copyright (C) 2006-2010 by the Remuco team, see AUTHORS.
+#
+#    This file is part of Remuco.
+#
+#    Remuco is free software: you can redistribute it and/or modify
+#    it under the terms of the GNU General Public License as published by
+#    the Free Software Foundation, either version 3 of the License, or
+#    (at your option) any later version.
+#
+#    Remuco is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#    GNU General Public License for more details.
+#
+#    You should have received a copy of the GNU General Public License
+#    along with Remuco.  If not, see <http://www.gnu.org/licenses/>.
+#
+# =============================================================================
+
+"""Base class for player adapters for MPRIS 2 players.
+
+In contrast to MPRIS 1, MPRIS 2 players notify about all state changes
+(signal 'PropertiesChanged'). The complete player state is fetched once when
+the adapter starts, later on the adapter only reacts on signals. Playback
+progress is extrapolated from the last known position and the playback rate,
+position changes which do not follow from the rate are notified by the
+player (signal 'Seeked'). Hence there is no periodic DBus traffic.
+
+"""
+
+import time
+
+from remuco.adapter import PlayerAdapter, ItemAction
+from remuco.dbusproxy import DBusProxy
+from remuco.defs import *
+from remuco import log
+
+try:
+    import dbus
+    from dbus.exceptions import DBusException
+except ImportError:
+    log.warning("dbus not available - MPRIS based player adapters will crash")
+
+# =============================================================================
+# MPRIS 2 constants
+# =============================================================================
+
+BUS_NAME_PREFIX = "org.mpris.MediaPlayer2."
+OBJECT_PATH = "/org/mpris/MediaPlayer2"
+
+IFACE_ROOT = "org.mpris.MediaPlayer2"
+IFACE_PLAYER = "org.mpris.MediaPlayer2.Player"
+IFACE_TRACKLIST = "org.mpris.MediaPlayer2.TrackList"
+IFACE_PROPERTIES = "org.freedesktop.DBus.Properties"
+
+NO_TRACK = "/org/mpris/MediaPlayer2/TrackList/NoTrack"
+
+# =============================================================================
+# actions
+# =============================================================================
+
+IA_APPEND = ItemAction("Append", multiple=True)
+IA_APPEND_PLAY = ItemAction("Append and play", multiple=True)
+FILE_ACTIONS = (IA_APPEND, IA_APPEND_PLAY)
+
+IA_JUMP = ItemAction("Jump to")
+IA_REMOVE = ItemAction("Remove", multiple=True)
+PLAYLIST_ACTIONS = (IA_JUMP, IA_REMOVE)
+
+# =============================================================================
+# player adapter
+# =============================================================================
+
+class MPRIS2Adapter(PlayerAdapter):
+
+    def __init__(self, name, display_name=None, poll=2.5, mime_types=None,
+                 rating=False, extra_file_actions=None,
+                 extra_playlist_actions=None):
+        """Create a new MPRIS 2 player adapter.
+
+        @param name:
+            the player's MPRIS 2 name, i.e. the bus name without the prefix
+            'org.mpris.MediaPlayer2.'
+        @keyword poll:
+            interval in seconds to update the extrapolated playback progress
+            (this does not cause any DBus traffic)
+
+        See PlayerAdapter.__init__() for the other parameters.
+
+        """
+        display_name = display_name or name
+
+        if rating:
+            max_rating = 5
+        else:
+            max_rating = 0
+
+        all_file_actions = FILE_ACTIONS + tuple(extra_file_actions or ())
+
+        PlayerAdapter.__init__(self, display_name,
+                               max_rating=max_rating,
+                               playback_known=True,
+                               volume_known=True,
+                               repeat_known=True,
+                               shuffle_known=True,
+                               progress_known=True,
+                               poll=poll,
+                               file_actions=all_file_actions,
+                               mime_types=mime_types)
+
+        self.__playlist_actions = PLAYLIST_ACTIONS + \
+                                  tuple(extra_playlist_actions or ())
+
+        self.__name = name
+
+        self.__dbus_signal_handler = ()
+        self._mp_p = None
+        self._mp_t = None
+        self._mp_props = None
+
+        self._repeat = False
+        self._shuffle = False
+        self._playing = PLAYBACK_STOP
+        self.__volume = 0
+        self.__can_control = False
+        self.__can_seek = False
+        self.__can_next = False
+        self.__can_prev = False
+        self.__has_tracklist = False
+
+        self.__track = None # current track ID
+        self.__tracks = [] # track IDs of the tracklist
+
+        # base for progress extrapolation
+        self.__length = 0 # seconds
+        self.__position = 0 # microseconds
+        self.__position_time = 0
+        self.__rate = 1.0
+
+        log.debug("init done")
+
+    def start(self):
+
+        PlayerAdapter.start(self)
+
+        try:
+            bus_name = BUS_NAME_PREFIX + self.__name
+            self._mp_p = DBusProxy(bus_name, OBJECT_PATH, IFACE_PLAYER)
+            self._mp_t = DBusProxy(bus_name, OBJECT_PATH, IFACE_TRACKLIST)
+            self._mp_props = DBusProxy(bus_name, OBJECT_PATH, IFACE_PROPERTIES)
+        except DBusException as e:
+            raise RuntimeError("dbus error: %s" % e)
+
+        try:
+            self.__dbus_signal_handler = (
+                self._mp_props.connect_to_signal("PropertiesChanged",
+                                                 self._notify_properties),
+                self._mp_p.connect_to_signal("Seeked", self._notify_seeked),
+                self._mp_t.connect_to_signal("TrackListReplaced",
+                                             self._notify_tracklist_replaced),
+                self._mp_t.connect_to_signal("TrackAdded",
+                                             self._notify_track_added),
+                self._mp_t.connect_to_signal("TrackRemoved",
+                                             self._notify_track_removed),
+            )
+        except DBusException as e:
+            raise RuntimeError("dbus error: %s" % e)
+
+        for iface in (IFACE_ROOT, IFACE_PLAYER):
+            try:
+                self._mp_props.GetAll(iface,
+                    reply_handler=lambda props, iface=iface:
+                        self._notify_properties(iface, props, []),
+                    error_handler=self._dbus_error)
+            except DBusException as e:
+                # this is not necessarily a fatal error
+                log.warning("dbus error: %s" % e)
+
+    def stop(self):
+
+        PlayerAdapter.stop(self)
+
+        for handler in self.__dbus_signal_handler:
+            handler.remove()
+
+        self.__dbus_signal_handler = ()
+
+        for proxy in (self._mp_p, self._mp_t, self._mp_props):
+            if proxy is not None:
+                proxy.close()
+
+        self._mp_p = None
+        self._mp_t = None
+        self._mp_props = None
+
+    def poll(self):
+
+        # no DBus traffic, the progress is extrapolated
+        self.update_progress(self.__util_progress(), self.__length)
+
+    # =========================================================================
+    # control interface
+    # =========================================================================
+
+    def ctrl_toggle_playing(self):
+
+        try:
+            self._mp_p.PlayPause(reply_handler=self._dbus_ignore,
+                                 error_handler=self._dbus_error)
+        except DBusException as e:
+            log.warning("dbus error: %s" % e)
+
+    def ctrl_toggle_repeat(self):
+
+        self.__set_property("LoopStatus",
+                            self._repeat and "None" or "Playlist")
+
+    def ctrl_toggle_shuffle(self):
+
+        self.__set_property("Shuffle", dbus.Boolean(not self._shuffle))
+
+    def ctrl_next(self):
+
+        if not self.__can_next:
+            log.debug("go to next item is currently not possible")
+            return
+
+        try:
+            self._mp_p.Next(reply_handler=self._dbus_ignore,
+                            error_handler=self._dbus_error)
+        except DBusException as e:
+            log.warning("dbus error: %s" % e)
+
+    def ctrl_previous(self):
+
+        if not self.__can_prev:
+            log.debug("go to previous is currently not possible")
+            return
+
+        try:
+            self._mp_p.Previous(reply_handler=self._dbus_ignore,
+                                error_handler=self._dbus_error)
+        except DBusException as e:
+            log.warning("dbus error: %s" % e)
+
+    def ctrl_volume(self, direction):
+
+        if direction == 0:
+            volume = 0
+        else:
+            volume = self.__volume + 5 * direction
+            volume = min(volume, 100)
+            volume = max(volume, 0)
+
+        # the new volume gets notified by the player
+        self.__set_property("Volume", dbus.Double(volume / 100.0))
+
+    def ctrl_seek(self, direction):
+
+        if not self.__can_seek:
+            log.debug("seeking is currently not possible")
+            return
+
+        # the new position gets notified by the player (signal 'Seeked')
+        try:
+            self._mp_p.Seek(dbus.Int64(direction * 5 * 1000000),
+                            reply_handler=self._dbus_ignore,
+                            error_handler=self._dbus_error)
+        except DBusException as e:
+            log.warning("dbus error: %s" % e)
+
+    # =========================================================================
+    # actions interface
+    # =========================================================================
+
+    def action_files(self, action_id, files, uris):
+
+        if action_id != IA_APPEND.id and action_id != IA_APPEND_PLAY.id:
+            log.error("** BUG ** unexpected action: %d" % action_id)
+            return
+
+        play = action_id == IA_APPEND_PLAY.id
+
+        try:
+            if not self.__has_tracklist:
+                # without a tracklist, only opening a single URI is possible
+                self._mp_p.OpenUri(uris[0], reply_handler=self._dbus_ignore,
+                                   error_handler=self._dbus_error)
+                return
+            after = self.__tracks and self.__tracks[-1] or NO_TRACK
+            for i, uri in enumerate(uris):
+                self._mp_t.AddTrack(uri, dbus.ObjectPath(after),
+                                    play and i == 0,
+                                    reply_handler=self._dbus_ignore,
+                                    error_handler=self._dbus_error)
+        except DBusException as e:
+            log.warning("dbus error: %s" % e)
+
+    def action_playlist_item(self, action_id, positions, ids):
+
+        tracks = [self.__tracks[pos] for pos in positions
+                  if pos < len(self.__tracks)]
+
+        if action_id == IA_REMOVE.id:
+
+            try:
+                for track in tracks:
+                    self._mp_t.RemoveTrack(dbus.ObjectPath(track),
+                                           reply_handler=self._dbus_ignore,
+                                           error_handler=self._dbus_error)
+            except DBusException as e:
+                log.warning("dbus error: %s" % e)
+
+        elif action_id == IA_JUMP.id:
+
+            if not tracks:
+                return
+            try:
+                self._mp_t.GoTo(dbus.ObjectPath(tracks[0]),
+                                reply_handler=self._dbus_ignore,
+                                error_handler=self._dbus_error)
+            except DBusException as e:
+                log.warning("dbus error: %s" % e)
+
+        else:
+            log.error("** BUG ** unexpected action: %d" % action_id)
+
+    # =========================================================================
+    # request interface
+    # =========================================================================
+
+    def request_playlist(self, reply):
+
+        if not self.__has_tracklist or not self.__tracks:
+            reply.send()
+            return
+
+        def handle_metadata(tracks):
+            for track in tracks:
+                id, info = self.__track2info(track)
+                reply.ids.append(id)
+                reply.names.append("%s - %s" % (info[INFO_ARTIST] or "???",
+                                                 info[INFO_TITLE] or "???"))
+            reply.item_actions = self.__playlist_actions
+            reply.send()
+
+        def handle_error(error):
+            self._dbus_error(error)
+            reply.send()
+
+        # metadata of all tracks in one call
+        try:
+            self._mp_t.GetTracksMetadata(dbus.Array(self.__tracks,
+                                                    signature="o"),
+                                         reply_handler=handle_metadata,
+                                         error_handler=handle_error)
+        except DBusException as e:
+            log.warning("dbus error: %s" % e)
+            reply.send()
+
+    # =========================================================================
+    # internal methods (may be overridden by subclasses to fix MPRIS issues)
+    # =========================================================================
+
+    def _notify_properties(self, iface, changed, invalidated):
+        """Handle changed properties (or all properties after GetAll())."""
+
+        log.debug("properties of %s changed: %s, invalidated: %s" %
+                  (iface, list(changed.keys()), invalidated))
+
+        if iface == IFACE_ROOT:
+            if "HasTrackList" in changed:
+                self.__has_tracklist = bool(changed["HasTrackList"])
+                if self.__has_tracklist:
+                    self.__get_property(IFACE_TRACKLIST, "Tracks",
+                                        self.__notify_tracks)
+            return
+
+        if iface != IFACE_PLAYER:
+            return
+
+        with self.batch():
+
+            # progress extrapolation base must be updated before changes of
+            # playback state and rate take effect
+            if "Position" in changed:
+                self._notify_seeked(changed["Position"])
+            elif "PlaybackStatus" in changed or "Rate" in changed:
+                self.__util_rebase()
+
+            if "PlaybackStatus" in changed:
+                status = changed["PlaybackStatus"]
+                if status == "Playing":
+                    self._playing = PLAYBACK_PLAY
+                elif status == "Paused":
+                    self._playing = PLAYBACK_PAUSE
+                elif status == "Stopped":
+                    self._playing = PLAYBACK_STOP
+                else:
+                    log.warning("unknown play state (%s), assume playing" %
+                                status)
+                    self._playing = PLAYBACK_PLAY
+                self.update_playback(self._playing)
+
+            if "Rate" in changed:
+                self.__rate = float(changed["Rate"])
+
+            if "LoopStatus" in changed:
+                self._repeat = changed["LoopStatus"] != "None"
+                self.update_repeat(self._repeat)
+
+            if "Shuffle" in changed:
+                self._shuffle = bool(changed["Shuffle"])
+                self.update_shuffle(self._shuffle)
+
+            if "Volume" in changed:
+                self.__volume = int(round(float(changed["Volume"]) * 100))
+                self.update_volume(self.__volume)
+
+            if "Metadata" in changed:
+                self._notify_track(changed["Metadata"])
+
+            self.__can_control = changed.get("CanControl",
+                                             self.__can_control)
+            self.__can_seek = changed.get("CanSeek", self.__can_seek)
+            self.__can_next = changed.get("CanGoNext", self.__can_next)
+            self.__can_prev = changed.get("CanGoPrevious", self.__can_prev)
+
+            self.update_progress(self.__util_progress(), self.__length)
+
+        # properties changed without their new values being sent
+        for name in invalidated:
+            self.__get_property(IFACE_PLAYER, name,
+                lambda value, name=name:
+                    self._notify_properties(IFACE_PLAYER, {name: value}, []))
+
+    def _notify_seeked(self, position):
+        """Handle a new playback position (in microseconds)."""
+
+        self.__position = int(position)
+        self.__position_time = time.time()
+
+        self.update_progress(self.__util_progress(), self.__length)
+
+    def _notify_track(self, track):
+
+        log.debug("track: %s" % str(track))
+
+        self.__track = str(track.get("mpris:trackid", "")) or None
+
+        id, info = self.__track2info(track)
+
+        self.__length = info.get(INFO_LENGTH, 0)
+
+        img = str(track.get("mpris:artUrl", ""))
+        if not img.startswith("file:"):
+            img = self.find_image(id)
+
+        self.update_item(id, info, img)
+
+        self.__update_position()
+
+        # the position on track changes is not notified
+        self.__get_property(IFACE_PLAYER, "Position", self._notify_seeked)
+
+    def _notify_tracklist_replaced(self, tracks, current):
+
+        log.debug("tracklist replaced")
+
+        self.__notify_tracks(tracks)
+
+    def _notify_track_added(self, metadata, after):
+
+        track = str(metadata.get("mpris:trackid", ""))
+        after = str(after)
+
+        if after == NO_TRACK:
+            self.__tracks.insert(0, track)
+        elif after in self.__tracks:
+            self.__tracks.insert(self.__tracks.index(after) + 1, track)
+        else:
+            self.__tracks.append(track)
+
+        self.__update_position()
+
+    def _notify_track_removed(self, track):
+
+        track = str(track)
+
+        if track in self.__tracks:
+            self.__tracks.remove(track)
+
+        self.__update_position()
+
+    # =========================================================================
+    # internal methods (private)
+    # =========================================================================
+
+    def __notify_tracks(self, tracks):
+
+        self.__tracks = [str(track) for track in tracks]
+        self.__update_position()
+
+    def __update_position(self):
+
+        if self.__track in self.__tracks:
+            self.update_position(self.__tracks.index(self.__track))
+        else:
+            self.update_position(0)
+
+    def __get_property(self, iface, name, handler):
+
+        if self._mp_props is None: # stopped
+            return
+
+        try:
+            self._mp_props.Get(iface, name, reply_handler=handler,
+                               error_handler=self._dbus_error)
+        except DBusException as e:
+            log.warning("dbus error: %s" % e)
+
+    def __set_property(self, name, value):
+
+        if self._mp_props is None: # stopped
+            return
+
+        try:
+            self._mp_props.Set(IFACE_PLAYER, name, value,
+                               reply_handler=self._dbus_ignore,
+                               error_handler=self._dbus_error)
+        except DBusException as e:
+            log.warning("dbus error: %s" % e)
+
+    def __track2info(self, track):
+        """Convert an MPRIS 2 meta data dict to a Remuco info dict."""
+
+        def join(value):
+            if isinstance(value, (list, tuple)):
+                return ", ".join([str(v) for v in value])
+            return str(value)
+
+        id = str(track.get("xesam:url", "None"))
+
+        info = {}
+        info[INFO_TITLE] = join(track.get("xesam:title", ""))
+        info[INFO_ARTIST] = join(track.get("xesam:artist", ""))
+        info[INFO_ALBUM] = join(track.get("xesam:album", ""))
+        info[INFO_GENRE] = join(track.get("xesam:genre", ""))
+        info[INFO_YEAR] = join(track.get("xesam:contentCreated", ""))[:4]
+        info[INFO_LENGTH] = int(track.get("mpris:length", 0)) // 1000000
+        info[INFO_RATING] = int(round(float(
+                                track.get("xesam:userRating", 0)) * 5))
+
+        return (id, info)
+
+    def __util_progress(self):
+        """Get the extrapolated playback progress in seconds."""
+
+        progress = self.__position / 1000000.0
+
+        if self._playing == PLAYBACK_PLAY:
+            progress += (time.time() - self.__position_time) * self.__rate
+
+        if self.__length > 0:
+            progress = min(progress, self.__length)
+
+        return max(progress, 0)
+
+    def __util_rebase(self):
+        """Set the extrapolation base to the current extrapolated progress."""
+
+        self.__position = int(self.__util_progress() * 1000000)
+        self.__position_time = time.time()
+
+    # =========================================================================
+    # dbus reply handler (may be reused by subclasses)
+    # =========================================================================
+
+    def _dbus_error(self, error):
+        """ DBus error handler."""
+
+        if self._mp_p is None:
+            return # do not log errors once stopped
+
+        log.warning("DBus error: %s" % error)
+
+    def _dbus_ignore(self, *args):
+        """ DBus reply handler for methods without reply."""
+
+        pass
@@ -20,6 +20,7 @@
 #
 # =============================================================================
 
+import collections
 import socket
 import struct
 import time
@@ -28,13 +29,100 @@ import time
 #import bluetooth
 from gi.repository import GConf, GObject
 
+from remuco import latency
 from remuco import log
+from remuco import manager
 from remuco import message
+from remuco import metrics
 from remuco import report
 from remuco import serial
 from remuco.data import ClientInfo
 from remuco.remos import zc_publish, zc_unpublish
 
+# =============================================================================
+# protocol trace
+# =============================================================================
+
+class _Trace(object):
+    """Ring buffer of the last messages exchanged with clients.
+    
+    Slots get allocated once and are reused, so recording a message does not
+    allocate anything (except when keeping message content).
+    
+    """
+    IN = "<-"
+    OUT = "->"
+    
+    def __init__(self, size, payload):
+        """Create a new trace.
+        
+        @param size:
+            number of messages to keep
+        @param payload:
+            number of bytes of message content to keep
+        
+        """
+        # slot: [time, direction, message ID, size, client address, content]
+        self.__slots = [[0, None, 0, 0, None, None] for i in range(size)]
+        self.__next = 0
+        self.__payload = payload
+        
+    def add(self, direction, msg_id, size, addr, data, offset=0):
+        
+        slot = self.__slots[self.__next]
+        slot[0] = time.time()
+        slot[1] = direction
+        slot[2] = msg_id
+        slot[3] = size
+        slot[4] = addr
+        if self.__payload > 0:
+            slot[5] = data[offset:offset + self.__payload]
+        
+        self.__next = (self.__next + 1) % len(self.__slots)
+        
+    def dump(self):
+        """Log all recorded messages, oldest first."""
+        
+        lines = []
+        
+        for i in range(len(self.__slots)):
+            ts, direction, msg_id, size, addr, data = \
+                self.__slots[(self.__next + i) % len(self.__slots)]
+            if direction is None: # unused slot
+                continue
+            line = "%s.%03d %s %-15s %-18s %6dB" % (
+                time.strftime("%H:%M:%S", time.localtime(ts)),
+                int(ts * 1000) % 1000, direction, addr and addr[0],
+                message.name(msg_id), size)
+            if data:
+                line = "%s %r" % (line, data)
+            lines.append(line)
+        
+        log.info("message trace (%d messages):\n%s" %
+                 (len(lines), "\n".join(lines)))
+        
+        return False # usable as GObject callback
+
+trace = None
+
+def trace_setup(size, payload):
+    """Set up (or disable, if size is 0) the protocol trace."""
+    
+    global trace
+    
+    if trace is not None:
+        manager.remove_dump_fn(trace.dump)
+    
+    if size > 0:
+        trace = _Trace(size, payload)
+        manager.add_dump_fn(trace.dump)
+    else:
+        trace = None
+
+# =============================================================================
+# messages and client connections
+# =============================================================================
+
 def build_message(id, serializable):
     """Create a message ready to send on a socket.
     
@@ -53,6 +141,9 @@ def build_message(id, serializable):
     # Using this method, a message can be serialized once and send to many
     # clients.
     
+    if latency.enabled:
+        t_start = latency.now()
+    
     if serializable is not None:
         ba = serial.pack(serializable)
         if ba is None:
@@ -63,6 +154,9 @@ def build_message(id, serializable):
     
     header = struct.pack("!hi", id, len(ba))
     
+    if latency.enabled:
+        latency.record(id, latency.SERIALIZE, t_start)
+    
     return header + ba
 
 class ReceiveBuffer(object):
@@ -105,6 +199,9 @@ class ClientConnection(object):
         self.__rcv_msg_size = 0
         
         self.__snd_buff = b'' # buffer for outgoing data
+        self.__snd_queued = 0 # number of bytes queued so far
+        self.__snd_sent = 0 # number of bytes sent so far
+        self.__snd_marks = collections.deque() # for latency instrumentation
         
         # source IDs for various events
         self.__sids = [
@@ -114,7 +211,7 @@ class ClientConnection(object):
             ]
         self.__sid_out = 0
         
-        log.debug("send 'hello' to %s" % self)
+        log.debug("send 'hello' to %s", self)
         
         self.send(ClientConnection.IO_HELLO)
     
@@ -135,7 +232,7 @@ class ClientConnection(object):
         """
        
         try:
-            log.debug("try to receive %d bytes" % rcv_buff.rest)
+            log.debug("try to receive %d bytes", rcv_buff.rest)
             data = self.__sock.recv(rcv_buff.rest)
         except socket.timeout as e: # TODO: needed?
             log.warning("connection to %s broken (%s)" % (self, e))
@@ -148,7 +245,7 @@ class ClientConnection(object):
         
         received = len(data)
         
-        log.debug("received %d bytes" % received)
+        log.debug("received %d bytes", received)
         
         if received == 0:
             log.warning("connection to %s broken (no data)" % self)
@@ -164,7 +261,7 @@ class ClientConnection(object):
     def __io_recv(self, fd, cond):
         """ GObject callback function (when there is data to receive). """
         
-        log.debug("data from client %s available" % self)
+        log.debug("data from client %s available", self)
 
         # --- init buffers on new message -------------------------------------
 
@@ -192,7 +289,7 @@ class ClientConnection(object):
                 log.warning("msg from %s too big (%d bytes)" % (self, size))
                 self.disconnect()
                 return False
-            log.debug("incoming msg: %d, %dB" % (id, size))
+            log.debug("incoming msg: %d, %dB", id, size)
             self.__rcv_buff_data.rest = size
             self.__rcv_msg_id, self.__rcv_msg_size = id, size
             if size > 0:
@@ -213,7 +310,34 @@ class ClientConnection(object):
         msg_id = self.__rcv_msg_id
         msg_data = self.__rcv_buff_data.data
 
-        log.debug("incoming msg ")
+        if log.is_enabled(log.DEBUG):
+            log.debug("incoming msg %s (%dB) from %s", message.name(msg_id),
+                      self.__rcv_msg_size, self)
+        
+        if metrics.enabled:
+            name = message.name(msg_id)
+            metrics.inc(metrics.MSGS_IN, name)
+            metrics.inc(metrics.BYTES_IN, name,
+                        ClientConnection.IO_HEADER_LEN + self.__rcv_msg_size)
+        
+        if trace is not None:
+            trace.add(_Trace.IN, msg_id, self.__rcv_msg_size, self.__addr,
+                      msg_data)
+        
+        if manager.lag_monitoring:
+            token = manager.activity_begin("receiving %s from %s" %
+                                           (message.name(msg_id), self))
+        
+        try:
+            self.__dispatch(msg_id, msg_data)
+        finally:
+            if manager.lag_monitoring:
+                manager.activity_end(token)
+        
+        return True
+    
+    def __dispatch(self, msg_id, msg_data):
+        """Handle a complete message received from the client."""
         
         if msg_id == message.IGNORE:
             
@@ -231,7 +355,7 @@ class ClientConnection(object):
             
         elif msg_id == message.CONN_CINFO:
             
-            log.debug("received client info from %s" % self)
+            log.debug("received client info from %s", self)
             
             serial.unpack(self.info, msg_data)
             
@@ -243,7 +367,7 @@ class ClientConnection(object):
                 
                 self.__clients.append(self)
                 
-                log.debug("sending player info to %s" % self)
+                log.debug("sending player info to %s", self)
                 
                 self.send(self.__pinfo_msg)
                 
@@ -252,8 +376,6 @@ class ClientConnection(object):
         else:
             
             self.__msg_handler_fn(self, msg_id, msg_data)
-        
-        return True
 
     def __io_error(self, fd, cond):
         """ GObject callback function (when there is an error). """
@@ -274,7 +396,8 @@ class ClientConnection(object):
             self.__sid_out = 0
             return False
 
-        log.debug("try to send %d bytes to %s" % (len(self.__snd_buff), self))
+        log.debug("try to send %d bytes to %s", len(self.__snd_buff),
+                  self)
 
         try:
             sent = self.__sock.send(self.__snd_buff)
@@ -283,7 +406,7 @@ class ClientConnection(object):
             self.disconnect()
             return False
 
-        log.debug("sent %d bytes" % sent)
+        log.debug("sent %d bytes", sent)
         
         if sent == 0:
             log.warning("failed to send data to %s" % self)
@@ -291,6 +414,13 @@ class ClientConnection(object):
             return False
         
         self.__snd_buff = self.__snd_buff[sent:]
+        self.__snd_sent += sent
+        
+        while self.__snd_marks and self.__snd_marks[0][0] <= self.__snd_sent:
+            end, msg_id, t_queued, t_origin = self.__snd_marks.popleft()
+            latency.record(msg_id, latency.WIRE, t_queued)
+            if t_origin is not None:
+                latency.record(msg_id, latency.TOTAL, t_origin)
         
         if not self.__snd_buff:
             self.__sid_out = 0
@@ -298,12 +428,15 @@ class ClientConnection(object):
         else:
             return True
     
-    def send(self, msg):
+    def send(self, msg, origin=None):
         """Send a message to the client.
         
         @param msg:
             complete message (incl. ID and length) in binary format
             (net.build_message() is your friend here)
+        @keyword origin:
+            time of the player event which caused this message (see
+            latency.now(), only used for latency instrumentation)
         
         @see: net.build_message()
         
@@ -314,14 +447,31 @@ class ClientConnection(object):
             return
         
         if self.__sock is None:
-            log.debug("cannot send message to %s, already disconnected" % self)
+            log.debug("cannot send message to %s, already disconnected",
+                      self)
             return
 
         if self.__psave:
-            log.debug("%s is in sleep mode, send nothing" % self)
+            log.debug("%s is in sleep mode, send nothing", self)
             return
 
         self.__snd_buff = self.__snd_buff + msg
+        self.__snd_queued += len(msg)
+        
+        if latency.enabled and msg is not ClientConnection.IO_HELLO:
+            msg_id = struct.unpack_from("!h", msg)[0]
+            self.__snd_marks.append((self.__snd_queued, msg_id,
+                                     latency.now(), origin))
+        
+        if trace is not None and msg is not ClientConnection.IO_HELLO:
+            msg_id, size = struct.unpack_from("!hi", msg)
+            trace.add(_Trace.OUT, msg_id, size, self.__addr, msg,
+                      offset=ClientConnection.IO_HEADER_LEN)
+        
+        if metrics.enabled and msg is not ClientConnection.IO_HELLO:
+            name = message.name(struct.unpack_from("!h", msg)[0])
+            metrics.inc(metrics.MSGS_OUT, name)
+            metrics.inc(metrics.BYTES_OUT, name, len(msg))
         
         # if not already trying to send data ..
         if self.__sid_out == 0:
@@ -361,7 +511,7 @@ class ClientConnection(object):
         
         # disconnect
         
-        log.debug("disconnect %s" % self)
+        log.debug("disconnect %s", self)
         
         if remove_from_list and self in self.__clients:
             self.__clients.remove(self)
@@ -375,6 +525,8 @@ class ClientConnection(object):
             GObject.source_remove(self.__sid_out)
             self.__sid_out = 0
         
+        self.__snd_marks.clear()
+        
         if self.__sock is not None:
             try:
                 self.__sock.shutdown(socket.SHUT_RDWR)
@@ -382,6 +534,8 @@ class ClientConnection(object):
                 pass
             self.__sock.close()
             self.__sock = None
+            # let the adapter forget about this client
+            self.__msg_handler_fn(self, message.PRIV_DISCONNECT, None)
 
 class _Server(object):
     
@@ -436,7 +590,8 @@ class _Server(object):
         if condition == GObject.IO_IN:
             
             try:
-                log.debug("connection request from %s client" % self._get_type())
+                log.debug("connection request from %s client",
+                          self._get_type())
                 client_sock, addr = self._sock.accept()
                 log.debug("connection request accepted")
                 client_sock.setblocking(0)
@@ -462,7 +617,7 @@ class _Server(object):
             GObject.source_remove(self.__sid) 
 
         if self._sock is not None:
-            log.debug("closing %s server socket" % self._get_type())
+            log.debug("closing %s server socket", self._get_type())
             try:
                 self._sock.shutdown(socket.SHUT_RDWR)
             except socket.error:
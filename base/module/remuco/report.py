@@ -26,10 +26,12 @@ import http
 from http import client
 import os
 import os.path
+import threading
 import urllib
 
 from remuco.config import DEVICE_FILE
 from remuco import dictool
+from remuco import log
 from remuco.remos import notify
 
 __HOST = "remuco.sourceforge.net"
@@ -46,20 +48,51 @@ __DEVICE_FILE_COMMENT = """# Seen Remuco client devices.
 # Fields of a client device info to log.
 __FIELDS = ("name", "version", "conn", "utf8", "touch")
 
+# Flattened devices already logged (loaded from the device file once).
+__seen_devices = None
+
+# Serializes appending to the device file.
+__append_lock = threading.Lock()
+
 def log_device(device):
-    """Log a client device."""
+    """Log a client device.
+    
+    Checking if a device is already known does not need any file I/O (except
+    on the first call). New devices get appended to the device file in a
+    separate thread.
+    
+    """
+    global __seen_devices
     
     device = dictool.dict_to_string(device, keys=__FIELDS)
     
-    seen_devices = dictool.read_dicts_from_file(DEVICE_FILE, flat=True,
-                                                keys=__FIELDS)
+    if __seen_devices is None:
+        __seen_devices = set(dictool.read_dicts_from_file(DEVICE_FILE,
+                                                          flat=True))
+    
+    if device in __seen_devices:
+        return
+    
+    __seen_devices.add(device)
+    
+    notify("New Remuco Client", "Please run the tool <b>remuco-report</b> !")
+    
+    thread = threading.Thread(target=__append_device, args=(device,))
+    thread.daemon = True
+    thread.start()
+
+def __append_device(device):
+    """Append a flattened device to the device file."""
     
-    if not device in seen_devices:
-        notify("New Remuco Client",
-               "Please run the tool <b>remuco-report</b> !")
-        seen_devices.append(device)
-        dictool.write_dicts_to_file(DEVICE_FILE, seen_devices,
-                                    comment=__DEVICE_FILE_COMMENT)
+    with __append_lock:
+        data = "%s\n" % device
+        if not os.path.exists(DEVICE_FILE):
+            data = "%s\n%s" % (__DEVICE_FILE_COMMENT, data)
+        try:
+            with open(DEVICE_FILE, "a") as fp:
+                fp.write(data)
+        except IOError as e:
+            log.warning("failed to write to %s (%s)" % (DEVICE_FILE, e))
 
 def __send_device(device):
     """Send a single device."""
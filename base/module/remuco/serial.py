@@ -222,8 +222,8 @@ class Bin:
             return
         
         if Bin.HOST_ENCODING not in Bin.NET_ENCODING_ALT:
-            log.debug("convert '%s' from %s to %s" %
-                      (s, Bin.HOST_ENCODING, Bin.NET_ENCODING))
+            log.debug("convert '%s' from %s to %s",
+                      s, Bin.HOST_ENCODING, Bin.NET_ENCODING)
             try:
                 s = unicode(s, Bin.HOST_ENCODING).encode(Bin.NET_ENCODING)
             except UnicodeDecodeError as e:
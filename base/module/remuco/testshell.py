@@ -24,6 +24,8 @@ import signal
 from gi.repository import GConf, GObject
 import inspect
 
+from remuco import net
+
 _paref = None
 _cmdlist = None
 
@@ -35,8 +37,18 @@ def setup(adapter):
     _cmdlist = [getattr(adapter, f) for f in dir(adapter)
                 if f.startswith("ctrl_")]
 
+    _cmdlist.append(trace_dump)
+
     signal.signal(signal.SIGHUP, handler)
 
+def trace_dump():
+    """Log the protocol trace (see net.trace_setup())."""
+
+    if net.trace is not None:
+        net.trace.dump()
+    else:
+        print('Message trace is disabled')
+
 def handler(signum, frame):
     """Ugly handler to call PlayerAdapter's functions and test
     functionality. """
@@ -0,0 +1,445 @@
+# =============================================================================
+#
+#    Remuco - A remote control system for media players.
+#    Copyright (C) 2006-2010 by the Remuco team, see AUTHORS.
+#
+#    This file is part of Remuco.
+#
+#    Remuco is free software: you can redistribute it and/or modify
+#    it under the terms of the GNU General Public License as published by
+#    the Free Software Foundation, either version 3 of the License, or
+#    (at your option) any later version.
+#
+#    Remuco is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#    GNU General Public License for more details.
+#
+#    You should have received a copy of the GNU General Public License
+#    along with Remuco.  If not, see <http://www.gnu.org/licenses/>.
+#
+# =============================================================================
+
+"""Master volume backends (used if option 'master-volume-enabled' is set).
+
+A backend reads and adjusts the system's master volume and reports volume
+levels to a change function. Backends which get notified about volume changes
+by the system are event driven and need not to be refreshed periodically.
+
+"""
+
+import os
+import subprocess
+import time
+
+from gi.repository import GObject
+
+from remuco import log
+
+try:
+    import alsaaudio
+except ImportError:
+    alsaaudio = None
+
+# =============================================================================
+# constants
+# =============================================================================
+
+# minimum interval in seconds between two volume level refreshes done by
+# the command backend (which forks a shell for each refresh)
+_CMD_REFRESH_IVAL = 10
+
+_HELPER_EOR = "__remuco_eor__" # end of response marker
+
+# seconds to wait for a response of the helper shell before restarting it
+_HELPER_TIMEOUT = 5
+
+_ALSA_STEP = 5 # percent to increase or decrease the volume by
+
+# =============================================================================
+# backends
+# =============================================================================
+
+class _Backend(object):
+    """Base class for master volume backends."""
+
+    event_driven = False
+
+    def __init__(self, config, change_fn):
+        """Create a new backend.
+
+        @param config:
+            adapter configuration
+        @param change_fn:
+            function to call with the current volume level (in percent)
+
+        """
+        self._config = config
+        self._change_fn = change_fn
+
+    def refresh(self, force=False):
+        """Get the current volume level and pass it to the change function.
+
+        @keyword force: if True, refresh even if a backend's internal rate
+            limit would suppress it
+
+        """
+        raise NotImplementedError
+
+    def adjust(self, direction):
+        """Adjust the volume.
+
+        @param direction:
+            * -1: decrease
+            *  0: mute
+            * +1: increase
+
+        """
+        raise NotImplementedError
+
+    def close(self):
+        """Release all resources of the backend."""
+
+        pass
+
+    def _cmd(self, direction):
+        """Get the configured command to adjust the volume."""
+
+        if direction < 0:
+            return self._config.master_volume_down_cmd
+        elif direction > 0:
+            return self._config.master_volume_up_cmd
+        else:
+            return self._config.master_volume_mute_cmd
+
+    def _parse(self, out):
+        """Parse the output of the volume get command and pass it on."""
+
+        try:
+            volume = int(out)
+            if volume < 0 or volume > 100:
+                raise ValueError
+        except ValueError:
+            log.error("output of master-volume-get malformed: '%s'" % out)
+            return
+
+        self._change_fn(volume)
+
+class _CommandBackend(_Backend):
+    """Runs each configured command in a new shell.
+
+    This is the legacy backend. Refreshes are rate limited to keep the
+    number of forked processes low.
+
+    """
+    def __init__(self, config, change_fn):
+
+        super(_CommandBackend, self).__init__(config, change_fn)
+
+        self.__last_refresh = 0
+
+    def refresh(self, force=False):
+
+        now = time.time()
+        if not force and now - self.__last_refresh < _CMD_REFRESH_IVAL:
+            return
+        self.__last_refresh = now
+
+        cmd = "sh -c '%s'" % self._config.master_volume_get_cmd
+        ret, out = subprocess.getstatusoutput(cmd)
+        if ret != os.EX_OK:
+            log.error("master-volume-get failed: '%s'" % out)
+            return
+
+        self._parse(out)
+
+    def adjust(self, direction):
+
+        ret, out = subprocess.getstatusoutput("sh -c '%s'" %
+                                              self._cmd(direction))
+        if ret != os.EX_OK:
+            log.error("master-volume-... failed: %s" % out)
+        else:
+            GObject.idle_add(self.refresh, True)
+
+class _HelperBackend(_Backend):
+    """Runs the configured commands in a long-lived helper shell.
+
+    Commands are written line by line to the shell's stdin. The shell
+    answers each command with its output followed by an end of response
+    line containing the command's exit status. Responses get read
+    asynchronously, i.e. without blocking the main loop. If the shell does
+    not answer in time, it gets killed and restarted on the next command.
+
+    """
+    def __init__(self, config, change_fn):
+
+        super(_HelperBackend, self).__init__(config, change_fn)
+
+        self.__proc = None
+        self.__sid = 0
+        self.__buff = b''
+        self.__out = []
+        self.__pending = [] # response handlers, in order of requests
+        self.__refreshing = False
+        self.__timeout_sid = 0
+
+    def refresh(self, force=False):
+
+        if self.__refreshing:
+            return # answer to a previous refresh is still pending
+
+        self.__refreshing = self.__request(
+            self._config.master_volume_get_cmd, self.__handle_refresh)
+
+    def adjust(self, direction):
+
+        self.__request(self._cmd(direction), self.__handle_adjust)
+
+    def close(self):
+
+        if self.__sid > 0:
+            GObject.source_remove(self.__sid)
+            self.__sid = 0
+
+        if self.__timeout_sid > 0:
+            GObject.source_remove(self.__timeout_sid)
+            self.__timeout_sid = 0
+
+        if self.__proc is not None:
+            try:
+                self.__proc.stdin.close()
+            except IOError:
+                pass
+            # a command may hang, do not wait for the shell to finish it
+            try:
+                self.__proc.kill()
+            except OSError:
+                pass # exited already
+            self.__proc.wait()
+            self.__proc = None
+
+        self.__buff, self.__out, self.__pending = b'', [], []
+        self.__refreshing = False
+
+    def __request(self, cmd, handler):
+        """Send a command to the helper.
+
+        @return: True if the command has been sent, False otherwise
+
+        """
+        if self.__proc is None and not self.__spawn():
+            return False
+
+        line = "{ %s ; } 2>&1 </dev/null; echo %s $?\n" % (cmd, _HELPER_EOR)
+
+        try:
+            self.__proc.stdin.write(line.encode())
+            self.__proc.stdin.flush()
+        except IOError as e:
+            log.warning("master volume helper broken (%s)" % e)
+            self.close()
+            return False
+
+        self.__pending.append(handler)
+
+        if self.__timeout_sid == 0:
+            self.__timeout_sid = GObject.timeout_add_seconds(_HELPER_TIMEOUT,
+                                                             self.__timeout)
+
+        return True
+
+    def __timeout(self):
+
+        log.warning("master volume helper does not respond, restart it")
+        self.__timeout_sid = 0
+        self.close() # next command starts a new helper
+
+        return False
+
+    def __spawn(self):
+
+        try:
+            self.__proc = subprocess.Popen(["sh"], stdin=subprocess.PIPE,
+                                           stdout=subprocess.PIPE)
+        except OSError as e:
+            log.error("failed to start master volume helper (%s)" % e)
+            self.__proc = None
+            return False
+
+        log.debug("started master volume helper (pid %d)" % self.__proc.pid)
+
+        self.__sid = GObject.io_add_watch(self.__proc.stdout,
+            GObject.IO_IN | GObject.IO_ERR | GObject.IO_HUP, self.__io_read)
+
+        return True
+
+    def __io_read(self, fd, cond):
+
+        data = b''
+        if cond & GObject.IO_IN:
+            data = os.read(self.__proc.stdout.fileno(), 4096)
+
+        if not data:
+            log.warning("master volume helper exited")
+            self.__sid = 0
+            self.close()
+            return False
+
+        self.__buff += data
+        lines = self.__buff.split(b'\n')
+        self.__buff = lines.pop()
+
+        for line in lines:
+            line = line.decode(errors="replace")
+            if line.startswith(_HELPER_EOR):
+                ok = line.split()[-1] == str(os.EX_OK)
+                out, self.__out = "\n".join(self.__out), []
+                if self.__timeout_sid > 0: # restart timeout for next one
+                    GObject.source_remove(self.__timeout_sid)
+                    self.__timeout_sid = 0
+                if self.__pending:
+                    self.__pending.pop(0)(ok, out)
+                if self.__pending and self.__proc is not None and \
+                        self.__timeout_sid == 0:
+                    self.__timeout_sid = GObject.timeout_add_seconds(
+                        _HELPER_TIMEOUT, self.__timeout)
+            else:
+                self.__out.append(line)
+
+        return True
+
+    def __handle_refresh(self, ok, out):
+
+        self.__refreshing = False
+
+        if not ok:
+            log.error("master-volume-get failed: '%s'" % out)
+            return
+
+        self._parse(out)
+
+    def __handle_adjust(self, ok, out):
+
+        if not ok:
+            log.error("master-volume-... failed: %s" % out)
+            return
+
+        self.refresh()
+
+class _AlsaBackend(_Backend):
+    """Reads and adjusts an ALSA mixer control natively.
+
+    Requires the Python module 'alsaaudio'. Volume changes get notified by
+    ALSA, so there is no need to refresh periodically.
+
+    """
+    event_driven = True
+
+    def __init__(self, config, change_fn):
+
+        super(_AlsaBackend, self).__init__(config, change_fn)
+
+        self.__control = config.master_volume_alsa_control
+        self.__mixer = alsaaudio.Mixer(control=self.__control)
+
+        self.__sids = []
+        for fd, mask in self.__mixer.polldescriptors():
+            self.__sids.append(GObject.io_add_watch(fd, GObject.IO_IN,
+                                                    self.__io_event))
+
+        GObject.idle_add(self.refresh)
+
+    def refresh(self, force=False):
+
+        try:
+            levels = self.__mixer.getvolume()
+        except alsaaudio.ALSAAudioError as e:
+            log.error("failed to get volume of mixer %s (%s)" %
+                      (self.__control, e))
+            return
+
+        if levels:
+            self._change_fn(max(levels))
+
+    def adjust(self, direction):
+
+        try:
+            if direction == 0:
+                volume = 0
+            else:
+                volume = max(self.__mixer.getvolume() or [0])
+                volume = min(max(volume + direction * _ALSA_STEP, 0), 100)
+            self.__mixer.setvolume(volume)
+        except alsaaudio.ALSAAudioError as e:
+            log.error("failed to set volume of mixer %s (%s)" %
+                      (self.__control, e))
+            return
+
+        self.refresh()
+
+    def close(self):
+
+        for sid in self.__sids:
+            GObject.source_remove(sid)
+        self.__sids = []
+
+        self.__mixer.close()
+
+    def __io_event(self, fd, cond):
+
+        self.__mixer.handleevents()
+        self.refresh()
+
+        return True
+
+# =============================================================================
+# backend factory
+# =============================================================================
+
+def create(config, change_fn):
+    """Create a master volume backend according to the configuration.
+
+    @param config:
+        adapter configuration, option 'master-volume-backend' selects the
+        backend
+    @param change_fn:
+        function to call with the current volume level (in percent)
+
+    @return: a backend object
+
+    """
+    backend = config.master_volume_backend
+
+    if backend == "auto":
+        cmds_default = True
+        for key in ("master-volume-get-cmd", "master-volume-up-cmd",
+                    "master-volume-down-cmd", "master-volume-mute-cmd"):
+            cmds_default &= config.is_default(key)
+        if alsaaudio is not None and cmds_default:
+            backend = "alsa"
+        else:
+            backend = "helper"
+
+    if backend == "alsa":
+        if alsaaudio is None:
+            log.warning("alsaaudio not available, use helper for master "
+                        "volume")
+        else:
+            try:
+                log.info("use ALSA for master volume")
+                return _AlsaBackend(config, change_fn)
+            except alsaaudio.ALSAAudioError as e:
+                log.warning("failed to open ALSA mixer (%s), use helper for "
+                            "master volume" % e)
+        backend = "helper"
+
+    if backend == "helper":
+        log.info("use helper shell for master volume")
+        return _HelperBackend(config, change_fn)
+
+    if backend != "command":
+        log.warning("unknown master volume backend '%s'" % backend)
+
+    log.info("use commands for master volume")
+    return _CommandBackend(config, change_fn)
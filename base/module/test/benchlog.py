@@ -0,0 +1,78 @@
+# =============================================================================
+#
+#    Remuco - A remote control system for media players.
+#    Copyright (C) 2006-2010 by the Remuco team, see AUTHORS.
+#
+#    This file is part of Remuco.
+#
+#    Remuco is free software: you can redistribute it and/or modify
+#    it under the terms of the GNU General Public License as published by
+#    the Free Software Foundation, either version 3 of the License, or
+#    (at your option) any later version.
+#
+#    Remuco is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#    GNU General Public License for more details.
+#
+#    You should have received a copy of the GNU General Public License
+#    along with Remuco.  If not, see <http://www.gnu.org/licenses/>.
+#
+# =============================================================================
+
+"""Benchmark the costs of debug logging on the message hot path.
+
+Simulates the debug log calls done per synchronized message (in the adapter
+and in the client connection) at log level INFO, once with eager formatting
+(arguments formatted before calling log.debug()) and once with deferred
+formatting (arguments passed to log.debug()). Prints the resulting message
+throughput.
+
+Usage: python benchlog.py [MESSAGES]
+
+"""
+
+import sys
+import time
+
+from remuco import log
+from remuco.data import PlayerState, Progress
+
+class _Client(object):
+    
+    def __str__(self):
+        return "192.168.0.23:34567"
+
+def _eager(state, progress, client):
+    
+    log.debug("broadcast new state to clients: %s" % state)
+    log.debug("broadcast new progress to clients: %s" % progress)
+    log.debug("try to send %d bytes to %s" % (25, client))
+    log.debug("sent %d bytes" % 25)
+
+def _deferred(state, progress, client):
+    
+    log.debug("broadcast new state to clients: %s", state)
+    log.debug("broadcast new progress to clients: %s", progress)
+    log.debug("try to send %d bytes to %s", 25, client)
+    log.debug("sent %d bytes", 25)
+
+def _run(fn, num):
+    
+    state, progress, client = PlayerState(), Progress(), _Client()
+    
+    t_start = time.time()
+    for i in range(num):
+        state.position = i
+        progress.progress = i
+        fn(state, progress, client)
+    return num / (time.time() - t_start)
+
+if __name__ == "__main__":
+    
+    num = len(sys.argv) > 1 and int(sys.argv[1]) or 200000
+    
+    log.set_level(log.INFO)
+    
+    for name, fn in (("eager", _eager), ("deferred", _deferred)):
+        print("%-8s: %9.0f messages/s" % (name, _run(fn, num)))
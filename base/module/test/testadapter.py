@@ -27,8 +27,40 @@ from gi.repository import GConf, GObject
 import sys
 
 import remuco.log
-from remuco import PlayerAdapter
+from remuco import PlayerAdapter, ListReply
+from remuco import message
+from remuco import serial
+from remuco.data import ClientInfo, Request
 
+class _FakeClient(object):
+    
+    def __init__(self):
+        
+        self.info = ClientInfo()
+        self.info.page_size = 10
+        self.msgs = []
+        
+    def send(self, msg):
+        
+        self.msgs.append(msg)
+
+class _Request(Request):
+    
+    def get_data(self):
+        
+        return (self.request_id, self.id, self.path, self.page)
+
+class _PendingAdapter(PlayerAdapter):
+    """Player adapter which never replies to playlist requests."""
+    
+    def __init__(self):
+        
+        PlayerAdapter.__init__(self, "unittest")
+        self.replies = []
+    
+    def request_playlist(self, reply):
+        
+        self.replies.append(reply)
 
 class AdapterTest(unittest.TestCase):
 
@@ -59,6 +91,71 @@ class AdapterTest(unittest.TestCase):
         
         self.__ml.run()
 
+    def test_reply_cancel(self):
+        
+        client = _FakeClient()
+        done = []
+        
+        reply = ListReply(client, 1, message.REQ_PLAYLIST, 0,
+                          done_fn=done.append)
+        reply.cancel()
+        self.assertTrue(reply.cancelled)
+        reply.ids = ["a"]
+        reply.names = ["A"]
+        reply.send() # must not send anything
+        self.assertEqual(done, [reply])
+        
+        reply = ListReply(client, 2, message.REQ_PLAYLIST, 0)
+        reply.ids = ["a"]
+        reply.cancel(send_empty=True) # sends an empty list
+        reply.send() # must not send anything
+        
+        GObject.timeout_add(500, self.__ml.quit)
+        self.__ml.run()
+        
+        self.assertEqual(len(client.msgs), 1)
+
+    def test_reply_cancel_on_disconnect(self):
+        
+        pa = _PendingAdapter()
+        handle = pa._PlayerAdapter__handle_message
+        client = _FakeClient()
+        
+        request = _Request()
+        request.request_id = 1
+        handle(client, message.REQ_PLAYLIST, serial.pack(request))
+        self.assertEqual(len(pa.replies), 1)
+        self.assertFalse(pa.replies[0].cancelled)
+        
+        handle(client, message.PRIV_DISCONNECT, None)
+        self.assertTrue(pa.replies[0].cancelled)
+        
+        pa.replies[0].send() # must not send anything
+        self.assertEqual(client.msgs, [])
+
+    def test_progress_ext_item_change(self):
+        
+        pa = self.__pa
+        pe = pa._PlayerAdapter__progress_ext
+        
+        pa.update_item("a", {remuco.INFO_TITLE: "A"}, None)
+        pa.update_playback(remuco.PLAYBACK_PLAY)
+        pa.update_progress(120, 300) # mid-song
+        self.assertEqual(120000, pe.progress)
+        
+        # new item must not continue at the previous item's position
+        pa.update_item("b", {remuco.INFO_TITLE: "B"}, None)
+        self.assertEqual(0, pe.progress)
+        self.assertTrue(pe.at(pe.timestamp + 1000) <= 1000)
+        
+        # next progress update anchors the new item, even without a drift
+        timestamp = pe.timestamp
+        pa.update_progress(0, 200)
+        self.assertEqual(0, pe.progress)
+        self.assertEqual(200000, pe.length)
+        self.assertTrue(pe.timestamp >= timestamp)
+        self.assertFalse(pa._PlayerAdapter__progress_ext_stale)
+
     def __stop(self):
         
         self.__pa.stop()
@@ -32,6 +32,13 @@ from testserial import SerializationTest
 from testnet import ServerTest
 from testfiles import FilesTest
 from testadapter import AdapterTest
+from testmetrics import MetricsTest
+from testtrace import TraceTest
+from testconfig import ConfigTest
+from testdbusproxy import DBusProxyTest
+from testmpris import MPRISTest
+from testmpris2 import MPRIS2Test
+from testlog import LogTest
 
 if __name__ == "__main__":
     
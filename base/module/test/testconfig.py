@@ -0,0 +1,132 @@
+# =============================================================================
+#
+#    Remuco - A remote control system for media players.
+#    Copyright (C) 2006-2010 by the Remuco team, see AUTHORS.
+#
+#    This file is part of Remuco.
+#
+#    Remuco is free software: you can redistribute it and/or modify
+#    it under the terms of the GNU General Public License as published by
+#    the Free Software Foundation, either version 3 of the License, or
+#    (at your option) any later version.
+#
+#    Remuco is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#    GNU General Public License for more details.
+#
+#    You should have received a copy of the GNU General Public License
+#    along with Remuco.  If not, see <http://www.gnu.org/licenses/>.
+#
+# =============================================================================
+
+import configparser
+import os
+import shutil
+import tempfile
+import unittest
+
+from remuco import config as rconfig
+from remuco.config import Config
+
+
+class ConfigTest(unittest.TestCase):
+
+    def setUp(self):
+        
+        # do not touch the user's real configuration
+        self.__dirs = (rconfig.user_config_dir, rconfig.user_cache_dir)
+        self.__tmp = tempfile.mkdtemp()
+        rconfig.user_config_dir = os.path.join(self.__tmp, "config")
+        rconfig.user_cache_dir = os.path.join(self.__tmp, "cache")
+        self.__log_stdout = "REMUCO_LOG_STDOUT" in os.environ
+        os.environ["REMUCO_LOG_STDOUT"] = "1" # no log file in the temp dir
+        
+        self.__config = Config("unittest")
+        
+    def tearDown(self):
+        
+        rconfig.user_config_dir, rconfig.user_cache_dir = self.__dirs
+        if not self.__log_stdout:
+            del os.environ["REMUCO_LOG_STDOUT"]
+        shutil.rmtree(self.__tmp)
+        
+    def test_reload(self):
+        
+        config = self.__config
+        
+        port = config.wifi_port
+        self.assertEqual(port, config.snapshot.wifi_port)
+        self.assertEqual(port, getattr(config, "wifi-port"))
+        
+        changes = []
+        config.subscribe(changes.append)
+        
+        config.reload() # nothing changed
+        self.assertEqual([], changes)
+        
+        cp = configparser.RawConfigParser()
+        cp.read(config.file)
+        cp.set(config.player, "wifi-port", str(port + 1))
+        cp.set(config.player, "x-foo", "bar")
+        with open(config.file, 'w') as fp:
+            cp.write(fp)
+        
+        snapshot = config.snapshot
+        config.reload()
+        
+        self.assertEqual([set(("wifi-port", "x-foo"))], changes)
+        self.assertEqual(port + 1, config.wifi_port)
+        self.assertEqual("bar", config.getx("foo", "baz"))
+        self.assertEqual(port, snapshot.wifi_port) # snapshots are immutable
+        
+        cp.remove_section(config.player)
+        with open(config.file, 'w') as fp:
+            cp.write(fp)
+        config.reload()
+        
+        config.unsubscribe(changes.append)
+        
+    def test_save(self):
+        
+        config = self.__config
+        config.flush()
+        
+        with open(config.file) as fp:
+            content = fp.read()
+        
+        # with a main loop, saving is deferred
+        loop_running = rconfig._loop_running
+        rconfig._loop_running = lambda: True
+        try:
+            config.getx("foo1", "1")
+            config.getx("foo2", "2")
+        finally:
+            rconfig._loop_running = loop_running
+        
+        with open(config.file) as fp:
+            self.assertEqual(content, fp.read()) # not yet saved
+        self.assertTrue(config in rconfig._unsaved)
+        
+        rconfig._flush_all() # as on exit
+        
+        self.assertFalse(config in rconfig._unsaved)
+        with open(config.file) as fp:
+            content = fp.read()
+        self.assertTrue("x-foo1 = 1" in content)
+        self.assertTrue("x-foo2 = 2" in content)
+        
+        # without a main loop, changes are saved immediately
+        rconfig._loop_running = lambda: False
+        try:
+            config.getx("foo3", "3")
+        finally:
+            rconfig._loop_running = loop_running
+        
+        with open(config.file) as fp:
+            self.assertTrue("x-foo3 = 3" in fp.read())
+        self.assertFalse(config in rconfig._unsaved)
+        
+if __name__ == "__main__":
+    
+    unittest.main()
@@ -0,0 +1,205 @@
+# =============================================================================
+#
+#    Remuco - A remote control system for media players.
+#    Copyright (C) 2006-2010 by the Remuco team, see AUTHORS.
+#
+#    This file is part of Remuco.
+#
+#    Remuco is free software: you can redistribute it and/or modify
+#    it under the terms of the GNU General Public License as published by
+#    the Free Software Foundation, either version 3 of the License, or
+#    (at your option) any later version.
+#
+#    Remuco is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#    GNU General Public License for more details.
+#
+#    You should have received a copy of the GNU General Public License
+#    along with Remuco.  If not, see <http://www.gnu.org/licenses/>.
+#
+# =============================================================================
+
+
+import unittest
+
+from remuco import dbusproxy
+from remuco.dbusproxy import DBusProxy
+
+class _Error(Exception):
+    
+    def __init__(self, name):
+        
+        Exception.__init__(self, name)
+        self.name = name
+        
+    def get_dbus_name(self):
+        
+        return self.name
+
+class _Match(object):
+    
+    def __init__(self, matches):
+        
+        self.matches = matches
+        
+    def remove(self):
+        
+        self.matches.remove(self)
+
+class _Bus(object):
+    """Fake bus which keeps all method calls pending until answered."""
+    
+    def __init__(self):
+        
+        self.calls = [] # (method, args, reply handler, error handler)
+        self.timeouts = []
+        self.matches = []
+        self.owner_handler = None
+        
+    def get_object(self, bus_name, path, **kwargs):
+        
+        self.object_kwargs = kwargs
+        return self
+    
+    def get_dbus_method(self, method, iface):
+        
+        def call(*args, **kwargs):
+            self.calls.append((method, args, kwargs["reply_handler"],
+                               kwargs["error_handler"]))
+            self.timeouts.append(kwargs["timeout"])
+        
+        return call
+    
+    def add_signal_receiver(self, handler, signal, *args, **kwargs):
+        
+        if signal == "NameOwnerChanged":
+            self.owner_handler = handler
+        match = _Match(self.matches)
+        self.matches.append(match)
+        return match
+    
+    def reply(self, *result):
+        
+        self.calls.pop(0)[2](*result)
+        
+    def error(self, name):
+        
+        self.calls.pop(0)[3](_Error(name))
+
+class DBusProxyTest(unittest.TestCase):
+
+    def setUp(self):
+        
+        self.__bus = _Bus()
+        self.__proxy = DBusProxy("org.mpris.unittest", "/Player",
+                                 "org.freedesktop.MediaPlayer", timeout=2,
+                                 bus=self.__bus)
+        self.__results = []
+        self.__errors = []
+        
+    def __reply(self, *result):
+        
+        self.__results.append(result)
+        
+    def __error(self, error):
+        
+        self.__errors.append(error.get_dbus_name())
+        
+    def test_call(self):
+        
+        bus, proxy = self.__bus, self.__proxy
+        
+        # no blocking owner lookup or introspection
+        self.assertEqual({"introspect": False,
+                          "follow_name_owner_changes": True},
+                         bus.object_kwargs)
+        
+        proxy.VolumeGet(reply_handler=self.__reply)
+        proxy.VolumeSet(50, timeout=10)
+        self.assertEqual(["VolumeGet", "VolumeSet"], [c[0] for c in bus.calls])
+        self.assertEqual((50,), bus.calls[1][1])
+        self.assertEqual([2, 10], bus.timeouts)
+        
+        bus.reply(70)
+        bus.reply()
+        self.assertEqual([(70,)], self.__results)
+        self.assertTrue("MediaPlayer.VolumeGet" in dbusproxy.report())
+        
+    def test_batch(self):
+        
+        bus, proxy = self.__bus, self.__proxy
+        
+        proxy.batch([("IsPlaying", ()), ("GetPosition", ())], self.__reply)
+        self.assertEqual(2, len(bus.calls)) # both pending at once
+        bus.reply(True)
+        self.assertEqual([], self.__results)
+        bus.reply(1000)
+        self.assertEqual([([True, 1000],)], self.__results)
+        
+        # first error fails the whole batch
+        proxy.batch([("IsPlaying", ()), ("GetPosition", ())], self.__reply,
+                    error_handler=self.__error)
+        bus.error("org.freedesktop.DBus.Error.NoReply")
+        bus.error("org.freedesktop.DBus.Error.NoReply")
+        self.assertEqual(1, len(self.__results))
+        self.assertEqual(["org.freedesktop.DBus.Error.NoReply"], self.__errors)
+        
+    def test_retry(self):
+        
+        bus, proxy = self.__bus, self.__proxy
+        unknown = "org.freedesktop.DBus.Error.ServiceUnknown"
+        
+        # vanished owner: retry once the name has a new owner
+        proxy.GetStatus(reply_handler=self.__reply, error_handler=self.__error)
+        bus.error(unknown)
+        self.assertEqual([], bus.calls)
+        bus.owner_handler("org.mpris.unittest", ":1.1", "")
+        self.assertEqual([], bus.calls)
+        bus.owner_handler("org.mpris.unittest", "", ":1.2")
+        self.assertEqual(1, len(bus.calls))
+        
+        # only once
+        bus.error(unknown)
+        self.assertEqual([unknown], self.__errors)
+        
+        # owner changed while the call was pending: retry immediately
+        proxy.GetStatus(reply_handler=self.__reply, error_handler=self.__error)
+        bus.owner_handler("org.mpris.unittest", ":1.2", ":1.3")
+        bus.error(unknown)
+        bus.reply(0)
+        self.assertEqual([(0,)], self.__results)
+        
+        # player exited while the call was pending: no immediate retry
+        # against a name without owner, wait for a new owner instead
+        proxy.GetStatus(reply_handler=self.__reply, error_handler=self.__error)
+        bus.owner_handler("org.mpris.unittest", ":1.3", "")
+        bus.error(unknown)
+        self.assertEqual([], bus.calls)
+        bus.owner_handler("org.mpris.unittest", "", ":1.4")
+        self.assertEqual(1, len(bus.calls))
+        bus.reply(1)
+        self.assertEqual([(0,), (1,)], self.__results)
+        self.assertEqual([unknown], self.__errors)
+        
+        # other errors are not retried
+        proxy.GetStatus(reply_handler=self.__reply, error_handler=self.__error)
+        bus.error("org.freedesktop.DBus.Error.UnknownMethod")
+        self.assertEqual([], bus.calls)
+        self.assertEqual(2, len(self.__errors))
+        
+    def test_close(self):
+        
+        bus, proxy = self.__bus, self.__proxy
+        
+        proxy.GetStatus(reply_handler=self.__reply)
+        proxy.close()
+        self.assertEqual([], bus.matches)
+        bus.reply(0)
+        self.assertEqual([], self.__results)
+        
+        proxy.GetStatus(reply_handler=self.__reply)
+        self.assertEqual([], bus.calls)
+
+if __name__ == "__main__":
+    unittest.main()
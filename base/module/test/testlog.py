@@ -0,0 +1,118 @@
+# =============================================================================
+#
+#    Remuco - A remote control system for media players.
+#    Copyright (C) 2006-2010 by the Remuco team, see AUTHORS.
+#
+#    This file is part of Remuco.
+#
+#    Remuco is free software: you can redistribute it and/or modify
+#    it under the terms of the GNU General Public License as published by
+#    the Free Software Foundation, either version 3 of the License, or
+#    (at your option) any later version.
+#
+#    Remuco is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#    GNU General Public License for more details.
+#
+#    You should have received a copy of the GNU General Public License
+#    along with Remuco.  If not, see <http://www.gnu.org/licenses/>.
+#
+# =============================================================================
+
+import os.path
+import shutil
+import tempfile
+import threading
+import unittest
+
+from remuco import log
+
+
+class LogTest(unittest.TestCase):
+
+    def setUp(self):
+        
+        self.__dir = tempfile.mkdtemp()
+        self.__file = os.path.join(self.__dir, "unittest.log")
+        self.__level = log._config.logga.level
+        self.__sizes = (log._config.QUEUE_SIZE, log._config.FILE_MAX_SIZE)
+        log.set_level(log.INFO)
+        
+    def tearDown(self):
+        
+        log.set_file(None)
+        log._config.QUEUE_SIZE, log._config.FILE_MAX_SIZE = self.__sizes
+        log.set_level(self.__level)
+        shutil.rmtree(self.__dir)
+        
+    def __read(self, suffix=""):
+        
+        with open(self.__file + suffix) as fp:
+            return fp.read()
+        
+    def test_rollover_on_start(self):
+        
+        with open(self.__file, "w") as fp:
+            fp.write("previous run\n")
+        
+        log.set_file(self.__file)
+        log.info("this run")
+        log.set_file(None) # writes pending records
+        
+        self.assertEqual("previous run\n", self.__read(".1"))
+        self.assertTrue("this run" in self.__read())
+        self.assertFalse("previous run" in self.__read())
+        
+    def test_rotate(self):
+        
+        log._config.FILE_MAX_SIZE = 1000
+        
+        log.set_file(self.__file)
+        for i in range(100):
+            log.info("message %d", i)
+        log.set_file(None)
+        
+        self.assertTrue(os.path.getsize(self.__file) <= 1000)
+        self.assertTrue(os.path.exists(self.__file + ".2"))
+        self.assertFalse(os.path.exists(self.__file + ".3"))
+        self.assertTrue("message 99" in self.__read())
+        
+    def test_queue(self):
+        
+        log._config.QUEUE_SIZE = 3
+        
+        log.set_file(self.__file)
+        
+        # block the writer thread on the first record
+        handler = log._config.listener.handlers[0]
+        emit = handler.emit
+        entered, release = threading.Event(), threading.Event()
+        def blocking_emit(record):
+            entered.set()
+            release.wait(5)
+            emit(record)
+        handler.emit = blocking_emit
+        
+        log.info("first")
+        self.assertTrue(entered.wait(5))
+        
+        # logging does not block while the writer is blocked, records which
+        # do not fit into the queue get dropped and counted
+        for i in range(10):
+            log.info("queued %d", i)
+        self.assertEqual(7, log._config.handler.dropped)
+        
+        release.set()
+        log._config.handler.queue.join() # wait until the queue is empty
+        log.info("last") # queued with a notice about dropped records
+        log.set_file(None)
+        
+        content = self.__read()
+        self.assertTrue("queued 2" in content)
+        self.assertFalse("queued 3" in content)
+        self.assertTrue("dropped 7 log messages" in content)
+        
+if __name__ == "__main__":
+    
+    unittest.main()
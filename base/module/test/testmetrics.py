@@ -0,0 +1,69 @@
+# =============================================================================
+#
+#    Remuco - A remote control system for media players.
+#    Copyright (C) 2006-2010 by the Remuco team, see AUTHORS.
+#
+#    This file is part of Remuco.
+#
+#    Remuco is free software: you can redistribute it and/or modify
+#    it under the terms of the GNU General Public License as published by
+#    the Free Software Foundation, either version 3 of the License, or
+#    (at your option) any later version.
+#
+#    Remuco is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#    GNU General Public License for more details.
+#
+#    You should have received a copy of the GNU General Public License
+#    along with Remuco.  If not, see <http://www.gnu.org/licenses/>.
+#
+# =============================================================================
+
+import unittest
+
+from remuco import metrics
+
+
+class MetricsTest(unittest.TestCase):
+
+    def tearDown(self):
+        
+        metrics._values.clear()
+        metrics._gauges.clear()
+
+    def test_render(self):
+        
+        metrics.gauge(metrics.CLIENTS, lambda: 2)
+        metrics.inc(metrics.MSGS_OUT, "SYNC_STATE")
+        metrics.inc(metrics.MSGS_OUT, "SYNC_STATE")
+        metrics.inc(metrics.BYTES_OUT, "SYNC_STATE", 42)
+        metrics.observe(metrics.POLL_DURATION, None, 0.5)
+        metrics.observe(metrics.POLL_DURATION, None, 0.25)
+        metrics.lag(0.125)
+        
+        lines = metrics.render().splitlines()
+        
+        self.assertTrue("# TYPE remuco_clients gauge" in lines)
+        self.assertTrue("remuco_clients 2" in lines)
+        self.assertTrue('remuco_messages_sent_total{msg="SYNC_STATE"} 2'
+                        in lines)
+        self.assertTrue('remuco_bytes_sent_total{msg="SYNC_STATE"} 42'
+                        in lines)
+        self.assertTrue("remuco_poll_duration_seconds_count 2" in lines)
+        self.assertTrue("remuco_poll_duration_seconds_sum 0.75" in lines)
+        self.assertTrue("remuco_mainloop_lag_seconds 0.125" in lines)
+        
+        # lag gets reset on each scrape
+        lines = metrics.render().splitlines()
+        self.assertTrue("remuco_mainloop_lag_seconds 0.0" in lines)
+        
+        # no lag sample without a lag monitor
+        metrics._lag_max = None
+        lines = metrics.render().splitlines()
+        self.assertFalse([l for l in lines
+                          if l.startswith("remuco_mainloop_lag_seconds")])
+
+if __name__ == "__main__":
+    
+    unittest.main()
@@ -0,0 +1,136 @@
+# =============================================================================
+#
+#    Remuco - A remote control system for media players.
+#    Copyright (C) 2006-2010 by the Remuco team, see AUTHORS.
+#
+#    This file is part of Remuco.
+#
+#    Remuco is free software: you can redistribute it and/or modify
+#    it under the terms of the GNU General Public License as published by
+#    the Free Software Foundation, either version 3 of the License, or
+#    (at your option) any later version.
+#
+#    Remuco is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#    GNU General Public License for more details.
+#
+#    You should have received a copy of the GNU General Public License
+#    along with Remuco.  If not, see <http://www.gnu.org/licenses/>.
+#
+# =============================================================================
+
+
+
+import sys
+import unittest
+
+import remuco.log
+from remuco import MPRISAdapter
+from remuco.adapter import ListReply
+from remuco.mpris import TRACKLIST_PIPELINE
+
+class _TrackList(object):
+    """Fake MPRIS tracklist object, answers asynchronous calls on flush()."""
+    
+    def __init__(self, length):
+        
+        self.length = length
+        self.pending = []
+        self.max_pending = 0
+        self.calls = 0
+        
+    def __call(self, handler, value):
+        
+        self.calls += 1
+        self.pending.append((handler, value))
+        self.max_pending = max(self.max_pending, len(self.pending))
+        
+    def GetLength(self, reply_handler=None, error_handler=None):
+        
+        self.__call(reply_handler, self.length)
+        
+    def GetMetadata(self, i, reply_handler=None, error_handler=None):
+        
+        self.__call(reply_handler, {"location": "file:///%d.ogg" % i,
+                                    "title": "T%d" % i, "artist": "A"})
+        
+    def GetCurrentTrack(self, reply_handler=None, error_handler=None):
+        
+        pass # not of interest here
+        
+    def flush(self):
+        
+        while self.pending:
+            pending, self.pending = self.pending, []
+            for handler, value in pending:
+                handler(value)
+
+class _Reply(ListReply):
+    """List reply which remembers what it would send."""
+    
+    def __init__(self):
+        
+        ListReply.__init__(self, None, 0, 0, 0)
+        self.sent = None
+        
+    def send(self):
+        
+        if not self.cancelled:
+            self.sent = list(self.ids)
+
+class MPRISTest(unittest.TestCase):
+
+    def setUp(self):
+        
+        logarg = "--remuco-log-stdout"
+        if not logarg in sys.argv:
+            sys.argv.append(logarg)
+
+        self.__pa = MPRISAdapter("unittest")
+        self.__pa.config.log_level = remuco.log.WARNING
+        self.__pa._MPRISAdapter__can_tracklist = True
+        self.__tl = self.__pa._mp_t = _TrackList(100)
+
+    def test_tracklist(self):
+        
+        pa, tl = self.__pa, self.__tl
+        
+        reply = _Reply()
+        pa.request_playlist(reply)
+        tl.flush()
+        self.assertEqual(100, len(reply.sent))
+        self.assertEqual("file:///42.ogg", reply.sent[42])
+        self.assertEqual(TRACKLIST_PIPELINE, tl.max_pending)
+        
+        # cached until the tracklist changes
+        calls = tl.calls
+        reply = _Reply()
+        pa.request_playlist(reply)
+        self.assertEqual(100, len(reply.sent))
+        self.assertEqual(calls, tl.calls)
+        
+        tl.length = 10
+        pa._notify_tracklist_change(10)
+        reply = _Reply()
+        pa.request_playlist(reply)
+        tl.flush()
+        self.assertEqual(10, len(reply.sent))
+
+    def test_tracklist_cancelled(self):
+        
+        pa, tl = self.__pa, self.__tl
+        
+        reply = _Reply()
+        pa.request_playlist(reply)
+        handler, length = tl.pending.pop(0)
+        handler(length) # starts requesting tracks
+        reply.cancel()
+        tl.flush()
+        
+        # no more calls after the reply has been cancelled
+        self.assertEqual(1 + TRACKLIST_PIPELINE, tl.calls)
+        self.assertEqual(None, reply.sent)
+
+if __name__ == "__main__":
+    unittest.main()
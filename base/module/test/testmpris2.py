@@ -0,0 +1,94 @@
+# =============================================================================
+#
+#    Remuco - A remote control system for media players.
+#    Copyright (C) 2006-2010 by the Remuco team, see AUTHORS.
+#
+#    This file is part of Remuco.
+#
+#    Remuco is free software: you can redistribute it and/or modify
+#    it under the terms of the GNU General Public License as published by
+#    the Free Software Foundation, either version 3 of the License, or
+#    (at your option) any later version.
+#
+#    Remuco is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#    GNU General Public License for more details.
+#
+#    You should have received a copy of the GNU General Public License
+#    along with Remuco.  If not, see <http://www.gnu.org/licenses/>.
+#
+# =============================================================================
+
+
+import sys
+import time
+import unittest
+
+import remuco.log
+from remuco import MPRIS2Adapter, PLAYBACK_PAUSE, PLAYBACK_PLAY
+from remuco.mpris2 import IFACE_PLAYER
+
+class _Adapter(MPRIS2Adapter):
+    """MPRIS 2 adapter without a player, remembers progress updates."""
+    
+    def __init__(self):
+        
+        MPRIS2Adapter.__init__(self, "unittest")
+        self.progress = []
+        
+    def update_progress(self, progress, length):
+        
+        self.progress.append((progress, length))
+        MPRIS2Adapter.update_progress(self, progress, length)
+
+class MPRIS2Test(unittest.TestCase):
+
+    def setUp(self):
+        
+        logarg = "--remuco-log-stdout"
+        if not logarg in sys.argv:
+            sys.argv.append(logarg)
+
+        self.__pa = _Adapter()
+        self.__pa.config.log_level = remuco.log.WARNING
+
+    def test_progress(self):
+        
+        pa = self.__pa
+        
+        pa._notify_properties(IFACE_PLAYER, {
+            "PlaybackStatus": "Playing",
+            "Rate": 2.0,
+            "Position": 10 * 1000000,
+            "Volume": 0.5,
+            "Metadata": {"xesam:url": "file:///a.ogg",
+                         "mpris:artUrl": "file:///a.png",
+                         "xesam:title": "A",
+                         "xesam:artist": ["X", "Y"],
+                         "mpris:length": 300 * 1000000},
+        }, [])
+        
+        progress, length = pa.progress[-1]
+        self.assertEqual(300, length)
+        self.assertTrue(10 <= progress < 10.5)
+        
+        # progress gets extrapolated according to the rate
+        time.sleep(0.2)
+        pa.poll()
+        progress, length = pa.progress[-1]
+        self.assertTrue(10.35 <= progress < 11)
+        
+        # pausing freezes the progress
+        pa._notify_properties(IFACE_PLAYER, {"PlaybackStatus": "Paused"}, [])
+        frozen = pa.progress[-1][0]
+        time.sleep(0.1)
+        pa.poll()
+        self.assertEqual(frozen, pa.progress[-1][0])
+        
+        # seeking sets a new base
+        pa._notify_seeked(100 * 1000000)
+        self.assertEqual(100, pa.progress[-1][0])
+
+if __name__ == "__main__":
+    unittest.main()
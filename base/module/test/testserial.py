@@ -211,6 +211,35 @@ class SerializationTest(unittest.TestCase):
         #self.__serialize(il)
         serial.pack(il)
         
+    def test_serialize_progress_ext(self):
+        
+        pe = data.ProgressExt()
+        pe.progress, pe.length, pe.rate, pe.timestamp = 1000, 5000, 1000, 100
+        
+        self.assertFalse(serial.pack(pe) is None)
+        
+        self.assertEquals(pe.at(600), 1500)
+        self.assertEquals(pe.at(9000), 5000) # limited by length
+        pe.rate = 0
+        self.assertEquals(pe.at(600), 1000)
+        
+    def test_serialize_state_delta(self):
+        
+        ps = data.PlayerState()
+        old = ps.get_data()
+        ps.volume = 55
+        
+        delta = data.PlayerStateDelta(ps, old)
+        self.assertEquals(delta.mask, 1 << 1)
+        self.assertEquals(delta.get_data(), (1 << 1, 55))
+        
+        bindata_delta = serial.pack(delta)
+        bindata_full = serial.pack(ps)
+        self.assertTrue(len(bindata_delta) < len(bindata_full))
+        
+        delta = data.PlayerStateDelta(ps, ps.get_data())
+        self.assertEquals(delta.mask, 0)
+        
     def test_serialize_deserialize(self):
         
         sc1 = _SerialzableClass()
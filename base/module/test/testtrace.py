@@ -0,0 +1,54 @@
+# =============================================================================
+#
+#    Remuco - A remote control system for media players.
+#    Copyright (C) 2006-2010 by the Remuco team, see AUTHORS.
+#
+#    This file is part of Remuco.
+#
+#    Remuco is free software: you can redistribute it and/or modify
+#    it under the terms of the GNU General Public License as published by
+#    the Free Software Foundation, either version 3 of the License, or
+#    (at your option) any later version.
+#
+#    Remuco is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#    GNU General Public License for more details.
+#
+#    You should have received a copy of the GNU General Public License
+#    along with Remuco.  If not, see <http://www.gnu.org/licenses/>.
+#
+# =============================================================================
+
+import unittest
+
+from remuco import log
+from remuco.net import _Trace
+
+
+class TraceTest(unittest.TestCase):
+
+    def test_trace(self):
+        
+        trace = _Trace(3, 4)
+        
+        for i in range(5):
+            trace.add(_Trace.OUT, 200 + i, 10, ("10.0.0.1", 1234),
+                      b'\x00\x01\x00\x00\x00\x04abcdef', offset=6)
+        
+        lines = []
+        log_info = log.info
+        log.info = lambda msg: lines.extend(msg.splitlines()[1:])
+        try:
+            trace.dump()
+        finally:
+            log.info = log_info
+        
+        self.assertEqual(3, len(lines))
+        self.assertTrue("SYNC_ITEM" in lines[0]) # 202, oldest one kept
+        self.assertTrue("SYNC_STATE_DELTA" in lines[2]) # 204
+        self.assertTrue("b'abcd'" in lines[2])
+
+if __name__ == "__main__":
+    
+    unittest.main()